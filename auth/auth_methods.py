@@ -116,3 +116,22 @@ def get_team_id(token: str) -> int:
 
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError) as ex:
         raise InvalidTokenException from ex
+
+
+def is_team_member_or_admin(team_id: int, token: str):
+    """
+    Helper method for authenticate if the user accesses the data of its own team.
+    :param team_id: ID of the team that will be accessed.
+    :param token: JWT-Token of the user that access.
+    :return: None
+    """
+    try:
+        is_admin(token)
+        return
+    except InvalidRoleException:
+        pass
+    except InvalidTokenException as ex:
+        raise ex
+
+    if get_team_id(token) != team_id:
+        raise InvalidUserException
@@ -13,3 +13,13 @@ class Token(SQLModel):
 
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+    expires_in: int | None = None
+
+
+class RefreshRequest(SQLModel):
+    """
+    Class, how a refresh token will be sent.
+    """
+
+    refresh_token: str
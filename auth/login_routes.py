@@ -3,6 +3,9 @@ Created by Fabian Gnatzig
 Description: Route and methods for auth.
 """
 
+import hashlib
+import os
+import secrets
 from datetime import timedelta, datetime, timezone
 from typing import Annotated
 
@@ -10,15 +13,27 @@ import jwt
 
 from fastapi import Depends, HTTPException, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session
+from sqlmodel import Session, select, update
 
-from dependencies import get_session, SECRET_KEY, ALGORITHM, pwd_context
-from auth.login_classes import Token
-from routes.user.user_routes import get_user_name
+from dependencies import (
+    get_session,
+    SECRET_KEY,
+    ALGORITHM,
+    ACCESS_TOKEN_EXPIRES,
+    REFRESH_TOKEN_EXPIRES,
+    pwd_context,
+)
+from auth.login_classes import Token, RefreshRequest
+from auth.rate_limit import RateLimit
+from exceptions import InvalidTokenException
+from models.token_models import RefreshToken
+from models.user_models import User
 
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+LOGIN_LIMIT = RateLimit("login", os.getenv("RATE_LIMIT_LOGIN", "10/minute"))
+
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """
@@ -37,31 +52,99 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return encoded_jwt
 
 
+def get_credentials(session: Session, username: str):
+    """
+    Reads only the columns needed for the login of a user. Uses the unique
+    index on the username.
+    :param session: The db session.
+    :param username: Username of the user.
+    :return: Row with id, password hash, role and team id or None.
+    """
+    statement = select(User.id, User.password, User.role, User.team_id).where(
+        User.username == username
+    )
+    return session.exec(statement).first()
+
+
 def authenticate_user(session: Session, username: str, password: str) -> dict:
     """
     Authentication of the user and its password.
     :param session: The db session.
     :param username: Username of user that is logging in.
     :param password: Password of user that is logging in.
-    :return: User if username and password is valid.
+    :return: ID, username, role and team id if username and password is valid.
     """
-    exception = HTTPException(
+    credentials = get_credentials(session, username)
+    if credentials and pwd_context.verify(password, credentials.password):
+        return {
+            "id": credentials.id,
+            "username": username,
+            "role": credentials.role,
+            "team_id": credentials.team_id,
+        }
+
+    raise HTTPException(
         status_code=401,
         detail="Incorrect username or password",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        user = get_user_name(username, session)
-        if pwd_context.verify(password, user["password"]):
-            return user
 
-    except HTTPException as ex:
-        raise exception from ex
 
-    raise exception
+def hash_refresh_token(refresh_token: str) -> str:
+    """
+    Hashes a refresh token for storing and looking it up.
+    :param refresh_token: Refresh token.
+    :return: SHA-256 hex digest of the token.
+    """
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+def create_tokens(session: Session, claims: dict) -> Token:
+    """
+    Creates a short-lived access token and a refresh token and commits the
+    refresh token.
+    :param session: The db session.
+    :param claims: Claims of the access token.
+    :return: Access and refresh token.
+    """
+    access_token = create_access_token(claims, expires_delta=ACCESS_TOKEN_EXPIRES)
+
+    refresh_token = secrets.token_urlsafe(32)
+    expires_at = datetime.now(timezone.utc) + REFRESH_TOKEN_EXPIRES
+    session.add(
+        RefreshToken(
+            token_hash=hash_refresh_token(refresh_token),
+            user_id=claims["user_id"],
+            expires_at=expires_at,
+        )
+    )
+    session.commit()
+
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=refresh_token,
+        expires_in=int(ACCESS_TOKEN_EXPIRES.total_seconds()),
+    )
+
+
+def revoke_user_tokens(session: Session, user_id: int):
+    """
+    Revokes all refresh tokens of a user.
+    :param session: The db session.
+    :param user_id: ID of the user.
+    :return: None
+    """
+    statement = (
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked == False)  # noqa: E712
+        .values(revoked=True)
+    )
+    session.exec(statement)
+    session.commit()
 
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(LOGIN_LIMIT)])
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     session: Session = Depends(get_session),
@@ -74,14 +157,70 @@ async def login_for_access_token(
     """
     user = authenticate_user(session, form_data.username, form_data.password)
 
-    access_token_expires = timedelta(hours=24)
-    access_token = create_access_token(
-        data={
-            "username": user["username"],
-            "user_id": user["id"],
-            "team_ids": user["team"]["id"],
-            "role": user["role"],
-        },
-        expires_delta=access_token_expires,
+    claims = {
+        "username": user["username"],
+        "user_id": user["id"],
+        "team_ids": user["team_id"],
+        "role": user["role"],
+    }
+    return create_tokens(session, claims)
+
+
+@router.post("/refresh")
+def refresh_access_token(
+    request: RefreshRequest, session: Session = Depends(get_session)
+) -> Token:
+    """
+    Renews the access token without a password check. The refresh token is
+    rotated, a reused refresh token revokes all refresh tokens of the user.
+    :param request: Refresh token of the user.
+    :param session: The db session.
+    :return: New access and refresh token.
+    """
+    token_hash = hash_refresh_token(request.refresh_token)
+    statement = select(RefreshToken).where(RefreshToken.token_hash == token_hash)
+    refresh_token = session.exec(statement).first()
+
+    now = datetime.now(timezone.utc)
+    if not refresh_token or refresh_token.expires_at < now:
+        raise InvalidTokenException
+
+    statement = (
+        update(RefreshToken)
+        .where(RefreshToken.id == refresh_token.id, RefreshToken.revoked == False)  # noqa: E712
+        .values(revoked=True)
+    )
+    if session.exec(statement).rowcount != 1:
+        revoke_user_tokens(session, refresh_token.user_id)
+        raise InvalidTokenException
+
+    # Refresh tokens are deleted together with their user.
+    user = session.get(User, refresh_token.user_id)
+    claims = {
+        "username": user.username,
+        "user_id": user.id,
+        "team_ids": user.team_id,
+        "role": user.role,
+    }
+    return create_tokens(session, claims)
+
+
+@router.post("/revoke")
+def revoke_refresh_token(
+    request: RefreshRequest, session: Session = Depends(get_session)
+) -> dict:
+    """
+    Revokes a refresh token, e.g. on logout.
+    :param request: Refresh token of the user.
+    :param session: The db session.
+    :return: "ok": True if succeeded.
+    """
+    token_hash = hash_refresh_token(request.refresh_token)
+    statement = (
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == token_hash)
+        .values(revoked=True)
     )
-    return Token(access_token=access_token, token_type="bearer")
+    session.exec(statement)
+    session.commit()
+    return {"ok": True}
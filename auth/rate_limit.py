@@ -0,0 +1,198 @@
+"""
+Created by Fabian Gnatzig
+Description: Token bucket rate limits of the expensive routes.
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+
+import jwt
+from fastapi import Request
+
+from dependencies import SECRET_KEY, ALGORITHM
+from exceptions import InvalidException, RateLimitException
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+FORM_TYPES = ("application/x-www-form-urlencoded", "multipart/form-data")
+
+
+class RateLimitBackend(ABC):
+    """
+    Interface of the storage of the token buckets. A backend shared by several
+    workers (e.g. Redis) implements the same method and is set with
+    set_rate_limit_backend.
+    """
+
+    @abstractmethod
+    def take(self, key: str, rate: float, capacity: int) -> float:
+        """
+        Takes a token from a bucket, which is refilled with rate tokens per
+        second up to its capacity. Must be atomic for concurrent requests.
+        :param key: Key of the bucket.
+        :param rate: Refilled tokens per second.
+        :param capacity: Maximum tokens of the bucket.
+        :return: 0 if a token was taken, else seconds until the next token.
+        """
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets of one worker. With several workers every worker allows the
+    full rate, so the limit of a deployment is the limit times the workers.
+    """
+
+    def __init__(self, max_buckets: int = 10000):
+        """
+        :param max_buckets: Number of buckets after which the full ones are removed.
+        """
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+        # Tokens, last refill, rate and capacity of every bucket.
+        self.buckets: dict[str, tuple[float, float, float, int]] = {}
+
+    def take(self, key: str, rate: float, capacity: int) -> float:
+        """
+        Takes a token from a bucket of this worker.
+        :param key: Key of the bucket.
+        :param rate: Refilled tokens per second.
+        :param capacity: Maximum tokens of the bucket.
+        :return: 0 if a token was taken, else seconds until the next token.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if key not in self.buckets and len(self.buckets) >= self.max_buckets:
+                self.remove_full(now)
+
+            tokens, updated, _, _ = self.buckets.get(
+                key, (capacity, now, rate, capacity)
+            )
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now, rate, capacity)
+                return 0.0
+            self.buckets[key] = (tokens, now, rate, capacity)
+            return (1 - tokens) / rate
+
+    def remove_full(self, now: float):
+        """
+        Removes the buckets, which are refilled with their own rate and capacity,
+        because a missing bucket is full.
+        :param now: Current monotonic time.
+        :return: None
+        """
+        self.buckets = {
+            key: (tokens, updated, rate, capacity)
+            for key, (tokens, updated, rate, capacity) in self.buckets.items()
+            if tokens + (now - updated) * rate < capacity
+        }
+
+
+RATE_LIMIT_BACKEND: RateLimitBackend = LocalRateLimitBackend()
+THROTTLED: Counter = Counter()
+
+
+def set_rate_limit_backend(backend: RateLimitBackend):
+    """
+    Replaces the backend of the rate limits.
+    :param backend: New backend.
+    :return: None
+    """
+    global RATE_LIMIT_BACKEND  # pylint: disable=global-statement
+    RATE_LIMIT_BACKEND = backend
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    """
+    Returns the backend of the rate limits.
+    :return: Current backend.
+    """
+    return RATE_LIMIT_BACKEND
+
+
+def parse_rate(limit: str) -> tuple[int, int]:
+    """
+    Parses a limit like "10/minute".
+    :param limit: Number of requests per second, minute or hour.
+    :return: Number of requests and seconds of the period.
+    """
+    try:
+        count, period = limit.split("/")
+        return int(count), PERIODS[period.strip()]
+    except (KeyError, ValueError) as ex:
+        raise InvalidException("rate limit") from ex
+
+
+async def get_user_key(request: Request) -> str | None:
+    """
+    Reads the user of a request, the user ID of a valid bearer token or the
+    username of a login form.
+    :param request: Request of the client.
+    :return: User of the request or None if unknown.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return str(jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])["user_id"])
+        except (jwt.InvalidTokenError, KeyError):
+            return None
+
+    if request.headers.get("Content-Type", "").startswith(FORM_TYPES):
+        username = (await request.form()).get("username")
+        if isinstance(username, str) and username:
+            return username
+    return None
+
+
+class RateLimit:
+    """
+    Dependency of a route, which limits the requests per client and per user
+    with token buckets. Every bucket allows a burst of the limit and is
+    refilled over the period.
+    """
+
+    def __init__(self, name: str, limit: str):
+        """
+        :param name: Name of the route in the keys and metrics.
+        :param limit: Number of requests per period like "10/minute".
+        """
+        self.name = name
+        self.capacity, period = parse_rate(limit)
+        self.rate = self.capacity / period
+
+    async def __call__(self, request: Request):
+        """
+        Takes a token of the client and of the user of the request.
+        :param request: Request of the client.
+        :return: None
+        """
+        # Behind a proxy the server sets the client of X-Forwarded-For, if the proxy
+        # is trusted with FORWARDED_ALLOW_IPS.
+        keys = {"client": request.client.host if request.client else "unknown"}
+        if user := await get_user_key(request):
+            keys["user"] = user
+
+        for kind, value in keys.items():
+            wait = get_rate_limit_backend().take(
+                f"{self.name}:{kind}:{value}", self.rate, self.capacity
+            )
+            if wait:
+                THROTTLED[(self.name, kind)] += 1
+                raise RateLimitException(wait)
+
+
+def get_metrics_text() -> str:
+    """
+    Exports the throttled requests of this worker in the Prometheus text format.
+    :return: Metrics as text.
+    """
+    lines = [
+        "# HELP rate_limit_throttled_total Requests rejected by a rate limit.",
+        "# TYPE rate_limit_throttled_total counter",
+    ]
+    for (name, kind), count in sorted(THROTTLED.items()):
+        lines.append(
+            f'rate_limit_throttled_total{{route="{name}",key="{kind}"}} {count}'
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,96 @@
+"""
+Created by Fabian Gnatzig
+Description: Cold-start benchmark of `main.app` based on `python -X importtime`.
+
+Usage: python benchmarks/startup_time.py [--runs 5] [--top 15] [--max-ms 0]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+IMPORT_STATEMENT = "from main import app"
+
+
+def parse_import_time(stderr: str) -> dict[str, int]:
+    """
+    Parses the output of `-X importtime` into the cumulative time of `main` and of
+    every module that is imported directly while importing `main`.
+    :param stderr: Stderr of the python process.
+    :return: Dictionary with the module name and its cumulative import time in us.
+    """
+    children = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative)
+        elif depth == 0 and name.strip() == "main":
+            children[name.strip()] = int(cumulative)
+            return children
+        elif depth == 0:
+            children = {}
+    return children
+
+
+def measure_cold_start() -> dict[str, int]:
+    """
+    Imports the app in a fresh interpreter and measures the import time.
+    :return: Dictionary with the module name and its cumulative import time in us.
+    """
+    env = os.environ.copy()
+    env.setdefault("DATABASE", "sqlite://")
+    env.setdefault("HASH_KEY", "benchmark")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_STATEMENT],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_import_time(result.stderr)
+
+
+def main() -> int:
+    """
+    Runs the benchmark and prints the median cold-start time and the slowest imports.
+    :return: Exit code, 1 if the median exceeds --max-ms.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    runs = [measure_cold_start() for _ in range(args.runs)]
+    totals = [run["main"] / 1000 for run in runs]
+    median_total = statistics.median(totals)
+
+    print(f"`{IMPORT_STATEMENT}` over {args.runs} cold starts")
+    print(f"median: {median_total:.1f} ms  min: {min(totals):.1f} ms")
+    print(f"\nslowest imports of main (median of {args.runs} runs):")
+
+    names = set().union(*runs) - {"main"}
+    medians = {
+        name: statistics.median(run.get(name, 0) for run in runs) for name in names
+    }
+    slowest = sorted(medians.items(), key=lambda item: item[1], reverse=True)
+    for name, cumulative in slowest[: args.top]:
+        print(f"{cumulative / 1000:>9.1f} ms  {name}")
+
+    if args.max_ms and median_total > args.max_ms:
+        print(f"\nFAIL: median {median_total:.1f} ms exceeds {args.max_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Created by Fabian Gnatzig
+Description: Write throughput of the create routes on SQLite with the default
+journaling and with the performance profile of the app.
+
+Usage: python benchmarks/write_throughput.py [--requests 300] [--runs 3]
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, create_engine
+
+# The app reads the path and the environment on import.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE", "sqlite://")
+os.environ.setdefault("HASH_KEY", "benchmark")
+
+# pylint: disable=wrong-import-position
+import dependencies
+from main import app
+
+
+def set_foreign_keys(dbapi_connection, _connection_record):
+    """
+    Enables only the foreign keys, so the default profile has the same checks.
+    :param dbapi_connection: New DBAPI connection.
+    :param _connection_record: Pool record of the connection.
+    :return: None
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+
+PROFILES = {
+    "default": set_foreign_keys,
+    "performance": dependencies.set_sqlite_pragmas,
+}
+
+ROUTES = {
+    "/brewery/add": lambda i: {"name": f"b{i}", "city": "city", "country": "c"},
+    "/team/add": lambda i: {"name": f"t{i}"},
+    "/season/add": lambda i: {"name": f"s{i}", "team_id": 1},
+    "/event/add": lambda i: {
+        "name": f"e{i}",
+        "season_id": 1,
+        "event_date": "2025-01-01",
+    },
+    "/bringbeer/add": lambda i: {"event_id": 1, "done": False},
+}
+
+
+def measure(profile: str, requests: int, directory: str) -> dict[str, float]:
+    """
+    Sends the create requests of every route to a new db of a profile.
+    :param profile: Name of the profile of the connections.
+    :param requests: Number of requests per route.
+    :param directory: Directory of the db file.
+    :return: Dictionary with the route and its created rows per second.
+    """
+    db_engine = create_engine(f"sqlite:///{directory}/{profile}.db")
+    event.listen(db_engine, "connect", PROFILES[profile])
+    SQLModel.metadata.create_all(db_engine)
+    dependencies.engine = dependencies.replica_engine = db_engine
+
+    client = TestClient(app)
+    for route, body in ROUTES.items():
+        # Parents of the following routes.
+        client.post(route, json=body(0))
+
+    throughput = {}
+    for route, body in ROUTES.items():
+        start = time.perf_counter()
+        for i in range(1, requests + 1):
+            response = client.post(route, json=body(i))
+            response.raise_for_status()
+        throughput[route] = requests / (time.perf_counter() - start)
+    db_engine.dispose()
+    return throughput
+
+
+def main() -> int:
+    """
+    Runs the benchmark and prints the created rows per second of every route.
+    :return: Exit code.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = {profile: [] for profile in PROFILES}
+    for _ in range(args.runs):
+        # Alternates the profiles, so both see the same load of the machine.
+        for profile in PROFILES:
+            with tempfile.TemporaryDirectory() as directory:
+                runs[profile].append(measure(profile, args.requests, directory))
+    results = {
+        profile: {
+            route: statistics.median(run[route] for run in profile_runs)
+            for route in ROUTES
+        }
+        for profile, profile_runs in runs.items()
+    }
+
+    print(
+        f"created rows per second over {args.requests} requests per route "
+        f"(median of {args.runs} runs)"
+    )
+    print(f"{'route':<16}{'default':>10}{'performance':>14}{'speedup':>10}")
+    for route in ROUTES:
+        default, performance = (results[profile][route] for profile in PROFILES)
+        print(
+            f"{route:<16}{default:>10.0f}{performance:>14.0f}"
+            f"{performance / default:>9.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,65 +3,314 @@ Created by Fabian Gnatzig
 Description: Shared methods for project.
 """
 
-import json
+import multiprocessing
 import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
 
 from dotenv import load_dotenv
+from fastapi.requests import HTTPConnection
 from fastapi.security import OAuth2PasswordBearer
-from openai import OpenAI
 from passlib.context import CryptContext
-from sqlmodel import Session, create_engine, SQLModel
+from sqlalchemy import event
+from sqlmodel import Session, create_engine, inspect, text
 
 load_dotenv()
 
 DB = os.getenv("DATABASE")
+DB_REPLICA = os.getenv("DATABASE_REPLICA")
+
+
+# Performance profile of SQLite. WAL lets the reads run during a write and with
+# synchronous=NORMAL a commit only syncs the WAL at checkpoints. A negative
+# cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KIB", str(64 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+
+
+def set_sqlite_performance(dbapi_connection, _connection_record):
+    """
+    Sets the performance profile of every new SQLite connection.
+    :param dbapi_connection: New DBAPI connection.
+    :param _connection_record: Pool record of the connection.
+    :return: None
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def set_sqlite_pragmas(dbapi_connection, _connection_record):
+    """
+    Enables the foreign keys and the performance profile of every new SQLite
+    connection. The foreign keys are off by default, but the ON DELETE actions
+    of the foreign keys depend on them and other databases always enforce them.
+    :param dbapi_connection: New DBAPI connection.
+    :param _connection_record: Pool record of the connection.
+    :return: None
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+        set_sqlite_performance(dbapi_connection, _connection_record)
+
 
 engine = create_engine(DB)
+event.listen(engine, "connect", set_sqlite_pragmas)
+if DB_REPLICA:  # pragma: no cover
+    replica_engine = create_engine(DB_REPLICA)
+    event.listen(replica_engine, "connect", set_sqlite_pragmas)
+else:
+    replica_engine = engine
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ALGORITHM = "HS256"
 SECRET_KEY = os.getenv("HASH_KEY")
+ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_MINUTES", "15")))
+REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv("REFRESH_TOKEN_DAYS", "30")))
+
+READ_METHODS = {"GET", "HEAD"}
+READ_PRIMARY = "read_primary"
+READ_PRIMARY_HEADER = "X-Read-Primary"
+REPLICA_LAG_SECONDS = int(os.getenv("REPLICA_LAG_SECONDS", "5"))
 
-client = OpenAI(api_key=f"{os.getenv('OPEN_API_KEY')}")
+STARTUP_LOCK = "drink_manager_startup"
+STARTUP_LOCK_KEY = 4_242_001
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+BASELINE_REVISION = "0001"
+
+
+def get_alembic_config(connection=None):
+    """
+    Creates the alembic config of the migrations. Alembic is only imported when
+    migrating, so it does not slow down the import of the app.
+    :param connection: DB connection the migrations run on.
+    :return: Alembic config.
+    """
+    # pylint: disable=import-outside-toplevel
+    from alembic.config import Config
 
-OPEN_AI_REQUEST = (
-    "Can you get me following data from this beer label as json:"
-    "name: string, brewery or label (Like Gösser or Edelweiss):string as key brewery,"
-    "alcohol:float, volume:float (normal is 0.5 or 0.33 please round),"
-    "barcode number:string as key beer_code without whitespaces."
-    "Check the data complies with the rules:"
-    "When the label or name of the brewery is inside the name of the beer, "
-    "please remove it from the beer name."
-    "If the words 'beer' or 'bier' is inside the name, keep it inside!"
-    "Use oe instead of ö. Use ae instead of ä. Use ue instead of ü. Use ss instead of ß."
-)
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS)
+    config.attributes["connection"] = connection
+    return config
 
 
 def create_db():
     """
-    Creates the db.
+    Migrates the db to the newest revision. If the db is up to date, only the
+    alembic version is read. A db created before the migrations is stamped
+    with the baseline first. Runs under the startup lock, because several
+    workers start at once.
+    """
+    # pylint: disable=import-outside-toplevel
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    # The revision is read under the lock, so only one worker migrates.
+    with startup_lock(), engine.begin() as connection:
+        config = get_alembic_config(connection)
+        revision = MigrationContext.configure(connection).get_current_revision()
+        if revision == ScriptDirectory.from_config(config).get_current_head():
+            return
+
+        if revision is None and inspect(connection).has_table("user"):
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
+
+    # The migrations turn off the foreign keys of SQLite on their connection.
+    engine.dispose()
+
+
+def has_replica() -> bool:
+    """
+    Checks if the reads are sent to a replica.
+    :return: True if a replica is configured.
     """
-    SQLModel.metadata.create_all(engine)
+    return replica_engine is not engine
 
 
-def get_session():
+def get_engine(connection: HTTPConnection):
     """
-    Returns the session instance.
+    Selects the engine of a request. Only reads go to the replica. A client
+    reads its own writes from the primary while it sends the read primary
+    header or cookie. Websockets stay on the primary, so the snapshot matches
+    the live changes following it.
+    :param connection: Request or websocket of the client.
+    :return: Engine of the replica or the primary.
+    """
+    if (
+        connection.scope["type"] != "http"
+        or connection.scope["method"] not in READ_METHODS
+        or READ_PRIMARY_HEADER in connection.headers
+        or READ_PRIMARY in connection.cookies
+    ):
+        return engine
+    return replica_engine
+
+
+def get_session(connection: HTTPConnection):
+    """
+    Returns the session instance of the engine of the request.
+    :param connection: Request or websocket of the client.
+    :return: The session instance.
+    """
+    with Session(get_engine(connection)) as session:
+        yield session
+
+
+def get_primary_session():
+    """
+    Returns the session instance of the primary for the reads that also write.
     :return: The session instance.
     """
     with Session(engine) as session:
         yield session
 
 
-def get_json_from_open_ai_response(response: str) -> dict:
+async def read_your_writes(request, call_next):
+    """
+    Middleware, which sets the read primary cookie on the response of every
+    write, so the following reads of the client see the write until the
+    replica caught up.
+    :param request: Request of the client.
+    :param call_next: Next handler of the request.
+    :return: Response of the request.
+    """
+    response = await call_next(request)
+    if has_replica() and request.method not in READ_METHODS:
+        response.set_cookie(
+            READ_PRIMARY, "1", max_age=REPLICA_LAG_SECONDS, httponly=True
+        )
+    return response
+
+
+@contextmanager
+def startup_lock(timeout: int = 60):
+    """
+    Serializes the startup of several workers. MySQL and PostgreSQL have named
+    locks, a SQLite file is locked by a lock file next to it. An in-memory
+    SQLite db belongs to one worker, so it needs no lock.
+    :param timeout: Seconds to wait for the lock.
     """
-    Creates a dictionary out of the response message from Open AI.
-    :param response: Response message from Open AI.
-    :return: Dictionary object.
+    dialect = engine.dialect.name
+    if dialect == "mysql":  # pragma: no cover
+        with mysql_lock(timeout):
+            yield
+    elif dialect == "postgresql":  # pragma: no cover
+        with postgresql_lock(timeout):
+            yield
+    elif dialect == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        with file_lock(f"{engine.url.database}.lock", timeout):
+            yield
+    else:
+        yield
+
+
+@contextmanager
+def file_lock(path: str, timeout: int):
+    """
+    Holds an exclusive lock of a file. The lock is released by the OS, if the
+    worker dies.
+    :param path: Path of the lock file.
+    :param timeout: Seconds to wait for the lock.
+    """
+    # pylint: disable=import-outside-toplevel
+    import fcntl
+
+    deadline = time.monotonic() + timeout
+    with open(path, "a", encoding="utf-8") as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError as ex:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Startup lock {path} not acquired") from ex
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def mysql_lock(timeout: int):  # pragma: no cover
     """
-    try:
-        data = response.split("```")[1].lstrip("json")
-        return json.loads(data)
-    except Exception:
-        return {"details": "No data found!"}
+    Holds the named startup lock of MySQL.
+    :param timeout: Seconds to wait for the lock.
+    """
+    with engine.connect() as connection:
+        acquired = connection.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {"name": STARTUP_LOCK, "timeout": timeout},
+        ).scalar()
+        # GET_LOCK returns 0 on a timeout and NULL on an error.
+        if acquired != 1:
+            raise TimeoutError(f"Startup lock {STARTUP_LOCK} not acquired")
+        try:
+            yield
+        finally:
+            connection.execute(
+                text("SELECT RELEASE_LOCK(:name)"), {"name": STARTUP_LOCK}
+            )
+
+
+@contextmanager
+def postgresql_lock(timeout: int):  # pragma: no cover
+    """
+    Holds the advisory startup lock of PostgreSQL. A timeout raises an
+    OperationalError of the lock_timeout.
+    :param timeout: Seconds to wait for the lock.
+    """
+    with engine.connect() as connection:
+        connection.execute(text(f"SET lock_timeout = '{int(timeout)}s'"))
+        connection.execute(
+            text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY}
+        )
+        connection.commit()
+        try:
+            yield
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY}
+            )
+            connection.commit()
+
+
+def hash_password(password: str) -> str:
+    """
+    Hashes a password. Module level, so it can be sent to a worker process.
+    :param password: Plain password.
+    :return: Password hash.
+    """
+    return pwd_context.hash(password)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """
+    Hashes the passwords in a process pool with one process per core.
+    :param passwords: Plain passwords.
+    :return: Password hashes in the same order.
+    """
+    workers = min(os.cpu_count() or 1, len(passwords))
+    if workers <= 1:
+        return [hash_password(password) for password in passwords]
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return list(executor.map(hash_password, passwords))
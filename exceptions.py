@@ -3,6 +3,7 @@ Created by Fabian Gnatzig
 Description: Configured Exceptions
 """
 
+import math
 from typing import Optional
 
 from fastapi import HTTPException, status
@@ -61,6 +62,18 @@ class InvalidException(HTTPException):
         )
 
 
+class ConflictException(HTTPException):
+    """
+    Conflict exception.
+    """
+
+    def __init__(self, type_name: str):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Conflicting {type_name}",
+        )
+
+
 class InvalidTokenException(HTTPException):
     """
     Invalid token exception.
@@ -95,3 +108,16 @@ class InvalidUserException(HTTPException):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid user",
         )
+
+
+class RateLimitException(HTTPException):
+    """
+    Rate limit exception.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
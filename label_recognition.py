@@ -0,0 +1,50 @@
+"""
+Created by Fabian Gnatzig
+Description: Lazy initialised OpenAI client for the label recognition.
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    from openai import OpenAI
+
+OPEN_AI_REQUEST = (
+    "Can you get me following data from this beer label as json:"
+    "name: string, brewery or label (Like Gösser or Edelweiss):string as key brewery,"
+    "alcohol:float, volume:float (normal is 0.5 or 0.33 please round),"
+    "barcode number:string as key beer_code without whitespaces."
+    "Check the data complies with the rules:"
+    "When the label or name of the brewery is inside the name of the beer, "
+    "please remove it from the beer name."
+    "If the words 'beer' or 'bier' is inside the name, keep it inside!"
+    "Use oe instead of ö. Use ae instead of ä. Use ue instead of ü. Use ss instead of ß."
+)
+
+
+@lru_cache(maxsize=1)
+def get_open_ai_client() -> "OpenAI":
+    """
+    Returns the OpenAI client. The openai package is imported and the client is
+    created on the first call, so only the image upload pays for it.
+    :return: The OpenAI client instance.
+    """
+    # pylint: disable=import-outside-toplevel
+    from openai import OpenAI
+
+    return OpenAI(api_key=f"{os.getenv('OPEN_API_KEY')}")
+
+
+def get_json_from_open_ai_response(response: str) -> dict:
+    """
+    Creates a dictionary out of the response message from Open AI.
+    :param response: Response message from Open AI.
+    :return: Dictionary object.
+    """
+    try:
+        data = response.split("```")[1].lstrip("json")
+        return json.loads(data)
+    except Exception:
+        return {"details": "No data found!"}
@@ -3,11 +3,14 @@ Created by Fabian Gnatzig
 Description: Main app of the beer backend.
 """
 
+from datetime import date
 from typing import Annotated
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import Engine
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
 from auth.login_routes import router as login_router
@@ -23,13 +26,53 @@ from routes import (
     season_router,
     team_router,
     service_router,
+    stats_router,
 )
 
-from dependencies import get_session, create_db, engine, pwd_context
+from dependencies import (
+    get_session,
+    create_db,
+    engine,
+    pwd_context,
+    read_your_writes,
+    startup_lock,
+)
 
 SessionDep = Annotated[Session, Depends(get_session)]
 
 
+def seed_team_and_admin(db_engine: Engine):
+    """
+    Creates the default team and admin user if no admin exists.
+    Both are inserted in one transaction, so the fixed team ID and the unique
+    username let only one of several concurrently starting workers insert
+    them, the others roll back.
+    :param db_engine: The db engine.
+    :return: None
+    """
+    with Session(db_engine) as session:
+        stmt = select(User.id).where(User.role == "admin")
+        if session.exec(stmt).first():
+            return
+
+        if not session.get(Team, 1):
+            session.add(Team(id=1, name="team"))
+        admin_user = User(
+            username="admin",
+            role="admin",
+            password=pwd_context.hash("admin"),
+            first_name="first_name",
+            last_name="last_name",
+            birthday=date(2000, 1, 1),
+            team_id=1,
+        )
+        try:
+            session.add(admin_user)
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI):  # pragma: no cover
     """
@@ -37,36 +80,15 @@ async def lifespan(_app: FastAPI):  # pragma: no cover
     Initialize the DB.
     """
     create_db()
-
-    with Session(engine) as session:
-        stmt = select(User).where(User.role == "admin")
-        admin = session.exec(stmt).first()
-
-        if not admin:
-            team = session.get(Team, 1)
-            if not team:
-                team = Team(name="team")
-                session.add(team)
-                session.commit()
-
-            admin_user = User(
-                username="admin",
-                role="admin",
-                password=pwd_context.hash("admin"),
-                first_name="first_name",
-                last_name="last_name",
-                birthday="2000-01-01",
-                team_id=1,
-            )
-            session.add(admin_user)
-            session.commit()
-            session.refresh(admin_user)
+    with startup_lock():
+        seed_team_and_admin(engine)
 
     yield
 
 
 app = FastAPI(lifespan=lifespan)
 
+app.middleware("http")(read_your_writes)
 
 app.add_middleware(
     CORSMiddleware,
@@ -84,4 +106,5 @@ app.include_router(event_router)
 app.include_router(bring_beer_router)
 app.include_router(user_beer_router)
 app.include_router(service_router)
+app.include_router(stats_router)
 app.include_router(login_router)
@@ -0,0 +1,54 @@
+"""
+Created by Fabian Gnatzig
+Description: Environment of the alembic migrations.
+"""
+
+import importlib
+import pkgutil
+from logging.config import fileConfig
+
+from alembic import context
+from sqlmodel import SQLModel
+
+import models
+
+# Importing every module of the models registers its tables in the metadata.
+for module in pkgutil.iter_modules(models.__path__):
+    importlib.import_module(f"models.{module.name}")
+
+config = context.config
+if config.config_file_name:  # pragma: no cover
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = SQLModel.metadata
+
+
+def run_migrations(connection):
+    """
+    Runs the migrations on a connection.
+    :param connection: DB connection.
+    :return: None
+    """
+    if connection.dialect.name == "sqlite":
+        # The batch migrations recreate tables. Dropping the old table must not
+        # run the ON DELETE actions of the foreign keys.
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        transaction_per_migration=True,
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+connection = config.attributes.get("connection")
+if connection is not None:
+    run_migrations(connection)
+else:  # pragma: no cover
+    from dependencies import engine
+
+    with engine.connect() as connection:
+        run_migrations(connection)
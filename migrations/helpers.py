@@ -0,0 +1,106 @@
+"""
+Created by Fabian Gnatzig
+Description: Shared methods of the migrations.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+BACKFILL_BATCH_SIZE = 1000
+FOREIGN_KEY_NAME = "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"
+
+
+def has_table(table: str) -> bool:
+    """
+    Checks if a table exists, e.g. because it was created before the migrations.
+    :param table: Name of the table.
+    :return: True if the table exists.
+    """
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def has_column(table: str, column: str) -> bool:
+    """
+    Checks if a column exists, e.g. because the table was created from the
+    models before the migrations.
+    :param table: Name of the table.
+    :param column: Name of the column.
+    :return: True if the column exists.
+    """
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return column in [existing["name"] for existing in columns]
+
+
+def create_missing_index(name: str, table: str, columns: list, unique: bool = False):
+    """
+    Creates an index if a database created before the migrations does not
+    have it yet.
+    :param name: Name of the index.
+    :param table: Name of the table.
+    :param columns: Indexed columns.
+    :param unique: True for an unique index.
+    :return: None
+    """
+    indexes = sa.inspect(op.get_bind()).get_indexes(table)
+    if name not in [index["name"] for index in indexes]:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def replace_foreign_keys(table: str, foreign_keys: list[tuple]):
+    """
+    Replaces the foreign keys of columns, e.g. to change the ON DELETE action.
+    SQLite does not name the foreign keys, so they get the names of the naming
+    convention when the table is recreated.
+    :param table: Name of the table.
+    :param foreign_keys: Column, referred table and ON DELETE action per key.
+    :return: None
+    """
+    existing = sa.inspect(op.get_bind()).get_foreign_keys(table)
+    with op.batch_alter_table(
+        table, naming_convention={"fk": FOREIGN_KEY_NAME}
+    ) as batch_op:
+        for column, referred_table, ondelete in foreign_keys:
+            name = FOREIGN_KEY_NAME % {
+                "table_name": table,
+                "column_0_name": column,
+                "referred_table_name": referred_table,
+            }
+            for foreign_key in existing:
+                if foreign_key["constrained_columns"] == [column]:
+                    batch_op.drop_constraint(
+                        foreign_key["name"] or name, type_="foreignkey"
+                    )
+            batch_op.create_foreign_key(
+                name, referred_table, [column], ["id"], ondelete=ondelete
+            )
+
+
+def backfill_in_batches(
+    table: str, column: str, value, batch_size: int = BACKFILL_BATCH_SIZE
+) -> int:
+    """
+    Fills the empty values of a column in ID ranges, so every UPDATE only locks
+    a small part of a big table.
+    :param table: Name of the table.
+    :param column: Name of the column to fill.
+    :param value: Value or SQL expression to fill in.
+    :param batch_size: Number of IDs per UPDATE.
+    :return: Number of updated rows.
+    """
+    connection = op.get_bind()
+    target = sa.table(table, sa.column("id"), sa.column(column))
+    last_id = connection.execute(sa.select(sa.func.max(target.c.id))).scalar() or 0
+
+    updated = 0
+    for start in range(0, last_id + 1, batch_size):
+        statement = (
+            sa.update(target)
+            .where(
+                target.c.id >= start,
+                target.c.id < start + batch_size,
+                target.c[column] == None,  # noqa: E711
+            )
+            .values({column: value})
+        )
+        updated += connection.execute(statement).rowcount
+    return updated
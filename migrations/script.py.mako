@@ -0,0 +1,31 @@
+"""
+Created by Fabian Gnatzig
+Description: ${message}
+
+Revision ID: ${up_revision}
+Revises: ${down_revision | comma,n}
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+${imports if imports else ""}
+
+revision = ${repr(up_revision)}
+down_revision = ${repr(down_revision)}
+branch_labels = ${repr(branch_labels)}
+depends_on = ${repr(depends_on)}
+
+
+def upgrade():
+    """
+    Upgrades the schema.
+    """
+    ${upgrades if upgrades else "pass"}
+
+
+def downgrade():
+    """
+    Downgrades the schema.
+    """
+    ${downgrades if downgrades else "pass"}
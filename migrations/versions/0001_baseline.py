@@ -0,0 +1,130 @@
+"""
+Created by Fabian Gnatzig
+Description: Baseline with the tables of the first release.
+Databases created before the migrations are stamped with this revision.
+
+Revision ID: 0001
+Revises:
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Upgrades the schema.
+    """
+    op.create_table(
+        "brewery",
+        sa.Column("name", sqlmodel.AutoString(), nullable=False),
+        sa.Column("city", sqlmodel.AutoString(), nullable=False),
+        sa.Column("country", sqlmodel.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_brewery_name", "brewery", ["name"])
+    op.create_index("ix_brewery_city", "brewery", ["city"])
+    op.create_index("ix_brewery_country", "brewery", ["country"])
+
+    op.create_table(
+        "team",
+        sa.Column("name", sqlmodel.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_team_name", "team", ["name"])
+
+    op.create_table(
+        "beer",
+        sa.Column("name", sqlmodel.AutoString(), nullable=False),
+        sa.Column("beer_code", sqlmodel.AutoString(), nullable=False),
+        sa.Column("brewery_id", sa.Integer(), nullable=False),
+        sa.Column("alcohol", sa.Float(), nullable=False),
+        sa.Column("volume", sa.Float(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["brewery_id"], ["brewery.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_beer_name", "beer", ["name"])
+    op.create_index("ix_beer_beer_code", "beer", ["beer_code"])
+
+    op.create_table(
+        "season",
+        sa.Column("name", sqlmodel.AutoString(), nullable=False),
+        sa.Column("team_id", sa.Integer(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["team_id"], ["team.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "user",
+        sa.Column("username", sqlmodel.AutoString(), nullable=False),
+        sa.Column("first_name", sqlmodel.AutoString(), nullable=False),
+        sa.Column("last_name", sqlmodel.AutoString(), nullable=False),
+        sa.Column("birthday", sa.Date(), nullable=False),
+        sa.Column("team_id", sa.Integer(), nullable=False),
+        sa.Column("password", sqlmodel.AutoString(), nullable=False),
+        sa.Column("role", sqlmodel.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["team_id"], ["team.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "event",
+        sa.Column("name", sqlmodel.AutoString(), nullable=False),
+        sa.Column("season_id", sa.Integer(), nullable=False),
+        sa.Column("event_date", sa.Date(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["season_id"], ["season.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "userbeer",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sqlmodel.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "bringbeer",
+        sa.Column("event_id", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("user_beer_id", sa.Integer(), nullable=True),
+        sa.Column("beer_id", sa.Integer(), nullable=True),
+        sa.Column("done", sa.Boolean(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["event_id"], ["event.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.ForeignKeyConstraint(["user_beer_id"], ["userbeer.id"]),
+        sa.ForeignKeyConstraint(["beer_id"], ["beer.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    """
+    Downgrades the schema.
+    """
+    for table in [
+        "bringbeer",
+        "userbeer",
+        "event",
+        "user",
+        "season",
+        "beer",
+        "team",
+        "brewery",
+    ]:
+        op.drop_table(table)
@@ -0,0 +1,104 @@
+"""
+Created by Fabian Gnatzig
+Description: Tables of the season statistics and the refresh tokens.
+
+Revision ID: 0002
+Revises: 0001
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from migrations.helpers import has_table
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Upgrades the schema.
+    """
+    if not has_table("userseasonstats"):
+        op.create_table(
+            "userseasonstats",
+            sa.Column("season_id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("brought", sa.Integer(), nullable=False),
+            sa.Column("done", sa.Integer(), nullable=False),
+            sa.Column("fines", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["season_id"], ["season.id"]),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("season_id", "user_id"),
+        )
+        op.create_index("ix_userseasonstats_user_id", "userseasonstats", ["user_id"])
+        fill_statistics()
+
+    if not has_table("refreshtoken"):
+        op.create_table(
+            "refreshtoken",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("token_hash", sqlmodel.AutoString(length=64), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.Column("revoked", sa.Boolean(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(
+            "ix_refreshtoken_token_hash", "refreshtoken", ["token_hash"], unique=True
+        )
+        op.create_index("ix_refreshtoken_user_id", "refreshtoken", ["user_id"])
+
+
+def fill_statistics():
+    """
+    Computes the statistics of the existing bring beer.
+    :return: None
+    """
+    bring_beer = sa.table(
+        "bringbeer",
+        sa.column("id"),
+        sa.column("event_id"),
+        sa.column("user_id"),
+        sa.column("user_beer_id"),
+        sa.column("done"),
+    )
+    event = sa.table("event", sa.column("id"), sa.column("season_id"))
+    user = sa.table("user", sa.column("id"))
+    stats = sa.table(
+        "userseasonstats",
+        sa.column("season_id"),
+        sa.column("user_id"),
+        sa.column("brought"),
+        sa.column("done"),
+        sa.column("fines"),
+    )
+    source = (
+        sa.select(
+            event.c.season_id,
+            bring_beer.c.user_id,
+            sa.func.count(bring_beer.c.id),
+            sa.func.sum(sa.case((bring_beer.c.done, 1), else_=0)),
+            sa.func.count(bring_beer.c.user_beer_id),
+        )
+        .join(event, bring_beer.c.event_id == event.c.id)
+        .join(user, bring_beer.c.user_id == user.c.id)
+        .group_by(event.c.season_id, bring_beer.c.user_id)
+    )
+    op.execute(
+        stats.insert().from_select(
+            ["season_id", "user_id", "brought", "done", "fines"], source
+        )
+    )
+
+
+def downgrade():
+    """
+    Downgrades the schema.
+    """
+    op.drop_table("refreshtoken")
+    op.drop_table("userseasonstats")
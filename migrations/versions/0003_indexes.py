@@ -0,0 +1,46 @@
+"""
+Created by Fabian Gnatzig
+Description: Indexes of the foreign keys and the often filtered columns.
+
+Revision ID: 0003
+Revises: 0002
+"""
+
+from alembic import op
+
+from migrations.helpers import create_missing_index
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_user_username", "user", ["username"], True),
+    ("ix_user_team_id", "user", ["team_id"], False),
+    ("ix_season_team_id", "season", ["team_id"], False),
+    ("ix_event_event_date", "event", ["event_date"], False),
+    ("ix_event_season_id_event_date", "event", ["season_id", "event_date"], False),
+    ("ix_beer_brewery_id", "beer", ["brewery_id"], False),
+    ("ix_userbeer_user_id", "userbeer", ["user_id"], False),
+    ("ix_bringbeer_event_id_user_id", "bringbeer", ["event_id", "user_id"], False),
+    ("ix_bringbeer_user_id", "bringbeer", ["user_id"], False),
+    ("ix_bringbeer_user_beer_id", "bringbeer", ["user_beer_id"], False),
+    ("ix_bringbeer_beer_id", "bringbeer", ["beer_id"], False),
+]
+
+
+def upgrade():
+    """
+    Upgrades the schema.
+    """
+    for name, table, columns, unique in INDEXES:
+        create_missing_index(name, table, columns, unique)
+
+
+def downgrade():
+    """
+    Downgrades the schema.
+    """
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table)
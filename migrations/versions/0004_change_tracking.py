@@ -0,0 +1,82 @@
+"""
+Created by Fabian Gnatzig
+Description: Time of the last change of every row and tombstones of the deleted
+rows for the delta sync.
+
+Revision ID: 0004
+Revises: 0003
+"""
+
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from migrations.helpers import backfill_in_batches, has_column, has_table
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+TABLES = [
+    "brewery",
+    "team",
+    "beer",
+    "season",
+    "user",
+    "event",
+    "userbeer",
+    "bringbeer",
+]
+
+
+def upgrade():
+    """
+    Upgrades the schema.
+    """
+    now = sa.literal(datetime.now(timezone.utc), sa.DateTime(timezone=True))
+    for table in TABLES:
+        if has_column(table, "updated_at"):
+            continue
+
+        # Added as nullable and filled in batches before it becomes NOT NULL.
+        op.add_column(
+            table, sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True)
+        )
+        backfill_in_batches(table, "updated_at", now)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "updated_at",
+                existing_type=sa.DateTime(timezone=True),
+                nullable=False,
+            )
+        op.create_index(f"ix_{table}_updated_at", table, ["updated_at"])
+
+    if not has_table("tombstone"):
+        op.create_table(
+            "tombstone",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("table_name", sqlmodel.AutoString(), nullable=False),
+            sa.Column("row_id", sa.Integer(), nullable=False),
+            sa.Column("team_id", sa.Integer(), nullable=True),
+            sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(
+            "ix_tombstone_table_name_deleted_at",
+            "tombstone",
+            ["table_name", "deleted_at"],
+        )
+
+
+def downgrade():
+    """
+    Downgrades the schema.
+    """
+    op.drop_table("tombstone")
+    for table in reversed(TABLES):
+        op.drop_index(f"ix_{table}_updated_at", table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("updated_at")
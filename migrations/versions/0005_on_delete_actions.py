@@ -0,0 +1,52 @@
+"""
+Created by Fabian Gnatzig
+Description: ON DELETE actions of the foreign keys, so the database deletes or
+clears the children of a deleted row.
+
+Revision ID: 0005
+Revises: 0004
+"""
+
+from migrations.helpers import replace_foreign_keys
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = {
+    "beer": [("brewery_id", "brewery", "CASCADE")],
+    "season": [("team_id", "team", "CASCADE")],
+    "user": [("team_id", "team", "CASCADE")],
+    "event": [("season_id", "season", "CASCADE")],
+    "userbeer": [("user_id", "user", "CASCADE")],
+    "bringbeer": [
+        ("event_id", "event", "CASCADE"),
+        ("user_id", "user", "SET NULL"),
+        ("user_beer_id", "userbeer", "SET NULL"),
+        ("beer_id", "beer", "SET NULL"),
+    ],
+    "userseasonstats": [
+        ("season_id", "season", "CASCADE"),
+        ("user_id", "user", "CASCADE"),
+    ],
+    "refreshtoken": [("user_id", "user", "CASCADE")],
+}
+
+
+def upgrade():
+    """
+    Upgrades the schema.
+    """
+    for table, foreign_keys in FOREIGN_KEYS.items():
+        replace_foreign_keys(table, foreign_keys)
+
+
+def downgrade():
+    """
+    Downgrades the schema.
+    """
+    for table, foreign_keys in FOREIGN_KEYS.items():
+        replace_foreign_keys(
+            table, [(column, referred, None) for column, referred, _ in foreign_keys]
+        )
@@ -3,9 +3,12 @@ Created by Fabian Gnatzig
 Description: Models of beers.
 """
 
+from datetime import datetime
 from typing import Optional, TYPE_CHECKING
 
-from sqlmodel import SQLModel, Field, Relationship
+from sqlmodel import SQLModel, Field, Index, Relationship
+
+from models.sync_models import updated_at_field
 
 if TYPE_CHECKING:
     from .brewery_models import Brewery
@@ -20,7 +23,9 @@ class BeerBase(SQLModel):
 
     name: str = Field(index=True)
     beer_code: str = Field(index=True)
-    brewery_id: int = Field(default=None, foreign_key="brewery.id")
+    brewery_id: int = Field(
+        default=None, foreign_key="brewery.id", ondelete="CASCADE", index=True
+    )
     alcohol: float = 0.0
     volume: float = 0.0
 
@@ -31,8 +36,11 @@ class Beer(BeerBase, table=True):
     """
 
     id: int | None = Field(default=None, primary_key=True)
+    updated_at: datetime = updated_at_field()
     brewery: Optional["Brewery"] = Relationship(back_populates="beers")
-    bring_beer: list["BringBeer"] = Relationship(back_populates="beer")
+    bring_beer: list["BringBeer"] = Relationship(
+        back_populates="beer", passive_deletes="all"
+    )
 
 
 class BeerUpdate(BeerBase):
@@ -52,7 +60,9 @@ class UserBeerBase(SQLModel):  #
     Base data class if user beer.
     """
 
-    user_id: int = Field(default=None, foreign_key="user.id")
+    user_id: int = Field(
+        default=None, foreign_key="user.id", ondelete="CASCADE", index=True
+    )
     kind: str
 
 
@@ -62,8 +72,11 @@ class UserBeer(UserBeerBase, table=True):
     """
 
     id: int | None = Field(default=None, primary_key=True)
+    updated_at: datetime = updated_at_field()
     user: Optional["User"] = Relationship(back_populates="user_beer")
-    bring_beer: Optional["BringBeer"] = Relationship(back_populates="user_beer")
+    bring_beer: Optional["BringBeer"] = Relationship(
+        back_populates="user_beer", passive_deletes="all"
+    )
 
 
 class UserBeerUpdate(UserBeerBase):
@@ -80,10 +93,18 @@ class BringBeerBase(SQLModel):
     Base data class of bring beer.
     """
 
-    event_id: int | None = Field(default=None, foreign_key="event.id")
-    user_id: int | None = Field(default=None, foreign_key="user.id")
-    user_beer_id: int | None = Field(default=None, foreign_key="userbeer.id")
-    beer_id: int | None = Field(default=None, foreign_key="beer.id")
+    event_id: int | None = Field(
+        default=None, foreign_key="event.id", ondelete="CASCADE"
+    )
+    user_id: int | None = Field(
+        default=None, foreign_key="user.id", ondelete="SET NULL", index=True
+    )
+    user_beer_id: int | None = Field(
+        default=None, foreign_key="userbeer.id", ondelete="SET NULL", index=True
+    )
+    beer_id: int | None = Field(
+        default=None, foreign_key="beer.id", ondelete="SET NULL", index=True
+    )
     done: bool = False
 
 
@@ -92,7 +113,11 @@ class BringBeer(BringBeerBase, table=True):
     Table class of bring beer.
     """
 
+    # Covers the filter on the event and the grouping by user in the statistics.
+    __table_args__ = (Index("ix_bringbeer_event_id_user_id", "event_id", "user_id"),)
+
     id: int | None = Field(default=None, primary_key=True)
+    updated_at: datetime = updated_at_field()
     user_beer: Optional["UserBeer"] = Relationship(back_populates="bring_beer")
     user: Optional["User"] = Relationship(back_populates="bring_beer")
     event: Optional["Event"] = Relationship(back_populates="bring_beer")
@@ -3,10 +3,13 @@ Created by Fabian Gnatzig
 Description: Models of brewery's.
 """
 
+from datetime import datetime
 from typing import List, TYPE_CHECKING
 
 from sqlmodel import SQLModel, Field, Relationship
 
+from models.sync_models import updated_at_field
+
 if TYPE_CHECKING:
     from .beer_models import Beer
 
@@ -27,7 +30,10 @@ class Brewery(BreweryBase, table=True):
     """
 
     id: int | None = Field(default=None, primary_key=True)
-    beers: List["Beer"] | None = Relationship(back_populates="brewery")
+    updated_at: datetime = updated_at_field()
+    beers: List["Beer"] | None = Relationship(
+        back_populates="brewery", cascade_delete=True, passive_deletes=True
+    )
 
 
 class BreweryUpdate(BreweryBase):
@@ -3,10 +3,12 @@ Created by Fabian Gnatzig
 Description: Models of events.
 """
 
-from datetime import date
+from datetime import date, datetime
 from typing import TYPE_CHECKING, Optional
 
-from sqlmodel import SQLModel, Field, Relationship
+from sqlmodel import SQLModel, Field, Index, Relationship
+
+from models.sync_models import updated_at_field
 
 if TYPE_CHECKING:
     from .beer_models import BringBeer
@@ -19,8 +21,8 @@ class EventBase(SQLModel):
     """
 
     name: str
-    season_id: int = Field(default=None, foreign_key="season.id")
-    event_date: date
+    season_id: int = Field(default=None, foreign_key="season.id", ondelete="CASCADE")
+    event_date: date = Field(index=True)
 
 
 class Event(EventBase, table=True):
@@ -28,9 +30,17 @@ class Event(EventBase, table=True):
     Table class of event.
     """
 
+    # Covers the events of a season ordered by date.
+    __table_args__ = (
+        Index("ix_event_season_id_event_date", "season_id", "event_date"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
+    updated_at: datetime = updated_at_field()
     season: Optional["Season"] = Relationship(back_populates="events")
-    bring_beer: list["BringBeer"] = Relationship(back_populates="event")
+    bring_beer: list["BringBeer"] = Relationship(
+        back_populates="event", cascade_delete=True, passive_deletes=True
+    )
 
 
 class EventUpdate(EventBase):
@@ -3,10 +3,13 @@ Created by Fabian Gnatzig
 Description: Models of season.
 """
 
+from datetime import datetime
 from typing import Optional, TYPE_CHECKING
 
 from sqlmodel import SQLModel, Field, Relationship
 
+from models.sync_models import updated_at_field
+
 if TYPE_CHECKING:
     from .team_models import Team
     from .event_models import Event
@@ -18,7 +21,9 @@ class SeasonBase(SQLModel):
     """
 
     name: str
-    team_id: int = Field(default=None, foreign_key="team.id")
+    team_id: int = Field(
+        default=None, foreign_key="team.id", ondelete="CASCADE", index=True
+    )
 
 
 class Season(SeasonBase, table=True):
@@ -27,8 +32,11 @@ class Season(SeasonBase, table=True):
     """
 
     id: int | None = Field(default=None, primary_key=True)
+    updated_at: datetime = updated_at_field()
     team: Optional["Team"] = Relationship(back_populates="seasons")
-    events: list["Event"] = Relationship(back_populates="season")
+    events: list["Event"] = Relationship(
+        back_populates="season", cascade_delete=True, passive_deletes=True
+    )
 
 
 class SeasonUpdate(SeasonBase):
@@ -0,0 +1,23 @@
+"""
+Created by Fabian Gnatzig
+Description: Models of statistics.
+"""
+
+from sqlmodel import SQLModel, Field
+
+
+class UserSeasonStats(SQLModel, table=True):
+    """
+    Table class of the statistics of a user in a season.
+    Maintained by the bring beer, user beer, event, season and user routes.
+    """
+
+    season_id: int = Field(
+        foreign_key="season.id", ondelete="CASCADE", primary_key=True
+    )
+    user_id: int = Field(
+        foreign_key="user.id", ondelete="CASCADE", primary_key=True, index=True
+    )
+    brought: int = 0
+    done: int = 0
+    fines: int = 0
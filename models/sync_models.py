@@ -0,0 +1,46 @@
+"""
+Created by Fabian Gnatzig
+Description: Models of the change tracking for the delta sync.
+"""
+
+from datetime import datetime, timezone
+
+from sqlmodel import SQLModel, Field, Index
+
+
+def utcnow() -> datetime:
+    """
+    Current time in UTC.
+    :return: Timezone aware current time.
+    """
+    return datetime.now(timezone.utc)
+
+
+def updated_at_field():
+    """
+    Field of the time of the last change of a row. It is set by every INSERT and
+    UPDATE, also the bulk statements that bypass the instances.
+    :return: Field of the column updated_at.
+    """
+    return Field(
+        default_factory=utcnow,
+        index=True,
+        sa_column_kwargs={"default": utcnow, "onupdate": utcnow},
+    )
+
+
+class Tombstone(SQLModel, table=True):
+    """
+    Table class of a deleted row, so clients of the delta sync can remove it.
+    """
+
+    # Covers the deleted rows of a table since the last sync.
+    __table_args__ = (
+        Index("ix_tombstone_table_name_deleted_at", "table_name", "deleted_at"),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    table_name: str
+    row_id: int
+    team_id: int | None = None
+    deleted_at: datetime = Field(default_factory=utcnow)
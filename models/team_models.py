@@ -3,10 +3,13 @@ Created by Fabian Gnatzig
 Description: Models of teams.
 """
 
+from datetime import datetime
 from typing import List, TYPE_CHECKING
 
 from sqlmodel import SQLModel, Field, Relationship
 
+from models.sync_models import updated_at_field
+
 if TYPE_CHECKING:
     from .user_models import User
     from .season_models import Season
@@ -26,8 +29,13 @@ class Team(TeamBase, table=True):
     """
 
     id: int | None = Field(default=None, primary_key=True)
-    users: List["User"] | None = Relationship(back_populates="team")
-    seasons: List["Season"] | None = Relationship(back_populates="team")
+    updated_at: datetime = updated_at_field()
+    users: List["User"] | None = Relationship(
+        back_populates="team", cascade_delete=True, passive_deletes=True
+    )
+    seasons: List["Season"] | None = Relationship(
+        back_populates="team", cascade_delete=True, passive_deletes=True
+    )
 
 
 class TeamUpdate(TeamBase):
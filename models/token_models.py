@@ -0,0 +1,20 @@
+"""
+Created by Fabian Gnatzig
+Description: Models of refresh tokens.
+"""
+
+from datetime import datetime
+
+from sqlmodel import SQLModel, Field
+
+
+class RefreshToken(SQLModel, table=True):
+    """
+    Table class of refresh token. Only the SHA-256 hash of the token is stored.
+    """
+
+    id: int | None = Field(default=None, primary_key=True)
+    token_hash: str = Field(index=True, unique=True, max_length=64)
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE", index=True)
+    expires_at: datetime
+    revoked: bool = False
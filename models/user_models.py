@@ -3,12 +3,13 @@ Created by Fabian Gnatzig
 Description: Models of users.
 """
 
-from datetime import date
+from datetime import date, datetime
 from typing import Optional, TYPE_CHECKING
 
 from sqlmodel import SQLModel, Field, Relationship
 
 from models.beer_models import BringBeer
+from models.sync_models import updated_at_field
 
 if TYPE_CHECKING:
     from .team_models import Team
@@ -20,11 +21,13 @@ class UserBase(SQLModel):
     Base data class of user.
     """
 
-    username: str
+    username: str = Field(index=True, unique=True)
     first_name: str
     last_name: str
     birthday: date
-    team_id: int = Field(default=None, foreign_key="team.id")
+    team_id: int = Field(
+        default=None, foreign_key="team.id", ondelete="CASCADE", index=True
+    )
     password: str
     role: str
 
@@ -35,9 +38,14 @@ class User(UserBase, table=True):
     """
 
     id: int | None = Field(default=None, primary_key=True)
+    updated_at: datetime = updated_at_field()
     team: Optional["Team"] = Relationship(back_populates="users")
-    user_beer: list["UserBeer"] = Relationship(back_populates="user")
-    bring_beer: list["BringBeer"] = Relationship(back_populates="user")
+    user_beer: list["UserBeer"] = Relationship(
+        back_populates="user", cascade_delete=True, passive_deletes=True
+    )
+    bring_beer: list["BringBeer"] = Relationship(
+        back_populates="user", passive_deletes="all"
+    )
 
 
 class UserUpdate(UserBase):
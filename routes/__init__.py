@@ -12,3 +12,4 @@ from routes.season.season_routes import router as season_router  # noqa: F401
 from routes.team.team_routes import router as team_router  # noqa: F401
 from routes.user.user_routes import router as user_router  # noqa: F401
 from routes.service.service_routes import router as service_router  # noqa: F401
+from routes.stats.stats_routes import router as stats_router  # noqa: F401
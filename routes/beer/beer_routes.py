@@ -3,26 +3,39 @@ Created by Fabian Gnatzig
 Description: HTTP routes of beer.
 """
 
+import os
 from typing import Annotated
 
 from fastapi import APIRouter, Query, Depends, HTTPException, UploadFile, File
 from sqlmodel import select, Session
 
 from auth.auth_methods import is_admin
-from dependencies import (
-    get_session,
-    client,
+from auth.rate_limit import RateLimit
+from dependencies import get_session, oauth2_scheme
+from exceptions import NotFoundException, IncompleteException
+from label_recognition import (
     OPEN_AI_REQUEST,
     get_json_from_open_ai_response,
-    oauth2_scheme,
+    get_open_ai_client,
 )
-from exceptions import NotFoundException, IncompleteException
-from models.beer_models import Beer, BeerUpdate
+from models.beer_models import Beer, BeerUpdate, BringBeer
 from models.brewery_models import Brewery
+from routes.bulk import BulkPatch, bulk_update
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.sync import clear_references
 
 router = APIRouter(prefix="/beer", tags=["Beer"])
 
 TYPE = "BEER"
+UPLOAD_LIMIT = RateLimit("upload", os.getenv("RATE_LIMIT_UPLOAD", "5/minute"))
 
 
 @router.get("/all")
@@ -30,25 +43,33 @@ def read_beers(
     session: Session = Depends(get_session),
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 100,
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
 ) -> list:
     """
     Reads all beer instances.
     :param session: DB session.
     :param offset: Start offset.
     :param limit: Maximum query size.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: List of all beers.
     """
-    beers_data = session.exec(select(Beer).offset(offset).limit(limit)).all()
+    columns = get_columns(Beer, fields)
+    relations = get_relations(Beer, include, ["brewery", "bring_beer"])
+    statement = (
+        select(Beer)
+        .options(*get_load_options(Beer, columns, relations))
+        .offset(offset)
+        .limit(limit)
+    )
     beers = []
-    for beer in beers_data:
-        beer_data = beer.model_dump()
-        if beer.brewery:
-            beer_data.update({"brewery": beer.brewery.model_dump()})
-        else:
+    for beer in session.exec(statement).all():
+        beer_data = get_fields_json(beer, columns)
+        if "brewery" in relations and not beer.brewery:
             beer_data.update({"brewery": {"name": "not found"}})
 
-        if beer.bring_beer:
-            beer_data.update({"bring_beer": beer.bring_beer})
+        beer_data.update(get_relations_json(beer, relations))
         beers.append(beer_data)
     return beers
 
@@ -63,6 +84,8 @@ def create_beer(beer: Beer, session: Session = Depends(get_session)) -> Beer:
     """
     if not (beer.name and beer.brewery_id and beer.beer_code):
         raise IncompleteException(TYPE)
+    if not session.get(Brewery, beer.brewery_id):
+        raise NotFoundException("BREWERY", data_id=beer.brewery_id)
 
     session.add(beer)
     session.commit()
@@ -71,23 +94,30 @@ def create_beer(beer: Beer, session: Session = Depends(get_session)) -> Beer:
 
 
 @router.get("/{beer_id}")
-def read_beer_id(beer_id: int, session: Session = Depends(get_session)) -> dict:
+def read_beer_id(
+    beer_id: int,
+    session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+) -> dict:
     """
     Searches for a beer with ID.
     :param beer_id: ID of beer to search for.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with beer and referenced brewery.
     """
-    beer = session.get(Beer, beer_id)
+    columns = get_columns(Beer, fields)
+    relations = get_relations(Beer, include, ["brewery", "bring_beer"])
+    beer = session.get(
+        Beer, beer_id, options=get_load_options(Beer, columns, relations)
+    )
     if not beer:
         raise NotFoundException(TYPE, data_id=beer_id)
 
-    beer_json = beer.model_dump()
-    if beer.brewery:
-        beer_json.update({"brewery": beer.brewery.model_dump()})
-    if beer.bring_beer:
-        beer_json.update({"bring_beer": beer.bring_beer})
-
+    beer_json = get_fields_json(beer, columns)
+    beer_json.update(get_relations_json(beer, relations))
     return beer_json
 
 
@@ -156,11 +186,28 @@ def delete_beer(
     if not beer:
         raise NotFoundException(TYPE, data_id=beer_id)
 
+    clear_references(
+        session, BringBeer, {"beer_id": None}, BringBeer.beer_id == beer_id
+    )
     session.delete(beer)
     session.commit()
     return {"ok": True}
 
 
+@router.patch("/bulk")
+def update_beers(
+    patches: list[BulkPatch], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Updates many beers with one UPDATE per group of equal changes in one
+    transaction.
+    :param patches: ID and changes of every beer.
+    :param session: DB session.
+    :return: IDs of the updated beers.
+    """
+    return bulk_update(session, Beer, BeerUpdate, patches, TYPE)
+
+
 @router.patch("/{beer_id}")
 def update_beer(
     beer_id: int, beer: BeerUpdate, session: Session = Depends(get_session)
@@ -183,7 +230,7 @@ def update_beer(
     return beer_db
 
 
-@router.post("/upload")
+@router.post("/upload", dependencies=[Depends(UPLOAD_LIMIT)])
 def create_beer_by_image(
     image: UploadFile,
     token: Annotated[str, Depends(oauth2_scheme)],
@@ -236,6 +283,7 @@ def get_data_from_open_ai(image: File) -> dict:  # pragma: no cover
     :param image: Image data of the label.
     :return: Dictionary with beer data.
     """
+    client = get_open_ai_client()
     file = client.files.create(file=(image.filename, image.file), purpose="user_data")
 
     response = client.responses.create(
@@ -3,33 +3,77 @@ Created by Fabian Gnatzig
 Description: Http routes of bring beers.
 """
 
-from typing import Sequence, Annotated
+from typing import Annotated
 
 from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, insert, select, update
 
 from auth.auth_methods import is_admin, get_team_id
-from dependencies import get_session, oauth2_scheme
-from exceptions import NotFoundException, InvalidRoleException
-from models.beer_models import BringBeer, BringBeerUpdate
+from dependencies import get_primary_session, get_session, oauth2_scheme
+from exceptions import IncompleteException, NotFoundException, InvalidRoleException
+from models.beer_models import Beer, BringBeer, BringBeerBase, BringBeerUpdate, UserBeer
+from models.event_models import Event
 from models.user_models import User
+from models.sync_models import utcnow
+from routes.bulk import BulkPatch, apply_changes, group_changes
+from routes.cache import NEXT_EVENT_CACHE
+from routes.export import ndjson_response
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.live import publish_event
+from routes.stats.stats_routes import (
+    track_bring_beer,
+    track_bring_beers,
+    track_done,
+)
+from routes.sync import (
+    SinceQuery,
+    add_tombstone,
+    changed_since,
+    get_sync_json,
+)
 
 router = APIRouter(prefix="/bringbeer", tags=["BringBeer"])
 
 TYPE = "BRING_BEER"
+REFERENCES = [
+    ("event_id", Event, "EVENT"),
+    ("user_id", User, "USER"),
+    ("user_beer_id", UserBeer, "USER_BEER"),
+    ("beer_id", Beer, "BEER"),
+]
 
 
 @router.get("/all")
 def read_bring_beers(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Session = Depends(get_session),
-) -> Sequence[BringBeer]:
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+    since: SinceQuery = None,
+) -> list | dict:
     """
     Reads all bring beer instances.
     :param token: User jwt-token.
     :param session: DB session.
-    :return: List of all bring beer instances.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
+    :param since: Only rows changed or deleted since this time.
+    :return: List of all bring beer instances or with since the changed bring
+        beer, the IDs of the deleted bring beer and the time of the sync.
     """
+    columns = get_columns(BringBeer, fields)
+    relations = get_relations(BringBeer, include, [])
+    synced_at = utcnow()
+    team_id = None
     try:
         is_admin(token)
         statement = select(BringBeer)
@@ -37,31 +81,67 @@ def read_bring_beers(
         team_id = get_team_id(token)
         statement = select(BringBeer).join(User).where(User.team_id == team_id)
 
-    bring_beers = session.exec(statement).all()
-    return bring_beers
+    if since:
+        statement = changed_since(statement, BringBeer, since)
+
+    statement = statement.options(*get_load_options(BringBeer, columns, relations))
+    rows = [
+        get_fields_json(bring_beer, columns) | get_relations_json(bring_beer, relations)
+        for bring_beer in session.exec(statement).all()
+    ]
+    if since is None:
+        return rows
+    return get_sync_json(session, BringBeer, rows, since, team_id, synced_at)
+
+
+@router.get("/export")
+def export_bring_beers(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> StreamingResponse:
+    """
+    Exports all bring beer instances as NDJSON stream.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: Streaming response with one bring beer per line.
+    """
+    statement = select(*BringBeer.__table__.columns)
+    try:
+        is_admin(token)
+    except InvalidRoleException:
+        team_id = get_team_id(token)
+        statement = statement.join(User).where(User.team_id == team_id)
+
+    return ndjson_response(session.get_bind(), statement.order_by(BringBeer.id))
 
 
 @router.get("/{bring_beer_id}")
 def read_bring_beer_id(
-    bring_beer_id: int, session: Session = Depends(get_session)
+    bring_beer_id: int,
+    session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
 ) -> dict:
     """
     Searches for a bring beer with id.
     :param bring_beer_id: ID of a bring beer instance.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with bring beer and related instances.
     """
-    bring_beer = session.get(BringBeer, bring_beer_id)
+    columns = get_columns(BringBeer, fields)
+    relations = get_relations(BringBeer, include, ["user", "event", "beer"])
+    bring_beer = session.get(
+        BringBeer,
+        bring_beer_id,
+        options=get_load_options(BringBeer, columns, relations),
+    )
     if not bring_beer:
         raise NotFoundException(TYPE, data_id=bring_beer_id)
 
-    bring_beer_json = bring_beer.model_dump()
-    if bring_beer.user:
-        bring_beer_json.update({"user": bring_beer.user.model_dump()})
-    if bring_beer.event:
-        bring_beer_json.update({"event": bring_beer.event.model_dump()})
-    if bring_beer.beer:
-        bring_beer_json.update({"beer": bring_beer.beer.model_dump()})
+    bring_beer_json = get_fields_json(bring_beer, columns)
+    bring_beer_json.update(get_relations_json(bring_beer, relations))
     return bring_beer_json
 
 
@@ -75,12 +155,71 @@ def create_bring_beer(
     :param session: DB session.
     :return: Created bring beer instance.
     """
+    validate_foreign_keys([bring_beer.model_dump()], session)
     session.add(bring_beer)
+    track_bring_beer(session, bring_beer, 1)
     session.commit()
     session.refresh(bring_beer)
+    NEXT_EVENT_CACHE.clear()
+    publish_event(
+        bring_beer.event_id,
+        {"type": "create", "bring_beer": bring_beer.model_dump(mode="json")},
+    )
     return bring_beer
 
 
+@router.post("/bulk")
+def create_bring_beers(
+    bring_beers: list[BringBeerBase], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Creates many bring beer instances with one INSERT in one transaction.
+    :param bring_beers: Bring beer instances.
+    :param session: DB session.
+    :return: IDs of the created bring beer in the order of the request.
+    """
+    if not bring_beers:
+        raise IncompleteException(TYPE)
+
+    rows = [bring_beer.model_dump() for bring_beer in bring_beers]
+    validate_foreign_keys(rows, session)
+
+    statement = insert(BringBeer).values(rows)
+    if session.get_bind().dialect.insert_returning:
+        # The rows of one INSERT get ascending IDs in the order of the values.
+        ids = sorted(session.exec(statement.returning(BringBeer.id)).scalars())
+    else:  # pragma: no cover
+        first_id = session.exec(statement).lastrowid
+        ids = list(range(first_id, first_id + len(rows)))
+
+    track_bring_beers(session, bring_beers, 1)
+    session.commit()
+    NEXT_EVENT_CACHE.clear()
+    for bring_beer_id, row in zip(ids, rows):
+        publish_event(
+            row["event_id"],
+            {"type": "create", "bring_beer": {**row, "id": bring_beer_id}},
+        )
+    return {"ids": ids}
+
+
+def validate_foreign_keys(rows: list[dict], session: Session):
+    """
+    Checks the referenced instances of many bring beer with one query per table.
+    :param rows: Data of the bring beer.
+    :param session: DB session.
+    :return: None
+    """
+    for field, model, type_name in REFERENCES:
+        ids = {row[field] for row in rows if row[field] is not None}
+        if not ids:
+            continue
+
+        found = set(session.exec(select(model.id).where(model.id.in_(ids))).all())
+        if missing := ids - found:
+            raise NotFoundException(type_name, data_id=min(missing))
+
+
 @router.delete("/{bring_beer_id}")
 def delete_bring_beer(
     bring_beer_id: int,
@@ -100,11 +239,50 @@ def delete_bring_beer(
     if not bring_beer:
         raise NotFoundException(TYPE, data_id=bring_beer_id)
 
+    track_bring_beer(session, bring_beer, -1)
+    event_id = bring_beer.event_id
+    team_id = bring_beer.user.team_id if bring_beer.user else None
+    add_tombstone(session, BringBeer, bring_beer_id, team_id)
     session.delete(bring_beer)
     session.commit()
+    NEXT_EVENT_CACHE.clear()
+    publish_event(event_id, {"type": "delete", "id": bring_beer_id})
     return {"ok": True}
 
 
+@router.patch("/bulk")
+def update_bring_beers(
+    patches: list[BulkPatch], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Updates many bring beer with one UPDATE per group of equal changes in one
+    transaction.
+    :param patches: ID and changes of every bring beer.
+    :param session: DB session.
+    :return: IDs of the updated bring beer.
+    """
+    groups = group_changes(BringBeer, BringBeerUpdate, patches, TYPE)
+    ids = [patch.id for patch in patches]
+    bring_beers = session.exec(select(BringBeer).where(BringBeer.id.in_(ids))).all()
+    if missing := set(ids) - {bring_beer.id for bring_beer in bring_beers}:
+        raise NotFoundException(TYPE, data_id=min(missing))
+
+    old_event_ids = [bring_beer.event_id for bring_beer in bring_beers]
+    track_bring_beers(session, bring_beers, -1)
+    apply_changes(session, BringBeer, groups, TYPE)
+    track_bring_beers(session, bring_beers, 1)
+    # Read before the commit expires the instances.
+    changes = [
+        (old_event_id, bring_beer.model_dump(mode="json"))
+        for old_event_id, bring_beer in zip(old_event_ids, bring_beers)
+    ]
+    session.commit()
+    NEXT_EVENT_CACHE.clear()
+    for old_event_id, bring_beer_json in changes:
+        publish_update(old_event_id, bring_beer_json)
+    return {"updated": ids}
+
+
 @router.patch("/{bring_beer_id}")
 def update_bring_beer(
     bring_beer_id: int,
@@ -123,19 +301,76 @@ def update_bring_beer(
         raise NotFoundException(TYPE, data_id=bring_beer_id)
 
     bring_beer_data = bring_beer.model_dump(exclude_unset=True)
+    old_event_id = bring_beer_db.event_id
+    track_bring_beer(session, bring_beer_db, -1)
     bring_beer_db.sqlmodel_update(bring_beer_data)
+    track_bring_beer(session, bring_beer_db, 1)
     session.commit()
     session.refresh(bring_beer_db)
+    NEXT_EVENT_CACHE.clear()
+    publish_update(old_event_id, bring_beer_db.model_dump(mode="json"))
     return bring_beer_db
 
 
+def publish_update(old_event_id: int | None, bring_beer_json: dict):
+    """
+    Publishes the update of a bring beer. If it moved to another event, it is
+    published as deleted from the old event.
+    :param old_event_id: ID of the event before the update.
+    :param bring_beer_json: Updated bring beer.
+    :return: None
+    """
+    if old_event_id != bring_beer_json["event_id"]:
+        publish_event(old_event_id, {"type": "delete", "id": bring_beer_json["id"]})
+    publish_event(
+        bring_beer_json["event_id"], {"type": "update", "bring_beer": bring_beer_json}
+    )
+
+
+@router.post("/done")
+def complete_bring_beers(
+    bring_beer_ids: list[int], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Sets many bring beer to done with one conditional UPDATE. Bring beer, which
+    are already done or do not exist, are not changed, so repeated calls are safe.
+    :param bring_beer_ids: IDs of the bring beer.
+    :param session: DB session.
+    :return: IDs of the bring beer changed by this call.
+    """
+    if not bring_beer_ids:
+        raise IncompleteException(TYPE)
+
+    condition = BringBeer.id.in_(bring_beer_ids), BringBeer.done.is_(False)
+    columns = BringBeer.id, BringBeer.event_id, BringBeer.user_id
+    statement = update(BringBeer).where(*condition).values(done=True)
+    if session.get_bind().dialect.update_returning:
+        changed = session.exec(statement.returning(*columns)).all()
+    else:  # pragma: no cover
+        # Locks the rows, so a concurrent call can not report them as well.
+        locked = select(*columns).where(*condition).with_for_update()
+        changed = session.exec(locked).all()
+        session.exec(statement)
+
+    track_done(session, changed)
+    session.commit()
+    if changed:
+        NEXT_EVENT_CACHE.clear()
+    for bring_beer in changed:
+        publish_event(bring_beer.event_id, {"type": "done", "id": bring_beer.id})
+    return {"updated": sorted(bring_beer.id for bring_beer in changed)}
+
+
 @router.get("/done/{bring_beer_id}")
-def set_bring_beer_done(bring_beer_id: int, session: Session = Depends(get_session)):
+def set_bring_beer_done(
+    bring_beer_id: int, session: Session = Depends(get_primary_session)
+):
     """
-    Set the bring beer to done.
+    Set the bring beer to done. Deprecated, use POST /bringbeer/done instead.
     :param bring_beer_id: ID of bring beer.
     :param session: DB session.
     :return: None
     """
-    bring_beer_update = BringBeerUpdate(done="True")
-    update_bring_beer(bring_beer_id, bring_beer_update, session=session)
+    changed = complete_bring_beers([bring_beer_id], session=session)["updated"]
+    if not changed and not session.get(BringBeer, bring_beer_id):
+        raise NotFoundException(TYPE, data_id=bring_beer_id)
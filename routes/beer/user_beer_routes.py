@@ -3,9 +3,10 @@ Created by Fabian Gnatzig
 Description: HTTP routes of user beer.
 """
 
-from typing import Annotated, Sequence
+from typing import Annotated
 
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from sqlmodel import select, Session
 
 from auth.auth_methods import is_admin, get_team_id
@@ -13,6 +14,25 @@ from dependencies import get_session, oauth2_scheme
 from exceptions import NotFoundException, InvalidRoleException
 from models.beer_models import UserBeer, UserBeerUpdate
 from models.user_models import User
+from models.sync_models import utcnow
+from routes.cache import NEXT_EVENT_CACHE
+from routes.export import ndjson_response
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.stats.stats_routes import track_bring_beer
+from routes.sync import (
+    SinceQuery,
+    add_tombstone,
+    changed_since,
+    get_sync_json,
+)
 
 router = APIRouter(prefix="/userbeer", tags=["UserBeer"])
 
@@ -23,13 +43,24 @@ TYPE = "USER_BEER"
 def read_user_beers(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Session = Depends(get_session),
-) -> Sequence[UserBeer]:
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+    since: SinceQuery = None,
+) -> list | dict:
     """
     Reads all user beer instances.
     :param token: User jwt-token.
     :param session: DB session.
-    :return: List of all user beers.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
+    :param since: Only rows changed or deleted since this time.
+    :return: List of all user beers or with since the changed user beers,
+        the IDs of the deleted user beers and the time of the sync.
     """
+    columns = get_columns(UserBeer, fields)
+    relations = get_relations(UserBeer, include, [])
+    synced_at = utcnow()
+    team_id = None
     try:
         is_admin(token)
         statement = select(UserBeer)
@@ -37,8 +68,17 @@ def read_user_beers(
         team_id = get_team_id(token)
         statement = select(UserBeer).join(User).where(User.team_id == team_id)
 
-    user_beer = session.exec(statement).all()
-    return user_beer
+    if since:
+        statement = changed_since(statement, UserBeer, since)
+
+    statement = statement.options(*get_load_options(UserBeer, columns, relations))
+    rows = [
+        get_fields_json(user_beer, columns) | get_relations_json(user_beer, relations)
+        for user_beer in session.exec(statement).all()
+    ]
+    if since is None:
+        return rows
+    return get_sync_json(session, UserBeer, rows, since, team_id, synced_at)
 
 
 @router.post("/add")
@@ -51,34 +91,63 @@ def create_user_beer(
     :param session: DB session.
     :return: Created user beer instance.
     """
-    user = session.get(User, user_beer.user_id)
-    user_beer.user = user if user else None
+    if user_beer.user_id is not None and not session.get(User, user_beer.user_id):
+        raise NotFoundException("USER", data_id=user_beer.user_id)
+
     session.add(user_beer)
     session.commit()
     session.refresh(user_beer)
     return user_beer
 
 
+@router.get("/export")
+def export_user_beers(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> StreamingResponse:
+    """
+    Exports all user beer instances as NDJSON stream.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: Streaming response with one user beer per line.
+    """
+    statement = select(*UserBeer.__table__.columns)
+    try:
+        is_admin(token)
+    except InvalidRoleException:
+        team_id = get_team_id(token)
+        statement = statement.join(User).where(User.team_id == team_id)
+
+    return ndjson_response(session.get_bind(), statement.order_by(UserBeer.id))
+
+
 @router.get("/{user_beer_id}")
 def read_user_beer_id(
-    user_beer_id: int, session: Session = Depends(get_session)
+    user_beer_id: int,
+    session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
 ) -> dict:
     """
     Searches for a user beer with beer_id.
     :param user_beer_id: User_beer_id to search for.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with user beer and referenced user and bring beer.
     """
-    user_beer = session.get(UserBeer, user_beer_id)
+    columns = get_columns(UserBeer, fields)
+    relations = get_relations(UserBeer, include, ["user", "bring_beer"])
+    user_beer = session.get(
+        UserBeer,
+        user_beer_id,
+        options=get_load_options(UserBeer, columns, relations),
+    )
     if not user_beer:
         raise NotFoundException(TYPE, data_id=user_beer_id)
 
-    user_beer_json = user_beer.model_dump()
-    if user_beer.user:
-        user_beer_json.update({"user": user_beer.user.model_dump()})
-    if user_beer.bring_beer:
-        user_beer_json.update({"bring_beer": user_beer.bring_beer.model_dump()})
-
+    user_beer_json = get_fields_json(user_beer, columns)
+    user_beer_json.update(get_relations_json(user_beer, relations))
     return user_beer_json
 
 
@@ -101,8 +170,16 @@ def delete_beer(
     if not user_beer:
         raise NotFoundException(TYPE, data_id=user_beer_id)
 
+    if user_beer.bring_beer:
+        track_bring_beer(session, user_beer.bring_beer, -1)
+        user_beer.bring_beer.user_beer_id = None
+        track_bring_beer(session, user_beer.bring_beer, 1)
+
+    team_id = user_beer.user.team_id if user_beer.user else None
+    add_tombstone(session, UserBeer, user_beer_id, team_id)
     session.delete(user_beer)
     session.commit()
+    NEXT_EVENT_CACHE.clear()
     return {"ok": True}
 
 
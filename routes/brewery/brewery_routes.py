@@ -11,7 +11,19 @@ from sqlmodel import Session, select
 from auth.auth_methods import is_admin
 from dependencies import get_session, oauth2_scheme
 from exceptions import IncompleteException, NotFoundException
+from models.beer_models import Beer, BringBeer
 from models.brewery_models import Brewery, BreweryUpdate
+from routes.bulk import BulkPatch, bulk_update
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.sync import clear_references
 
 router = APIRouter(prefix="/brewery", tags=["Brewery"])
 
@@ -23,22 +35,33 @@ def read_brewer(
     session: Session = Depends(get_session),
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 100,
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
 ) -> list:
     """
     Reads all brewery instances.
     :param session: DB session.
     :param offset: Start offset.
     :param limit: Maximum query.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: List of all brewery.
     """
-    breweries = session.exec(select(Brewery).offset(offset).limit(limit)).all()
+    columns = get_columns(Brewery, fields)
+    relations = get_relations(Brewery, include, ["beers"])
+    statement = (
+        select(Brewery)
+        .options(*get_load_options(Brewery, columns, relations))
+        .offset(offset)
+        .limit(limit)
+    )
     breweries_list = []
-    for brewery in breweries:
-        brewery_data = brewery.model_dump()
-        if brewery.beers:
-            brewery_data.update({"beers": brewery.beers})
-        else:
+    for brewery in session.exec(statement).all():
+        brewery_data = get_fields_json(brewery, columns)
+        if "beers" in relations:
             brewery_data.update({"beers": []})
+
+        brewery_data.update(get_relations_json(brewery, relations))
         breweries_list.append(brewery_data)
     return breweries_list
 
@@ -63,22 +86,31 @@ def create_brewery(
 
 
 @router.get("/{brewery_id}")
-def read_brewery_id(brewery_id: int, session: Session = Depends(get_session)) -> dict:
+def read_brewery_id(
+    brewery_id: int,
+    session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+) -> dict:
     """
     Searches for a brewery with id.
     :param brewery_id: ID of a beer to search for.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with brewery and referenced beer.
     """
-    brewery = session.get(Brewery, brewery_id)
+    columns = get_columns(Brewery, fields)
+    relations = get_relations(Brewery, include, ["beers"])
+    brewery = session.get(
+        Brewery, brewery_id, options=get_load_options(Brewery, columns, relations)
+    )
 
     if not brewery:
         raise NotFoundException(TYPE, data_id=brewery_id)
 
-    brewery_json = brewery.model_dump()
-    if brewery.beers:
-        brewery_json.update({"beers": brewery.beers})
-
+    brewery_json = get_fields_json(brewery, columns)
+    brewery_json.update(get_relations_json(brewery, relations))
     return brewery_json
 
 
@@ -126,11 +158,32 @@ def delete_brewery(
     if not brewery:
         raise NotFoundException(TYPE, data_id=brewery_id)
 
+    # The database deletes the beer of the brewery.
+    clear_references(
+        session,
+        BringBeer,
+        {"beer_id": None},
+        BringBeer.beer_id.in_(select(Beer.id).where(Beer.brewery_id == brewery_id)),
+    )
     session.delete(brewery)
     session.commit()
     return {"ok": True}
 
 
+@router.patch("/bulk")
+def update_breweries(
+    patches: list[BulkPatch], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Updates many breweries with one UPDATE per group of equal changes in one
+    transaction.
+    :param patches: ID and changes of every brewery.
+    :param session: DB session.
+    :return: IDs of the updated breweries.
+    """
+    return bulk_update(session, Brewery, BreweryUpdate, patches, TYPE)
+
+
 @router.patch("/{brewery_id}")
 def update_brewery(
     brewery_id: int, brewery: BreweryUpdate, session: Session = Depends(get_session)
@@ -0,0 +1,125 @@
+"""
+Created by Fabian Gnatzig
+Description: Bulk updates of many rows of an entity.
+"""
+
+from collections import defaultdict
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, select, update
+
+from exceptions import IncompleteException, InvalidException, NotFoundException
+
+
+class BulkPatch(SQLModel):
+    """
+    Class of the changes of one row in a bulk update.
+    """
+
+    id: int
+    changes: dict
+
+
+def group_changes(
+    model: type[SQLModel],
+    update_model: type[SQLModel],
+    patches: list[BulkPatch],
+    type_name: str,
+) -> dict[tuple, list[int]]:
+    """
+    Validates the changes and groups the IDs of rows with equal changes.
+    :param model: Table class of the entity.
+    :param update_model: Update class of the entity.
+    :param patches: Changes of every row.
+    :param type_name: Name of the entity for errors.
+    :return: IDs of the rows per changes as sorted (column, value) tuple.
+    """
+    if not patches:
+        raise IncompleteException(type_name)
+
+    ids = [patch.id for patch in patches]
+    if len(set(ids)) != len(ids):
+        raise InvalidException("id")
+
+    groups = defaultdict(list)
+    for patch in patches:
+        if (
+            not patch.changes
+            or not patch.changes.keys() <= update_model.model_fields.keys()
+        ):
+            raise InvalidException(type_name)
+        try:
+            changes = update_model.model_validate(patch.changes).model_dump(
+                exclude_unset=True
+            )
+        except ValidationError as ex:
+            raise InvalidException(type_name) from ex
+
+        columns = model.__table__.columns
+        if any(
+            value is None and not columns[key].nullable
+            for key, value in changes.items()
+        ):
+            raise InvalidException(type_name)
+        groups[tuple(sorted(changes.items()))].append(patch.id)
+    return groups
+
+
+def check_ids(session: Session, model: type[SQLModel], ids: list[int], type_name: str):
+    """
+    Checks that all rows exist with one query.
+    :param session: DB session.
+    :param model: Table class of the entity.
+    :param ids: IDs of the rows.
+    :param type_name: Name of the entity for errors.
+    :return: None
+    """
+    found = set(session.exec(select(model.id).where(model.id.in_(ids))).all())
+    if missing := set(ids) - found:
+        raise NotFoundException(type_name, data_id=min(missing))
+
+
+def apply_changes(
+    session: Session, model: type[SQLModel], groups: dict, type_name: str
+):
+    """
+    Runs one UPDATE per group of equal changes. Does not commit, so all groups
+    are part of the transaction of the calling route.
+    :param session: DB session.
+    :param model: Table class of the entity.
+    :param groups: IDs of the rows per changes from group_changes.
+    :param type_name: Name of the entity for errors.
+    :return: None
+    """
+    try:
+        for changes, ids in groups.items():
+            statement = update(model).where(model.id.in_(ids)).values(dict(changes))
+            session.exec(statement)
+    except IntegrityError as ex:
+        session.rollback()
+        raise InvalidException(type_name) from ex
+
+
+def bulk_update(
+    session: Session,
+    model: type[SQLModel],
+    update_model: type[SQLModel],
+    patches: list[BulkPatch],
+    type_name: str,
+) -> dict:
+    """
+    Validates and applies the changes of many rows in one transaction.
+    :param session: DB session.
+    :param model: Table class of the entity.
+    :param update_model: Update class of the entity.
+    :param patches: Changes of every row.
+    :param type_name: Name of the entity for errors.
+    :return: IDs of the updated rows.
+    """
+    groups = group_changes(model, update_model, patches, type_name)
+    ids = [patch.id for patch in patches]
+    check_ids(session, model, ids, type_name)
+    apply_changes(session, model, groups, type_name)
+    session.commit()
+    return {"updated": ids}
@@ -0,0 +1,58 @@
+"""
+Created by Fabian Gnatzig
+Description: In-process caches of the routes.
+"""
+
+import os
+import time
+from datetime import date
+
+
+class TeamCache:
+    """
+    Caches a value per team for the current day. Every worker has its own cache,
+    so the entries also expire after a time to live to pick up the changes of
+    the other workers.
+    """
+
+    def __init__(self, ttl: float):
+        """
+        :param ttl: Seconds an entry is valid.
+        """
+        self.ttl = ttl
+        self.entries: dict[int, tuple[date, float, dict]] = {}
+
+    def get(self, team_id: int) -> dict | None:
+        """
+        Reads the cached value of a team.
+        :param team_id: ID of the team.
+        :return: Cached value or None if missing or expired.
+        """
+        entry = self.entries.get(team_id)
+        if not entry:
+            return None
+
+        day, stored_at, value = entry
+        if day != date.today() or time.monotonic() - stored_at > self.ttl:
+            del self.entries[team_id]
+            return None
+        return value
+
+    def set(self, team_id: int, value: dict):
+        """
+        Caches the value of a team.
+        :param team_id: ID of the team.
+        :param value: Value to cache.
+        :return: None
+        """
+        self.entries[team_id] = (date.today(), time.monotonic(), value)
+
+    def clear(self):
+        """
+        Removes all cached values.
+        :return: None
+        """
+        self.entries.clear()
+
+
+NEXT_EVENT_CACHE = TeamCache(ttl=float(os.getenv("NEXT_EVENT_CACHE_SECONDS", "30")))
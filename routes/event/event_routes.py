@@ -3,13 +3,16 @@ Created by Fabian Gnatzig
 Description: Http routes of events.
 """
 
-from datetime import datetime, timedelta
-from typing import Annotated, Sequence
+import asyncio
+import base64
+from datetime import date, datetime, timedelta
+from typing import Annotated
 
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, status
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, and_, or_, select
 
-from auth.auth_methods import is_admin, get_team_id
+from auth.auth_methods import is_admin, get_team_id, is_team_member_or_admin
 from dependencies import get_session, oauth2_scheme
 from exceptions import (
     NotFoundException,
@@ -17,8 +20,36 @@ from exceptions import (
     InvalidException,
     InvalidRoleException,
 )
-from models.event_models import Event
+from models.beer_models import BringBeer
+from models.event_models import Event, EventUpdate
 from models.season_models import Season
+from models.sync_models import utcnow
+from routes.stats.stats_routes import track_event
+from routes.bulk import BulkPatch, apply_changes, check_ids, group_changes
+from routes.cache import NEXT_EVENT_CACHE
+from routes.live import (
+    RESYNC,
+    event_channel,
+    event_deleted,
+    get_broker,
+    publish_event,
+)
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.sync import (
+    SinceQuery,
+    add_tombstone,
+    add_tombstones,
+    changed_since,
+    get_sync_json,
+)
 
 router = APIRouter(prefix="/event", tags=["Event"])
 TYPE = "EVENT"
@@ -28,13 +59,24 @@ TYPE = "EVENT"
 def read_all_events(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Session = Depends(get_session),
-) -> Sequence[Event]:
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+    since: SinceQuery = None,
+) -> list | dict:
     """
     Reads all event instances.
     :param token: User jwt-token.
     :param session: DB session.
-    :return: List of all events.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
+    :param since: Only rows changed or deleted since this time.
+    :return: List of all events or with since the changed events,
+        the IDs of the deleted events and the time of the sync.
     """
+    columns = get_columns(Event, fields)
+    relations = get_relations(Event, include, [])
+    synced_at = utcnow()
+    team_id = None
     try:
         is_admin(token)
         statement = select(Event)
@@ -43,30 +85,201 @@ def read_all_events(
         team_id = get_team_id(token)
         statement = select(Event).join(Season).where(Season.team_id == team_id)
 
+    if since:
+        statement = changed_since(statement, Event, since)
+
+    statement = statement.options(*get_load_options(Event, columns, relations))
+    rows = [
+        get_fields_json(event, columns) | get_relations_json(event, relations)
+        for event in session.exec(statement).all()
+    ]
+    if since is None:
+        return rows
+    return get_sync_json(session, Event, rows, since, team_id, synced_at)
+
+
+def encode_cursor(event: Event) -> str:
+    """
+    Encodes the position of an event in the date order as cursor.
+    :param event: Last event of a page.
+    :return: Cursor of the next page.
+    """
+    position = f"{event.event_date.isoformat()},{event.id}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    """
+    Decodes a cursor to the date and ID of the last event of a page.
+    :param cursor: Cursor of the next page.
+    :return: Date and ID of the last event.
+    """
+    try:
+        event_date, event_id = base64.urlsafe_b64decode(cursor).decode().split(",")
+        return date.fromisoformat(event_date), int(event_id)
+    except ValueError as ex:
+        raise InvalidException("cursor") from ex
+
+
+@router.get("/range")
+def read_event_range(
+    from_date: Annotated[date, Query(alias="from")],
+    to_date: Annotated[date, Query(alias="to")],
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+    limit: Annotated[int, Query(gt=0, le=100)] = 100,
+    cursor: str | None = None,
+) -> dict:
+    """
+    Reads the events between two dates ordered by date. Uses the index of
+    season and date for the events of a team.
+    :param from_date: First date of the range.
+    :param to_date: Last date of the range.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :param limit: Maximum events per page.
+    :param cursor: Cursor of the next page from the previous page.
+    :return: Events of the page and cursor of the next page.
+    """
+    if to_date < from_date:
+        raise InvalidException("date range")
+
+    statement = select(Event).where(
+        Event.event_date >= from_date, Event.event_date <= to_date
+    )
+    try:
+        is_admin(token)
+    except InvalidRoleException:
+        team_id = get_team_id(token)
+        seasons = select(Season.id).where(Season.team_id == team_id)
+        statement = statement.where(Event.season_id.in_(seasons))
+
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        statement = statement.where(
+            or_(
+                Event.event_date > last_date,
+                and_(Event.event_date == last_date, Event.id > last_id),
+            )
+        )
+
+    statement = statement.order_by(Event.event_date, Event.id).limit(limit + 1)
     events = session.exec(statement).all()
-    return events
+
+    next_cursor = encode_cursor(events[limit - 1]) if len(events) > limit else None
+    return {"events": events[:limit], "next_cursor": next_cursor}
 
 
 @router.get("/{event_id}")
-def get_event_id(event_id: int, session: Session = Depends(get_session)) -> dict:
+def get_event_id(
+    event_id: int,
+    session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+) -> dict:
     """
     Searches for an event with id.
     :param event_id: ID of an event.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with event and related instances.
     """
-    event = session.get(Event, event_id)
+    columns = get_columns(Event, fields)
+    relations = get_relations(Event, include, ["season", "bring_beer"])
+    event = session.get(
+        Event, event_id, options=get_load_options(Event, columns, relations)
+    )
     if not event:
         raise NotFoundException(TYPE, data_id=event_id)
 
-    event_json = event.model_dump()
-    if event.season:
-        event_json.update({"season": event.season.model_dump()})
-    if event.bring_beer:
-        event_json.update({"bring_beer": event.bring_beer})
+    event_json = get_fields_json(event, columns)
+    event_json.update(get_relations_json(event, relations))
     return event_json
 
 
+def get_event_team_id(event_id: int, session: Session) -> int | None:
+    """
+    Reads the team of an event.
+    :param event_id: ID of the event.
+    :param session: DB session.
+    :return: ID of the team or None if the event does not exist.
+    """
+    statement = select(Season.team_id).join(Event).where(Event.id == event_id)
+    team_id = session.exec(statement).first()
+    session.close()
+    return team_id
+
+
+def get_live_snapshot(event_id: int, session: Session) -> dict:
+    """
+    Reads all bring beer of an event as first message of the live changes.
+    :param event_id: ID of the event.
+    :param session: DB session.
+    :return: Snapshot message with all bring beer of the event.
+    """
+    statement = (
+        select(BringBeer).where(BringBeer.event_id == event_id).order_by(BringBeer.id)
+    )
+    bring_beers = [
+        bring_beer.model_dump(mode="json") for bring_beer in session.exec(statement)
+    ]
+    # Releases the connection for the time the websocket is open.
+    session.close()
+    return {"type": "snapshot", "bring_beers": bring_beers}
+
+
+@router.websocket("/{event_id}/live")
+async def live_event(
+    websocket: WebSocket,
+    event_id: int,
+    token: str,
+    session: Session = Depends(get_session),
+):
+    """
+    Sends all bring beer of an event and afterward every create, update, done and
+    delete of its bring beer. The websocket is closed, when the event is deleted.
+    The token is a query parameter, because browsers
+    can not set headers of a websocket.
+    :param websocket: Websocket of the client.
+    :param event_id: ID of an event.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: None
+    """
+    try:
+        team_id = await run_in_threadpool(get_event_team_id, event_id, session)
+        if team_id is None:
+            raise NotFoundException(TYPE, data_id=event_id)
+        is_team_member_or_admin(team_id, token)
+    except HTTPException as ex:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=ex.detail)
+        return
+
+    await websocket.accept()
+    async with get_broker().subscribe(event_channel(event_id)) as messages:
+        snapshot = await run_in_threadpool(get_live_snapshot, event_id, session)
+        await websocket.send_json(snapshot)
+
+        async def forward():
+            async for message in messages:
+                if message == RESYNC:
+                    message = await run_in_threadpool(
+                        get_live_snapshot, event_id, session
+                    )
+                await websocket.send_json(message)
+                if message["type"] == "event_delete":
+                    await websocket.close()
+                    return
+
+        forward_task = asyncio.create_task(forward())
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            forward_task.cancel()
+
+
 @router.get("s/{season_id}")
 def get_events_by_seasons(
     season_id: int, session: Session = Depends(get_session)
@@ -122,10 +335,15 @@ def create_event(event_data: dict, session: Session = Depends(get_session)) -> E
     except Exception as ex:
         raise InvalidException("event_date") from ex
 
+    season_id = event_data.get("season_id")
+    if season_id is not None and not session.get(Season, season_id):
+        raise NotFoundException("SEASON", data_id=season_id)
+
     event = Event(**event_data)
     session.add(event)
     session.commit()
     session.refresh(event)
+    NEXT_EVENT_CACHE.clear()
     return event
 
 
@@ -158,6 +376,7 @@ def create_event_recursive(
         session.refresh(event)
         events.append(event)
         event_data["event_date"] = event_data["event_date"] + timedelta(weeks=1)
+    NEXT_EVENT_CACHE.clear()
     return events
 
 
@@ -180,11 +399,51 @@ def delete_event(
     if not event:
         raise NotFoundException(TYPE, data_id=event_id)
 
+    track_event(session, event.id, event.season_id, -1)
+    # The database deletes the bring beer of the event.
+    team_id = event.season.team_id if event.season else None
+    add_tombstones(session, BringBeer, team_id, BringBeer.event_id == event_id)
+    add_tombstone(session, Event, event_id, team_id)
     session.delete(event)
     session.commit()
+    NEXT_EVENT_CACHE.clear()
+    publish_event(event_id, event_deleted(event_id))
     return {"ok": True}
 
 
+@router.patch("/bulk")
+def update_events(
+    patches: list[BulkPatch], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Updates many events with one UPDATE per group of equal changes in one
+    transaction. Moves the statistics of events that change the season.
+    :param patches: ID and changes of every event.
+    :param session: DB session.
+    :return: IDs of the updated events.
+    """
+    groups = group_changes(Event, EventUpdate, patches, TYPE)
+    ids = [patch.id for patch in patches]
+    check_ids(session, Event, ids, TYPE)
+
+    new_seasons = {
+        event_id: dict(changes)["season_id"]
+        for changes, event_ids in groups.items()
+        if "season_id" in dict(changes)
+        for event_id in event_ids
+    }
+    statement = select(Event.id, Event.season_id).where(Event.id.in_(new_seasons))
+    for event_id, season_id in session.exec(statement).all():
+        if new_seasons[event_id] != season_id:
+            track_event(session, event_id, season_id, -1)
+            track_event(session, event_id, new_seasons[event_id], 1)
+
+    apply_changes(session, Event, groups, TYPE)
+    session.commit()
+    NEXT_EVENT_CACHE.clear()
+    return {"updated": ids}
+
+
 @router.patch("/{event_id}")
 def update_event(
     event_id: int, event: Event, session: Session = Depends(get_session)
@@ -201,7 +460,11 @@ def update_event(
         raise NotFoundException(TYPE, data_id=event_id)
 
     event_data = event.model_dump(exclude_unset=True)
+    if event_data.get("season_id", event_db.season_id) != event_db.season_id:
+        track_event(session, event_id, event_db.season_id, -1)
+        track_event(session, event_id, event_data["season_id"], 1)
     event_db.sqlmodel_update(event_data)
     session.commit()
     session.refresh(event_db)
+    NEXT_EVENT_CACHE.clear()
     return event_db
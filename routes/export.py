@@ -0,0 +1,177 @@
+"""
+Created by Fabian Gnatzig
+Description: Streaming exports for the read routes.
+"""
+
+import csv
+import io
+import json
+from typing import TYPE_CHECKING, Iterator
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Connection, Engine
+from sqlmodel import Session
+from sqlmodel.sql.expression import Select
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pyarrow
+
+EXPORT_BATCH_SIZE = 1000
+
+# The session of the request is closed before the body is streamed, so every
+# stream opens its own session on the bind of the request session. Its
+# connection is released when the stream ends or the client disconnects.
+
+
+def iter_ndjson(bind: Engine | Connection, statement: Select) -> Iterator[str]:
+    """
+    Fetches the rows with a server-side cursor and converts them to NDJSON.
+    Only one batch of rows is held in memory at a time.
+    :param bind: Engine or connection of the request session.
+    :param statement: Select statement of columns.
+    :return: Iterator of NDJSON batches.
+    """
+    statement = statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+    with Session(bind) as session:
+        for rows in session.exec(statement).partitions():
+            yield "".join(
+                json.dumps(row._asdict(), default=str) + "\n"  # pylint: disable=W0212
+                for row in rows
+            )
+
+
+def ndjson_response(bind: Engine | Connection, statement: Select) -> StreamingResponse:
+    """
+    Creates a streaming NDJSON response of a select statement.
+    :param bind: Engine or connection of the request session.
+    :param statement: Select statement of columns.
+    :return: Streaming response.
+    """
+    return StreamingResponse(
+        iter_ndjson(bind, statement), media_type="application/x-ndjson"
+    )
+
+
+def iter_csv(bind: Engine | Connection, statement: Select) -> Iterator[str]:
+    """
+    Fetches the rows with a server-side cursor and converts them to CSV.
+    :param bind: Engine or connection of the request session.
+    :param statement: Select statement of columns.
+    :return: Iterator of CSV batches, starting with the header.
+    """
+    statement = statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+    with Session(bind) as session:
+        result = session.exec(statement)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(result.keys())
+        for rows in result.partitions():
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(
+    bind: Engine | Connection, statement: Select, filename: str
+) -> StreamingResponse:
+    """
+    Creates a streaming CSV response of a select statement.
+    :param bind: Engine or connection of the request session.
+    :param statement: Select statement of columns.
+    :param filename: Name of the downloaded file.
+    :return: Streaming response.
+    """
+    return StreamingResponse(
+        iter_csv(bind, statement),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Writable file object that collects the written bytes until they are taken.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self) -> bool:
+        """
+        Marks the sink as writable.
+        :return: True
+        """
+        return True
+
+    def write(self, data) -> int:
+        """
+        Collects the written bytes.
+        :param data: Written bytes.
+        :return: Number of written bytes.
+        """
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        """
+        Returns and removes the collected bytes.
+        :return: Collected bytes.
+        """
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet(
+    bind: Engine | Connection, statement: Select, schema: "pyarrow.Schema"
+) -> Iterator[bytes]:
+    """
+    Fetches the rows with a server-side cursor and writes a row group per batch.
+    :param bind: Engine or connection of the request session.
+    :param statement: Select statement of columns.
+    :param schema: Arrow schema of the selected columns.
+    :return: Iterator of the bytes of the parquet file.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pyarrow
+    from pyarrow import parquet
+
+    statement = statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+    sink = ChunkSink()
+    with Session(bind) as session, parquet.ParquetWriter(sink, schema) as writer:
+        for rows in session.exec(statement).partitions():
+            data = dict(zip(schema.names, zip(*rows)))
+            writer.write_table(pyarrow.Table.from_pydict(data, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def parquet_response(
+    bind: Engine | Connection,
+    statement: Select,
+    column_types: list[tuple[str, str]],
+    filename: str,
+) -> StreamingResponse:
+    """
+    Creates a streaming parquet response of a select statement.
+    pyarrow is imported on the first call, so the other routes do not pay for it.
+    :param bind: Engine or connection of the request session.
+    :param statement: Select statement of columns.
+    :param column_types: Names and arrow type aliases of the selected columns.
+    :param filename: Name of the downloaded file.
+    :return: Streaming response.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pyarrow
+
+    schema = pyarrow.schema(
+        [(name, pyarrow.type_for_alias(alias)) for name, alias in column_types]
+    )
+    return StreamingResponse(
+        iter_parquet(bind, statement, schema),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
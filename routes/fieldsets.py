@@ -0,0 +1,113 @@
+"""
+Created by Fabian Gnatzig
+Description: Sparse fieldsets and relationship expansion for the read routes.
+"""
+
+from typing import Annotated
+
+from fastapi import Query
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, selectinload
+from sqlmodel import SQLModel
+
+from exceptions import InvalidException
+
+FieldsQuery = Annotated[
+    str | None, Query(description="Comma separated columns to return.")
+]
+IncludeQuery = Annotated[
+    str | None, Query(description="Comma separated relationships to expand.")
+]
+
+
+def split_names(value: str, allowed: list[str], type_name: str) -> list[str]:
+    """
+    Splits a comma separated query parameter and validates the names.
+    :param value: Value of the query parameter.
+    :param allowed: Allowed names.
+    :param type_name: Name of the query parameter for the exception.
+    :return: List of names.
+    """
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if any(name not in allowed for name in names):
+        raise InvalidException(type_name)
+    return names
+
+
+def get_columns(model: type[SQLModel], fields: str | None) -> list[str] | None:
+    """
+    Gets the requested columns of a model.
+    :param model: Table class.
+    :param fields: Comma separated column names or None for all columns.
+    :return: List of column names or None for all columns.
+    """
+    if fields is None:
+        return None
+    return split_names(fields, list(inspect(model).columns.keys()), "fields")
+
+
+def get_relations(
+    model: type[SQLModel], include: str | None, default: list[str]
+) -> list[str]:
+    """
+    Gets the relationships of a model to expand.
+    :param model: Table class.
+    :param include: Comma separated relationship names or None for the default.
+    :param default: Relationships that are expanded if include is not set.
+    :return: List of relationship names.
+    """
+    if include is None:
+        return default
+    return split_names(include, list(inspect(model).relationships.keys()), "include")
+
+
+def get_load_options(
+    model: type[SQLModel], columns: list[str] | None, relations: list[str]
+) -> list:
+    """
+    Creates loader options that only load the requested columns and relationships.
+    :param model: Table class.
+    :param columns: Column names or None for all columns.
+    :param relations: Relationship names.
+    :return: List of loader options.
+    """
+    options = [selectinload(getattr(model, relation)) for relation in relations]
+    if columns is not None:
+        mapper = inspect(model)
+        needed = set(columns)
+        for relation in relations:
+            needed.update(
+                column.key for column in mapper.relationships[relation].local_columns
+            )
+        options.append(load_only(*[getattr(model, column) for column in needed]))
+    return options
+
+
+def get_fields_json(instance: SQLModel, columns: list[str] | None) -> dict:
+    """
+    Converts the instance to dict with only the requested columns.
+    :param instance: Table instance.
+    :param columns: Column names or None for all columns.
+    :return: Dictionary of the instance.
+    """
+    if columns is None:
+        return instance.model_dump()
+    return {column: getattr(instance, column) for column in columns}
+
+
+def get_relations_json(instance: SQLModel, relations: list[str]) -> dict:
+    """
+    Converts the expanded relationships of an instance to dict.
+    Empty relationships are left out.
+    :param instance: Table instance.
+    :param relations: Relationship names.
+    :return: Dictionary of the relationships.
+    """
+    relations_json = {}
+    for relation in relations:
+        value = getattr(instance, relation)
+        if isinstance(value, list) and value:
+            relations_json[relation] = [item.model_dump() for item in value]
+        elif value:
+            relations_json[relation] = value.model_dump()
+    return relations_json
@@ -0,0 +1,159 @@
+"""
+Created by Fabian Gnatzig
+Description: Publish and subscribe of live changes.
+"""
+
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+RESYNC = {"type": "resync"}
+
+
+class Broker(ABC):
+    """
+    Interface of a broker, which delivers the published messages of a channel to
+    all subscribers of the channel. A broker for several workers (e.g. Redis)
+    implements the same two methods and is set with set_broker.
+    """
+
+    @abstractmethod
+    def publish(self, channel: str, message: dict):
+        """
+        Publishes a message to all subscribers of a channel. Is called from the
+        sync routes after the commit, so it must not block.
+        :param channel: Name of the channel.
+        :param message: JSON serializable message.
+        :return: None
+        """
+
+    @abstractmethod
+    def subscribe(self, channel: str):
+        """
+        Subscribes to a channel for the time of the context.
+        :param channel: Name of the channel.
+        :return: Async context manager of an async iterator of the messages.
+        """
+
+
+class LocalBroker(Broker):
+    """
+    Broker of the subscribers of one worker. Every subscriber has a bounded
+    queue. If a subscriber is too slow, its queue is replaced by RESYNC, so it
+    reloads the state instead of missing single changes.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        """
+        :param max_queue: Maximum messages waiting per subscriber.
+        """
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.subscribers: dict[str, set] = defaultdict(set)
+
+    def publish(self, channel: str, message: dict):
+        """
+        Publishes a message to all subscribers of a channel of this worker.
+        :param channel: Name of the channel.
+        :param message: JSON serializable message.
+        :return: None
+        """
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self.put, queue, message)
+            except RuntimeError:  # pragma: no cover
+                # The loop of the subscriber is already closed.
+                pass
+
+    def put(self, queue: asyncio.Queue, message: dict):
+        """
+        Puts a message into the queue of a subscriber or RESYNC if it is full.
+        :param queue: Queue of the subscriber.
+        :param message: Message to put.
+        :return: None
+        """
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            message = RESYNC
+        queue.put_nowait(message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[AsyncIterator[dict]]:
+        """
+        Subscribes to a channel for the time of the context.
+        :param channel: Name of the channel.
+        :return: Async iterator of the messages.
+        """
+        queue = asyncio.Queue(self.max_queue)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self.lock:
+            self.subscribers[channel].add(subscriber)
+
+        async def messages():
+            while True:
+                yield await queue.get()
+
+        try:
+            yield messages()
+        finally:
+            with self.lock:
+                self.subscribers[channel].discard(subscriber)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+
+
+LIVE_BROKER: Broker = LocalBroker()
+
+
+def set_broker(broker: Broker):
+    """
+    Replaces the broker of the live changes.
+    :param broker: New broker.
+    :return: None
+    """
+    global LIVE_BROKER  # pylint: disable=global-statement
+    LIVE_BROKER = broker
+
+
+def get_broker() -> Broker:
+    """
+    Returns the broker of the live changes.
+    :return: Current broker.
+    """
+    return LIVE_BROKER
+
+
+def event_channel(event_id: int) -> str:
+    """
+    Name of the channel of the changes of an event.
+    :param event_id: ID of the event.
+    :return: Name of the channel.
+    """
+    return f"event:{event_id}"
+
+
+def publish_event(event_id: int | None, message: dict):
+    """
+    Publishes a change to the subscribers of an event.
+    :param event_id: ID of the event, nothing is published without event.
+    :param message: Change of the event.
+    :return: None
+    """
+    if event_id is not None:
+        get_broker().publish(event_channel(event_id), message)
+
+
+def event_deleted(event_id: int) -> dict:
+    """
+    Message of a deleted event, after which the subscribers are closed.
+    :param event_id: ID of the event.
+    :return: Delete message of the event.
+    """
+    return {"type": "event_delete", "id": event_id}
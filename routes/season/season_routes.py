@@ -3,31 +3,82 @@ Created by Fabian Gnatzig
 Description: HTTP routes of season.
 """
 
+from collections import defaultdict
+from datetime import date
 from typing import Annotated
 
 from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, func, select
 
-from auth.auth_methods import is_admin, get_team_id
+from auth.auth_methods import (
+    is_admin,
+    is_admin_or_manager,
+    get_team_id,
+    is_team_member_or_admin,
+)
 from dependencies import get_session, oauth2_scheme
-from exceptions import NotFoundException, IncompleteException, InvalidRoleException
+from exceptions import (
+    ConflictException,
+    NotFoundException,
+    IncompleteException,
+    InvalidRoleException,
+)
+from models.beer_models import Beer, BringBeer
+from models.brewery_models import Brewery
+from models.event_models import Event
 from models.season_models import Season, SeasonUpdate
+from models.team_models import Team
+from models.user_models import User
+from routes.bulk import BulkPatch, bulk_update
+from routes.cache import NEXT_EVENT_CACHE
+from routes.export import csv_response, parquet_response
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.live import event_deleted, publish_event
+from routes.stats.stats_routes import add_stats
+from routes.sync import add_tombstones
+from routes.team.team_routes import get_open_fines
 
 router = APIRouter(prefix="/season", tags=["Season"])
 TYPE = "SEASON"
 
+REPORT_COLUMNS = [
+    ("event_date", "date32"),
+    ("event", "string"),
+    ("user", "string"),
+    ("beer", "string"),
+    ("brewery", "string"),
+    ("volume", "double"),
+    ("alcohol", "double"),
+    ("done", "bool"),
+]
+
 
 @router.get("/all")
 def read_all_seasons(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
 ) -> list:
     """
     Reads all season instances.
     :param session: DB session.
     :param token: User jwt-token.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: List of all seasons.
     """
+    columns = get_columns(Season, fields)
+    relations = get_relations(Season, include, ["team"])
     try:
         is_admin(token)
         statement = select(Season)
@@ -35,33 +86,38 @@ def read_all_seasons(
         team_id = get_team_id(token)
         statement = select(Season).where(Season.team_id == team_id)
 
-    seasons_data = session.exec(statement).all()
-    seasons = []
-    for season in seasons_data:
-        season_data = season.model_dump()
-        if season.team:
-            season_data.update({"team": season.team.model_dump()})
-        seasons.append(season_data)
-    return seasons
+    statement = statement.options(*get_load_options(Season, columns, relations))
+    return [
+        get_fields_json(season, columns) | get_relations_json(season, relations)
+        for season in session.exec(statement).all()
+    ]
 
 
 @router.get("/{season_id}")
-def get_season_id(season_id: int, session: Session = Depends(get_session)) -> dict:
+def get_season_id(
+    season_id: int,
+    session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+) -> dict:
     """
     Searches for a season with ID.
     :param season_id: ID of a season to search for.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with season and team.
     """
-    season = session.get(Season, season_id)
+    columns = get_columns(Season, fields)
+    relations = get_relations(Season, include, ["team", "events"])
+    season = session.get(
+        Season, season_id, options=get_load_options(Season, columns, relations)
+    )
     if not season:
         raise NotFoundException(TYPE, data_id=season_id)
 
-    season_json = season.model_dump()
-    if season.team:
-        season_json.update({"team": season.team.model_dump()})
-    if season.events:
-        season_json.update({"events": season.events})
+    season_json = get_fields_json(season, columns)
+    season_json.update(get_relations_json(season, relations))
     return season_json
 
 
@@ -97,6 +153,8 @@ def create_season(season: Season, session: Session = Depends(get_session)) -> Se
     """
     if not (season.name and season.team_id):
         raise IncompleteException(TYPE)
+    if not session.get(Team, season.team_id):
+        raise NotFoundException("TEAM", data_id=season.team_id)
 
     session.add(season)
     session.commit()
@@ -123,11 +181,35 @@ def delete_season(
     if not season:
         raise NotFoundException(TYPE, data_id=season_id)
 
+    # The database deletes the events, their bring beer and the statistics.
+    events = select(Event.id).where(Event.season_id == season_id)
+    event_ids = session.exec(events).all()
+    add_tombstones(session, BringBeer, season.team_id, BringBeer.event_id.in_(events))
+    add_tombstones(session, Event, season.team_id, Event.season_id == season_id)
     session.delete(season)
     session.commit()
+    NEXT_EVENT_CACHE.clear()
+    for event_id in event_ids:
+        publish_event(event_id, event_deleted(event_id))
     return {"ok": True}
 
 
+@router.patch("/bulk")
+def update_seasons(
+    patches: list[BulkPatch], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Updates many seasons with one UPDATE per group of equal changes in one
+    transaction.
+    :param patches: ID and changes of every season.
+    :param session: DB session.
+    :return: IDs of the updated seasons.
+    """
+    updated = bulk_update(session, Season, SeasonUpdate, patches, TYPE)
+    NEXT_EVENT_CACHE.clear()
+    return updated
+
+
 @router.patch("/{season_id}")
 def update_season(
     season_id: int, season: SeasonUpdate, session: Session = Depends(get_session)
@@ -147,4 +229,226 @@ def update_season(
     season_db.sqlmodel_update(season_data)
     session.commit()
     session.refresh(season_db)
+    NEXT_EVENT_CACHE.clear()
     return season_db
+
+
+@router.get("/{season_id}/report.csv")
+def read_season_report_csv(
+    season_id: int,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> StreamingResponse:
+    """
+    Streams the season report as CSV with one row per bring beer.
+    :param season_id: ID of the season.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: Streaming CSV response.
+    """
+    statement = get_report_statement(season_id, token, session)
+    return csv_response(session.get_bind(), statement, f"season_{season_id}_report.csv")
+
+
+@router.get("/{season_id}/report.parquet")
+def read_season_report_parquet(
+    season_id: int,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> StreamingResponse:
+    """
+    Streams the season report as parquet with one row per bring beer.
+    :param season_id: ID of the season.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: Streaming parquet response.
+    """
+    statement = get_report_statement(season_id, token, session)
+    return parquet_response(
+        session.get_bind(),
+        statement,
+        REPORT_COLUMNS,
+        f"season_{season_id}_report.parquet",
+    )
+
+
+def get_report_statement(season_id: int, token: str, session: Session):
+    """
+    Checks the access to the season and creates the joined report query.
+    :param season_id: ID of the season.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: Select statement with the columns of REPORT_COLUMNS.
+    """
+    team_id = session.exec(select(Season.team_id).where(Season.id == season_id)).first()
+    if not team_id:
+        raise NotFoundException(TYPE, data_id=season_id)
+
+    is_team_member_or_admin(team_id, token)
+
+    return (
+        select(
+            Event.event_date,
+            Event.name.label("event"),
+            (User.first_name + " " + User.last_name).label("user"),
+            Beer.name.label("beer"),
+            Brewery.name.label("brewery"),
+            Beer.volume,
+            Beer.alcohol,
+            BringBeer.done,
+        )
+        .select_from(BringBeer)
+        .join(Event, BringBeer.event_id == Event.id)
+        .outerjoin(User, BringBeer.user_id == User.id)
+        .outerjoin(Beer, BringBeer.beer_id == Beer.id)
+        .outerjoin(Brewery, Beer.brewery_id == Brewery.id)
+        .where(Event.season_id == season_id)
+        .order_by(Event.event_date, BringBeer.id)
+    )
+
+
+@router.post("/{season_id}/schedule_fines")
+def schedule_open_fines(
+    season_id: int,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+    dry_run: bool = False,
+) -> dict:
+    """
+    Distributes all open fines of the team over the upcoming events of the season
+    and creates the bring beer in one transaction.
+    :param season_id: ID of the season.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :param dry_run: Only returns the plan without creating bring beer.
+    :return: Planned or created assignments.
+    """
+    is_admin_or_manager(token)
+
+    season = session.get(Season, season_id)
+    if not season:
+        raise NotFoundException(TYPE, data_id=season_id)
+    is_team_member_or_admin(season.team_id, token)
+    if not dry_run:
+        lock_team(session, season.team_id)
+
+    statement = (
+        select(Event)
+        .where(Event.season_id == season_id, Event.event_date >= date.today())
+        .order_by(Event.event_date, Event.id)
+    )
+    events = session.exec(statement).all()
+
+    statement = (
+        select(BringBeer.event_id, func.count(BringBeer.id))
+        .where(BringBeer.event_id.in_([event.id for event in events]))
+        .group_by(BringBeer.event_id)
+    )
+    loads = dict(session.exec(statement).all())
+
+    fines = get_open_fines(season.team_id, session, for_update=not dry_run)
+    assignments = [
+        fine | {"event_id": event.id, "event_date": event.event_date}
+        for fine, event in plan_fines(fines, events, loads)
+    ]
+
+    if not dry_run and assignments:
+        bring_beers = [
+            BringBeer(
+                event_id=assignment["event_id"],
+                user_id=assignment["user_id"],
+                user_beer_id=assignment["user_beer_id"],
+            )
+            for assignment in assignments
+        ]
+        session.add_all(bring_beers)
+        session.flush()
+        if has_linked_fines(session, [bring_beer.id for bring_beer in bring_beers]):
+            session.rollback()
+            raise ConflictException("fines")
+        # The messages are read before the commit expires the bring beer.
+        messages = [
+            (bring_beer.event_id, bring_beer.model_dump(mode="json"))
+            for bring_beer in bring_beers
+        ]
+
+        fines_per_user = defaultdict(int)
+        for assignment in assignments:
+            fines_per_user[assignment["user_id"]] += 1
+        for user_id, amount in fines_per_user.items():
+            add_stats(session, season_id, user_id, brought=amount, done=0, fines=amount)
+
+        session.commit()
+        NEXT_EVENT_CACHE.clear()
+        for event_id, bring_beer in messages:
+            publish_event(event_id, {"type": "create", "bring_beer": bring_beer})
+
+    return {
+        "dry_run": dry_run,
+        "assignments": assignments,
+        "unassigned": len(fines) - len(assignments),
+    }
+
+
+def lock_team(session: Session, team_id: int):
+    """
+    Locks a team until the end of the transaction, so concurrent schedules of
+    its fines wait and then read the fines the first one linked.
+    :param session: DB session.
+    :param team_id: ID of the team.
+    :return: None
+    """
+    session.exec(select(Team.id).where(Team.id == team_id).with_for_update())
+
+
+def has_linked_fines(session: Session, bring_beer_ids: list[int]) -> bool:
+    """
+    Checks after the insert, if another bring beer links one of the fines of the
+    new bring beer. SQLite does not lock rows, but a schedule committed in
+    between is visible once the insert has the write lock of the database.
+    :param session: DB session.
+    :param bring_beer_ids: IDs of the new bring beer.
+    :return: True if a fine is linked twice.
+    """
+    fines = select(BringBeer.user_beer_id).where(BringBeer.id.in_(bring_beer_ids))
+    statement = select(BringBeer.id).where(
+        BringBeer.user_beer_id.in_(fines), BringBeer.id.not_in(bring_beer_ids)
+    )
+    return session.exec(statement.limit(1)).first() is not None
+
+
+def plan_fines(fines: list[dict], events: list[Event], loads: dict) -> list[tuple]:
+    """
+    Plans the open fines round-robin. The users with the most open fines come
+    first. Every fine goes to the event where the user has the fewest fines,
+    then to the event with the fewest bring beer and then to the earliest event.
+    :param fines: Open fines ordered by ID.
+    :param events: Upcoming events ordered by date.
+    :param loads: Number of bring beer per event ID.
+    :return: List of fine and event pairs.
+    """
+    if not events:
+        return []
+
+    fines_per_user = defaultdict(list)
+    for fine in fines:
+        fines_per_user[fine["user_id"]].append(fine)
+    queues = sorted(fines_per_user.values(), key=lambda queue: -len(queue))
+
+    event_loads = [loads.get(event.id, 0) for event in events]
+    user_loads = defaultdict(lambda: [0] * len(events))
+    plan = []
+    for turn in range(max(map(len, queues), default=0)):
+        for queue in queues:
+            if turn >= len(queue):
+                continue
+
+            fine = queue[turn]
+            user_load = user_loads[fine["user_id"]]
+            _, _, index = min(
+                (user_load[i], event_loads[i], i) for i in range(len(events))
+            )
+            user_load[index] += 1
+            event_loads[index] += 1
+            plan.append((fine, events[index]))
+    return plan
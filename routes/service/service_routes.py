@@ -7,9 +7,11 @@ import json
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
 from sqlmodel import Session, select
 
-from dependencies import get_session
+from auth.rate_limit import get_metrics_text
+from dependencies import get_primary_session, get_session
 from models.beer_models import BringBeer, UserBeer, Beer
 from models.brewery_models import Brewery
 from models.user_models import User
@@ -86,7 +88,7 @@ def read_number_beer(session: Session = Depends(get_session)) -> list[dict]:
 
 
 @router.get("/check_birthday")
-def check_birthday(session: Session = Depends(get_session)) -> bool | None:
+def check_birthday(session: Session = Depends(get_primary_session)) -> bool | None:
     """
     Checks if a user has birthday and create an uer_beer.
     :param session: DB session.
@@ -106,7 +108,7 @@ def check_birthday(session: Session = Depends(get_session)) -> bool | None:
 
 
 @router.get("/setup")
-def setup_brewery_and_beer(session: Session = Depends(get_session)):
+def setup_brewery_and_beer(session: Session = Depends(get_primary_session)):
     """
     Creates brewery and beer from data.
     :param session: DB session.
@@ -146,3 +148,12 @@ def setup_brewery(session: Session):
                 read_brewery_name(brewery_data["name"], session)
             except HTTPException:
                 create_brewery(Brewery(**brewery_data), session)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics() -> str:
+    """
+    Reads the metrics of this worker in the Prometheus text format.
+    :return: Metrics as text.
+    """
+    return get_metrics_text()
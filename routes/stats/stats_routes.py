@@ -0,0 +1,271 @@
+"""
+Created by Fabian Gnatzig
+Description: HTTP routes and maintenance of the season statistics.
+"""
+
+from collections import defaultdict
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlmodel import Session, case, delete, func, insert, select
+
+from auth.auth_methods import is_admin
+from dependencies import get_session, oauth2_scheme
+from models.beer_models import BringBeer
+from models.event_models import Event
+from models.season_models import Season
+from models.stats_models import UserSeasonStats
+from models.user_models import User
+
+router = APIRouter(prefix="/stats", tags=["Statistics"])
+
+
+def upsert_stats(dialect: str, values: dict):
+    """
+    Creates an upsert of the statistics of a user in a season, which adds the
+    deltas to an existing row. A single statement, so two concurrent first
+    writes of the same user and season do not both insert.
+    :param dialect: Name of the SQL dialect.
+    :param values: Season, user and deltas of the statistics.
+    :return: Insert statement of the dialect.
+    """
+    counters = ["brought", "done", "fines"]
+    if dialect == "mysql":
+        statement = mysql.insert(UserSeasonStats).values(values)
+        return statement.on_duplicate_key_update(
+            {
+                name: getattr(UserSeasonStats, name) + statement.inserted[name]
+                for name in counters
+            }
+        )
+
+    insert_dialect = postgresql if dialect == "postgresql" else sqlite
+    statement = insert_dialect.insert(UserSeasonStats).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=[UserSeasonStats.season_id, UserSeasonStats.user_id],
+        set_={
+            name: getattr(UserSeasonStats, name) + statement.excluded[name]
+            for name in counters
+        },
+    )
+
+
+def add_stats(
+    session: Session,
+    season_id: int,
+    user_id: int,
+    brought: int,
+    done: int,
+    fines: int,
+):
+    """
+    Adds the deltas to the statistics of a user in a season. Does not commit,
+    so the change is part of the transaction of the calling route.
+    :param session: DB session.
+    :param season_id: ID of the season.
+    :param user_id: ID of the user.
+    :param brought: Delta of brought beer.
+    :param done: Delta of done beer.
+    :param fines: Delta of fines.
+    :return: None
+    """
+    values = {
+        "season_id": season_id,
+        "user_id": user_id,
+        "brought": brought,
+        "done": done,
+        "fines": fines,
+    }
+    session.exec(upsert_stats(session.get_bind().dialect.name, values))
+
+
+def track_bring_beer(session: Session, bring_beer: BringBeer, sign: int):
+    """
+    Adds (sign=1) or removes (sign=-1) a bring beer from the statistics.
+    :param session: DB session.
+    :param bring_beer: Bring beer instance.
+    :param sign: 1 to add or -1 to remove the bring beer.
+    :return: None
+    """
+    if not (bring_beer.user_id and bring_beer.event_id):
+        return
+
+    statement = select(Event.season_id).where(Event.id == bring_beer.event_id)
+    season_id = session.exec(statement).first()
+    if not season_id:
+        return
+
+    add_stats(
+        session,
+        season_id,
+        bring_beer.user_id,
+        brought=sign,
+        done=sign if bring_beer.done else 0,
+        fines=sign if bring_beer.user_beer_id else 0,
+    )
+
+
+def track_bring_beers(session: Session, bring_beers: list, sign: int):
+    """
+    Adds (sign=1) or removes (sign=-1) many bring beer from the statistics with
+    one query for the seasons of their events.
+    :param session: DB session.
+    :param bring_beers: Bring beer instances.
+    :param sign: 1 to add or -1 to remove the bring beer.
+    :return: None
+    """
+    event_ids = {bring_beer.event_id for bring_beer in bring_beers}
+    statement = select(Event.id, Event.season_id).where(Event.id.in_(event_ids))
+    seasons = dict(session.exec(statement).all())
+
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for bring_beer in bring_beers:
+        if bring_beer.user_id and bring_beer.event_id in seasons:
+            delta = deltas[seasons[bring_beer.event_id], bring_beer.user_id]
+            delta[0] += sign
+            delta[1] += sign if bring_beer.done else 0
+            delta[2] += sign if bring_beer.user_beer_id else 0
+
+    for (season_id, user_id), (brought, done, fines) in deltas.items():
+        add_stats(session, season_id, user_id, brought=brought, done=done, fines=fines)
+
+
+def track_done(session: Session, bring_beers: list):
+    """
+    Adds many bring beer, which were set to done, to the done statistics with one
+    query for the seasons of their events.
+    :param session: DB session.
+    :param bring_beers: Rows with event_id and user_id of the changed bring beer.
+    :return: None
+    """
+    event_ids = {bring_beer.event_id for bring_beer in bring_beers}
+    statement = select(Event.id, Event.season_id).where(Event.id.in_(event_ids))
+    seasons = dict(session.exec(statement).all())
+
+    deltas = defaultdict(int)
+    for bring_beer in bring_beers:
+        if bring_beer.user_id and bring_beer.event_id in seasons:
+            deltas[seasons[bring_beer.event_id], bring_beer.user_id] += 1
+
+    for (season_id, user_id), done in deltas.items():
+        add_stats(session, season_id, user_id, brought=0, done=done, fines=0)
+
+
+def track_event(session: Session, event_id: int, season_id: int, sign: int):
+    """
+    Adds (sign=1) or removes (sign=-1) all bring beer of an event from the
+    statistics of a season.
+    :param session: DB session.
+    :param event_id: ID of the event.
+    :param season_id: ID of the season the event belongs to.
+    :param sign: 1 to add or -1 to remove the bring beer.
+    :return: None
+    """
+    statement = (
+        select(
+            BringBeer.user_id,
+            func.count(BringBeer.id),
+            func.sum(case((BringBeer.done, 1), else_=0)),
+            func.count(BringBeer.user_beer_id),
+        )
+        .where(BringBeer.event_id == event_id, BringBeer.user_id != None)  # noqa: E711
+        .group_by(BringBeer.user_id)
+    )
+    for user_id, brought, done, fines in session.exec(statement).all():
+        add_stats(
+            session,
+            season_id,
+            user_id,
+            brought=sign * brought,
+            done=sign * done,
+            fines=sign * fines,
+        )
+
+
+def rebuild_stats(session: Session) -> int:
+    """
+    Recomputes all statistics from the bring beer.
+    :param session: DB session.
+    :return: Number of statistic rows.
+    """
+    source = (
+        select(
+            Event.season_id,
+            BringBeer.user_id,
+            func.count(BringBeer.id),
+            func.sum(case((BringBeer.done, 1), else_=0)),
+            func.count(BringBeer.user_beer_id),
+        )
+        .join(Event, BringBeer.event_id == Event.id)
+        .join(Season, Event.season_id == Season.id)
+        .join(User, BringBeer.user_id == User.id)
+        .group_by(Event.season_id, BringBeer.user_id)
+    )
+    session.exec(delete(UserSeasonStats))
+    session.exec(
+        insert(UserSeasonStats).from_select(
+            ["season_id", "user_id", "brought", "done", "fines"], source
+        )
+    )
+    session.commit()
+    return session.exec(select(func.count()).select_from(UserSeasonStats)).one()
+
+
+def get_stats_json(stats: UserSeasonStats) -> dict:
+    """
+    Converts the statistics to dict and adds the completion rate.
+    :param stats: Statistics of a user in a season.
+    :return: Dictionary with the statistics.
+    """
+    stats_json = stats.model_dump()
+    stats_json["completion_rate"] = stats.done / stats.brought if stats.brought else 0.0
+    return stats_json
+
+
+@router.get("/{season_id}")
+def read_season_stats(season_id: int, session: Session = Depends(get_session)) -> list:
+    """
+    Reads the statistics of all users with brought beer in a season.
+    :param season_id: ID of the season.
+    :param session: DB session.
+    :return: List with the statistics of every user.
+    """
+    statement = (
+        select(UserSeasonStats)
+        .where(UserSeasonStats.season_id == season_id, UserSeasonStats.brought > 0)
+        .order_by(UserSeasonStats.user_id)
+    )
+    return [get_stats_json(stats) for stats in session.exec(statement).all()]
+
+
+@router.get("/{season_id}/user/{user_id}")
+def read_user_season_stats(
+    season_id: int, user_id: int, session: Session = Depends(get_session)
+) -> dict:
+    """
+    Reads the statistics of a user in a season.
+    :param season_id: ID of the season.
+    :param user_id: ID of the user.
+    :param session: DB session.
+    :return: Dictionary with the statistics.
+    """
+    stats = session.get(UserSeasonStats, (season_id, user_id))
+    if not stats:
+        stats = UserSeasonStats(season_id=season_id, user_id=user_id)
+    return get_stats_json(stats)
+
+
+@router.post("/rebuild")
+def rebuild_all_stats(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> dict:
+    """
+    Recomputes all statistics from scratch.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: Number of statistic rows.
+    """
+    is_admin(token)
+    return {"rows": rebuild_stats(session)}
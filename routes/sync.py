@@ -0,0 +1,144 @@
+"""
+Created by Fabian Gnatzig
+Description: Delta sync of the read routes based on the change timestamps.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Annotated
+
+from fastapi import Query
+from sqlmodel import Session, SQLModel, insert, literal, select, update
+from sqlmodel.sql.expression import SelectOfScalar
+
+from models.sync_models import Tombstone, utcnow
+
+# updated_at is the time of the statement, not of the commit, so a transaction
+# committed after a sync can hold older changes. The next sync starts earlier.
+SYNC_MARGIN = timedelta(seconds=float(os.getenv("SYNC_MARGIN_SECONDS", "5")))
+
+SinceQuery = Annotated[
+    datetime | None,
+    Query(description="Only rows changed or deleted since this time (UTC)."),
+]
+
+
+def normalize_since(since: datetime) -> datetime:
+    """
+    Reads a time without timezone as UTC.
+    :param since: Time of the last sync.
+    :return: Timezone aware time.
+    """
+    if since.utcoffset() is None:
+        return since.replace(tzinfo=timezone.utc)
+    return since
+
+
+def changed_since(
+    statement: SelectOfScalar, model: type[SQLModel], since: datetime
+) -> SelectOfScalar:
+    """
+    Filters a select statement to the rows changed since a time.
+    :param statement: Select statement of the model.
+    :param model: Table class with updated_at.
+    :param since: Time of the last sync.
+    :return: Filtered select statement.
+    """
+    return statement.where(model.updated_at >= normalize_since(since))
+
+
+def add_tombstone(
+    session: Session, model: type[SQLModel], row_id: int, team_id: int | None
+):
+    """
+    Records a deleted row. Does not commit, so it is part of the transaction of
+    the delete.
+    :param session: DB session.
+    :param model: Table class of the deleted row.
+    :param row_id: ID of the deleted row.
+    :param team_id: ID of the team the row belonged to.
+    :return: None
+    """
+    session.add(
+        Tombstone(table_name=model.__tablename__, row_id=row_id, team_id=team_id)
+    )
+
+
+def add_tombstones(
+    session: Session, model: type[SQLModel], team_id: int | None, *conditions
+):
+    """
+    Records the rows the database deletes by the ON DELETE CASCADE of a deleted
+    parent with one INSERT ... SELECT. Must run before the parent is deleted.
+    :param session: DB session.
+    :param model: Table class of the children.
+    :param team_id: ID of the team the children belonged to.
+    :param conditions: Conditions of the children of the parent.
+    :return: None
+    """
+    columns = Tombstone.__table__.columns
+    rows = select(
+        literal(model.__tablename__),
+        model.id,
+        literal(team_id, columns.team_id.type),
+        literal(utcnow(), columns.deleted_at.type),
+    ).where(*conditions)
+    session.exec(
+        insert(Tombstone).from_select(
+            ["table_name", "row_id", "team_id", "deleted_at"], rows
+        )
+    )
+
+
+def clear_references(
+    session: Session, model: type[SQLModel], values: dict, *conditions
+):
+    """
+    Clears the foreign keys, which the ON DELETE SET NULL of a deleted parent
+    would clear inside the database, with an UPDATE, so updated_at of the rows
+    moves and the delta sync returns them. Must run before the parent is deleted.
+    :param session: DB session.
+    :param model: Table class of the children.
+    :param values: Cleared columns with None.
+    :param conditions: Conditions of the children of the parent.
+    :return: None
+    """
+    session.exec(update(model).where(*conditions).values(values))
+
+
+def get_sync_json(
+    session: Session,
+    model: type[SQLModel],
+    changed: list,
+    since: datetime,
+    team_id: int | None,
+    synced_at: datetime,
+) -> dict:
+    """
+    Creates the response of a delta sync. The next sync starts SYNC_MARGIN before
+    the start of this sync, so the clients get the changes of the slow
+    transactions, but must tolerate rows and IDs they already have.
+    :param session: DB session.
+    :param model: Table class of the rows.
+    :param changed: Changed rows as JSON.
+    :param since: Time of the last sync.
+    :param team_id: ID of the team of the user or None for all teams.
+    :param synced_at: Time the sync started.
+    :return: Changed rows, IDs of the deleted rows and the since of the next sync.
+    """
+    statement = select(Tombstone.row_id).where(
+        Tombstone.table_name == model.__tablename__,
+        Tombstone.deleted_at >= normalize_since(since),
+    )
+    if team_id is not None:
+        statement = statement.where(Tombstone.team_id == team_id)
+
+    # A changed row exists, e.g. a bring beer of a deleted user, which left
+    # the team but not the sync of all teams.
+    changed_ids = {row["id"] for row in changed if "id" in row}
+    deleted = session.exec(statement.order_by(Tombstone.row_id)).all()
+    return {
+        "changed": changed,
+        "deleted": [row_id for row_id in deleted if row_id not in changed_ids],
+        "synced_at": synced_at - SYNC_MARGIN,
+    }
@@ -3,16 +3,33 @@ Created by Fabian Gnatzig
 Description: HTTP Routes of team.
 """
 
-from typing import Annotated, Sequence
+from datetime import date
+from typing import Annotated
 
 from fastapi import APIRouter, Depends, Query
-from sqlmodel import Session, select
+from sqlmodel import Session, func, select
 
-from auth.auth_methods import is_admin
+from auth.auth_methods import is_admin, is_team_member_or_admin
 from dependencies import get_session, oauth2_scheme
 from exceptions import IncompleteException, NotFoundException
+from models.beer_models import BringBeer, UserBeer
+from models.event_models import Event
+from models.season_models import Season
 from models.team_models import Team, TeamUpdate
-from models.user_models import get_public_user
+from models.user_models import User, get_public_user
+from routes.bulk import BulkPatch, bulk_update
+from routes.cache import NEXT_EVENT_CACHE
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.live import event_deleted, publish_event
+from routes.sync import add_tombstones
 
 router = APIRouter(prefix="/team", tags=["Team"])
 TYPE = "TEAM"
@@ -23,17 +40,30 @@ def read_all_teams(
     session: Session = Depends(get_session),
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 100,
-) -> Sequence[Team]:
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+) -> list:
     """
     Reads all team instances.
     :param session: DB session.
     :param offset: Start offset.
     :param limit: Maximum query.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: List of all teams.
     """
-    statement = select(Team).offset(offset).limit(limit)
-    teams = session.exec(statement).all()
-    return teams
+    columns = get_columns(Team, fields)
+    relations = get_relations(Team, include, [])
+    statement = (
+        select(Team)
+        .options(*get_load_options(Team, columns, relations))
+        .offset(offset)
+        .limit(limit)
+    )
+    return [
+        get_team_json(team, columns, relations)
+        for team in session.exec(statement).all()
+    ]
 
 
 @router.post("/add")
@@ -54,26 +84,44 @@ def create_team(team: Team, session: Session = Depends(get_session)) -> Team:
 
 
 @router.get("/{team_id}")
-def read_team_id(team_id: int, session: Session = Depends(get_session)) -> dict:
+def read_team_id(
+    team_id: int,
+    session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+) -> dict:
     """
     Searches for a team with ID.
     :param team_id: ID of a team to search for.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with team and users.
     """
-    team = session.get(Team, team_id)
+    columns = get_columns(Team, fields)
+    relations = get_relations(Team, include, ["users", "seasons"])
+    team = session.get(
+        Team, team_id, options=get_load_options(Team, columns, relations)
+    )
 
     if not team:
         raise NotFoundException(TYPE, data_id=team_id)
 
-    team_json = team.model_dump()
-    if team.users:
-        public_users = []
-        for user in team.users:
-            public_users.append(get_public_user(user))
-        team_json.update({"users": public_users})
-    if team.seasons:
-        team_json.update({"seasons": team.seasons})
+    return get_team_json(team, columns, relations)
+
+
+def get_team_json(team: Team, columns: list[str] | None, relations: list[str]) -> dict:
+    """
+    Converts the team to dict. Users are converted to public users.
+    :param team: Team instance.
+    :param columns: Column names or None for all columns.
+    :param relations: Relationship names.
+    :return: Dictionary with team and the expanded relationships.
+    """
+    team_json = get_fields_json(team, columns)
+    team_json.update(get_relations_json(team, relations))
+    if "users" in team_json:
+        team_json["users"] = [get_public_user(user) for user in team.users]
     return team_json
 
 
@@ -121,11 +169,37 @@ def delete_team(
     if not team:
         raise NotFoundException(TYPE, data_id=team_id)
 
+    # The database deletes the users, seasons and everything below them.
+    users = select(User.id).where(User.team_id == team_id)
+    seasons = select(Season.id).where(Season.team_id == team_id)
+    events = select(Event.id).where(Event.season_id.in_(seasons))
+    event_ids = session.exec(events).all()
+    add_tombstones(session, BringBeer, team_id, BringBeer.event_id.in_(events))
+    add_tombstones(session, Event, team_id, Event.id.in_(events))
+    add_tombstones(session, UserBeer, team_id, UserBeer.user_id.in_(users))
+    add_tombstones(session, User, team_id, User.team_id == team_id)
     session.delete(team)
     session.commit()
+    NEXT_EVENT_CACHE.clear()
+    for event_id in event_ids:
+        publish_event(event_id, event_deleted(event_id))
     return {"ok": True}
 
 
+@router.patch("/bulk")
+def update_teams(
+    patches: list[BulkPatch], session: Session = Depends(get_session)
+) -> dict:
+    """
+    Updates many teams with one UPDATE per group of equal changes in one
+    transaction.
+    :param patches: ID and changes of every team.
+    :param session: DB session.
+    :return: IDs of the updated teams.
+    """
+    return bulk_update(session, Team, TeamUpdate, patches, TYPE)
+
+
 @router.patch("/{team_id}")
 def update_team(
     team_id: int, team: TeamUpdate, session: Session = Depends(get_session)
@@ -147,3 +221,178 @@ def update_team(
     session.commit()
     session.refresh(team_db)
     return team_db
+
+
+@router.get("/{team_id}/dashboard")
+def read_team_dashboard(
+    team_id: int,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+    events_limit: Annotated[int, Query(le=100)] = 5,
+) -> dict:
+    """
+    Reads everything the team home page shows with a fixed number of queries.
+    :param team_id: ID of the team.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :param events_limit: Maximum number of upcoming events.
+    :return: Dictionary with team, current season, upcoming events, open fines
+    and leaderboard.
+    """
+    is_team_member_or_admin(team_id, token)
+
+    team = session.get(Team, team_id)
+    if not team:
+        raise NotFoundException(TYPE, data_id=team_id)
+
+    statement = (
+        select(Season)
+        .where(Season.team_id == team_id)
+        .order_by(Season.id.desc())
+        .limit(1)
+    )
+    current_season = session.exec(statement).first()
+
+    statement = (
+        select(Event)
+        .join(Season)
+        .where(Season.team_id == team_id, Event.event_date >= date.today())
+        .order_by(Event.event_date, Event.id)
+        .limit(events_limit)
+    )
+    upcoming_events = session.exec(statement).all()
+
+    return {
+        "team": team.model_dump(),
+        "current_season": current_season.model_dump() if current_season else None,
+        "upcoming_events": [event.model_dump() for event in upcoming_events],
+        "open_fines": get_open_fines(team_id, session),
+        "leaderboard": get_leaderboard(team_id, session),
+    }
+
+
+@router.get("/{team_id}/next_event")
+def read_next_event(
+    team_id: int,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> dict:
+    """
+    Reads the next event of a team with its bring beer. The result is cached
+    per team until an event, bring beer or season changes.
+    :param team_id: ID of the team.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: Dictionary with the next event and its bring beer.
+    """
+    is_team_member_or_admin(team_id, token)
+
+    next_event = NEXT_EVENT_CACHE.get(team_id)
+    if next_event is None:
+        if not session.get(Team, team_id):
+            raise NotFoundException(TYPE, data_id=team_id)
+
+        next_event = get_next_event_json(team_id, session)
+        NEXT_EVENT_CACHE.set(team_id, next_event)
+    return next_event
+
+
+def get_next_event_json(team_id: int, session: Session) -> dict:
+    """
+    Reads the next event of a team by the index of season and date.
+    :param team_id: ID of the team.
+    :param session: DB session.
+    :return: Dictionary with the next event and its bring beer.
+    """
+    seasons = select(Season.id).where(Season.team_id == team_id)
+    statement = (
+        select(Event)
+        .where(Event.season_id.in_(seasons), Event.event_date >= date.today())
+        .order_by(Event.event_date, Event.id)
+        .limit(1)
+    )
+    event = session.exec(statement).first()
+    if not event:
+        return {"event": None, "bring_beer": []}
+
+    statement = (
+        select(BringBeer).where(BringBeer.event_id == event.id).order_by(BringBeer.id)
+    )
+    return {
+        "event": event.model_dump(),
+        "bring_beer": [
+            bring_beer.model_dump() for bring_beer in session.exec(statement).all()
+        ],
+    }
+
+
+def get_open_fines(
+    team_id: int, session: Session, for_update: bool = False
+) -> list[dict]:
+    """
+    Reads all user beer of a team that are not linked to a bring beer in one query.
+    :param team_id: ID of the team.
+    :param session: DB session.
+    :param for_update: Locks the user beer until the end of the transaction.
+    :return: List of open fines with the user.
+    """
+    # pylint: disable=singleton-comparison
+    statement = (
+        select(UserBeer.id, UserBeer.kind, User.id, User.first_name, User.last_name)
+        .join(User, UserBeer.user_id == User.id)
+        .outerjoin(BringBeer, UserBeer.id == BringBeer.user_beer_id)
+        .where(User.team_id == team_id, BringBeer.id == None)  # noqa: E711
+        .order_by(UserBeer.id)
+    )
+    if for_update:
+        statement = statement.with_for_update(of=UserBeer)
+    return [
+        {
+            "user": f"{first_name} {last_name}",
+            "user_id": user_id,
+            "user_beer_id": user_beer_id,
+            "kind": kind,
+        }
+        for user_beer_id, kind, user_id, first_name, last_name in session.exec(
+            statement
+        )
+    ]
+
+
+def get_leaderboard(team_id: int, session: Session) -> list[dict]:
+    """
+    Counts the brought beer and fines of every user of a team in one query.
+    :param team_id: ID of the team.
+    :param session: DB session.
+    :return: List of users with amount of brought beer and fines.
+    """
+    bring_beers = (
+        select(BringBeer.user_id, func.count(BringBeer.id).label("amount"))
+        .group_by(BringBeer.user_id)
+        .subquery()
+    )
+    user_beers = (
+        select(UserBeer.user_id, func.count(UserBeer.id).label("included_fine"))
+        .group_by(UserBeer.user_id)
+        .subquery()
+    )
+    amount = func.coalesce(bring_beers.c.amount, 0)
+    included_fine = func.coalesce(user_beers.c.included_fine, 0)
+    statement = (
+        select(User.id, User.first_name, User.last_name, amount, included_fine)
+        .outerjoin(bring_beers, bring_beers.c.user_id == User.id)
+        .outerjoin(user_beers, user_beers.c.user_id == User.id)
+        .where(User.team_id == team_id)
+        .order_by(amount - included_fine, User.id)
+    )
+    return [
+        {
+            "user": f"{first_name} {last_name}",
+            "user_id": user_id,
+            "amount": user_amount,
+            "included_fine": user_included_fine,
+        }
+        for user_id, first_name, last_name, user_amount, user_included_fine in (
+            session.exec(statement)
+        )
+    ]
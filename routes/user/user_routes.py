@@ -3,13 +3,17 @@ Created by Fabian Gnatzig
 Description: HTTP Routes of user.
 """
 
+import csv
+import io
+import json
 from datetime import datetime
-from typing import Annotated, Sequence
+from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
-from dependencies import get_session, oauth2_scheme, pwd_context
+from dependencies import get_session, oauth2_scheme, pwd_context, hash_passwords
 from auth.auth_methods import (
     is_admin,
     is_user_or_admin,
@@ -17,28 +21,70 @@ from auth.auth_methods import (
     get_team_id,
 )
 from exceptions import (
+    IncompleteException,
     InvalidException,
     InvalidRoleException,
     NotFoundException,
 )
+from models.beer_models import BringBeer, UserBeer
 from models.team_models import Team
 from models.user_models import User, UserUpdate
+from models.sync_models import utcnow
+from routes.bulk import BulkPatch, apply_changes, check_ids, group_changes
+from routes.cache import NEXT_EVENT_CACHE
+from routes.fieldsets import (
+    FieldsQuery,
+    IncludeQuery,
+    get_columns,
+    get_fields_json,
+    get_load_options,
+    get_relations,
+    get_relations_json,
+)
+from routes.sync import (
+    SinceQuery,
+    add_tombstone,
+    add_tombstones,
+    changed_since,
+    clear_references,
+    get_sync_json,
+)
 
 router = APIRouter(prefix="/user", tags=["User"])
 TYPE = "USER"
+IMPORT_FIELDS = [
+    "username",
+    "first_name",
+    "last_name",
+    "birthday",
+    "team_id",
+    "password",
+    "role",
+]
 
 
 @router.get("/all")
 def get_all_user(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Session = Depends(get_session),
-) -> Sequence[User]:
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+    since: SinceQuery = None,
+) -> list | dict:
     """
     Reads all user instances.
     :param token: User jwt-token.
     :param session: DB session.
-    :return: List of all users.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
+    :param since: Only rows changed or deleted since this time.
+    :return: List of all users or with since the changed users,
+        the IDs of the deleted users and the time of the sync.
     """
+    columns = get_columns(User, fields)
+    relations = get_relations(User, include, [])
+    synced_at = utcnow()
+    team_id = None
     try:
         is_admin(token)
         statement = select(User)
@@ -46,8 +92,17 @@ def get_all_user(
         team_id = get_team_id(token)
         statement = select(User).where(User.team_id == team_id)
 
-    users = session.exec(statement).all()
-    return users
+    if since:
+        statement = changed_since(statement, User, since)
+
+    statement = statement.options(*get_load_options(User, columns, relations))
+    rows = [
+        get_fields_json(user, columns) | get_relations_json(user, relations)
+        for user in session.exec(statement).all()
+    ]
+    if since is None:
+        return rows
+    return get_sync_json(session, User, rows, since, team_id, synced_at)
 
 
 @router.post("/add")
@@ -83,38 +138,177 @@ def create_user(
 
     user = User(**user_data)
     session.add(user)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError as ex:
+        session.rollback()
+        # The team is checked, so the insert failed on the unique username or
+        # on a missing column.
+        statement = select(User.id).where(User.username == user_data.get("username"))
+        if session.exec(statement).first():
+            raise InvalidException("username") from ex
+        raise IncompleteException(TYPE) from ex
     session.refresh(user)
     return user
 
 
+@router.post("/import")
+def import_users(
+    file: UploadFile,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> dict:
+    """
+    Creates users from a CSV or JSON file. All rows are validated first, the
+    passwords of the valid rows are hashed in parallel and the users are inserted
+    in one transaction.
+    :param file: CSV file with a header row or JSON file with a list of users.
+    :param token: User token.
+    :param session: DB session.
+    :return: IDs of the created users and the errors of the invalid rows.
+    """
+    is_admin_or_manager(token)
+    try:
+        is_admin(token)
+        allow_admin = True
+    except InvalidRoleException:
+        allow_admin = False
+
+    rows = read_import_file(file)
+    valid_rows, errors = validate_import_rows(rows, allow_admin, session)
+
+    passwords = hash_passwords([row["password"] for _, row in valid_rows])
+    users = []
+    for (_, row), password in zip(valid_rows, passwords):
+        row["password"] = password
+        users.append(User(**row))
+
+    session.add_all(users)
+    session.commit()
+    return {"created": [user.id for user in users], "errors": errors}
+
+
+def read_import_file(file: UploadFile) -> list:
+    """
+    Reads the rows of a CSV or JSON import file.
+    :param file: Uploaded file.
+    :return: List of rows.
+    """
+    try:
+        filename = file.filename or ""
+        if file.content_type == "text/csv" or filename.endswith(".csv"):
+            text = io.TextIOWrapper(file.file, encoding="utf-8-sig")
+            return list(csv.DictReader(text))
+
+        rows = json.load(file.file)
+    except (UnicodeDecodeError, json.JSONDecodeError) as ex:
+        raise InvalidException("file") from ex
+
+    if not isinstance(rows, list):
+        raise InvalidException("file")
+    return rows
+
+
+def validate_import_rows(
+    rows: list, allow_admin: bool, session: Session
+) -> tuple[list[tuple[int, dict]], list[dict]]:
+    """
+    Validates all rows of an import. Teams and existing usernames are checked with
+    one query each.
+    :param rows: Rows of the import file.
+    :param allow_admin: If users with role admin may be created.
+    :param session: DB session.
+    :return: Valid rows with their row number and the errors of the invalid rows.
+    """
+    valid_rows = []
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            valid_rows.append((number, validate_import_row(row, allow_admin)))
+        except HTTPException as ex:
+            errors.append({"row": number, "detail": ex.detail})
+
+    team_ids = {row["team_id"] for _, row in valid_rows}
+    statement = select(Team.id).where(Team.id.in_(team_ids))
+    existing_teams = set(session.exec(statement).all())
+
+    usernames = [row["username"] for _, row in valid_rows]
+    statement = select(User.username).where(User.username.in_(usernames))
+    taken_usernames = set(session.exec(statement).all())
+
+    checked_rows = []
+    for number, row in valid_rows:
+        if row["team_id"] not in existing_teams:
+            error = NotFoundException("TEAM", data_id=row["team_id"])
+            errors.append({"row": number, "detail": error.detail})
+        elif row["username"] in taken_usernames:
+            errors.append({"row": number, "detail": "Invalid username"})
+        else:
+            taken_usernames.add(row["username"])
+            checked_rows.append((number, row))
+
+    errors.sort(key=lambda error: error["row"])
+    return checked_rows, errors
+
+
+def validate_import_row(row, allow_admin: bool) -> dict:
+    """
+    Validates the fields of a single import row.
+    :param row: Row of the import file.
+    :param allow_admin: If users with role admin may be created.
+    :return: User data of the row.
+    """
+    if not isinstance(row, dict) or not all(row.get(key) for key in IMPORT_FIELDS):
+        raise IncompleteException(TYPE)
+
+    user_data = {key: row[key] for key in IMPORT_FIELDS}
+    try:
+        user_data["birthday"] = datetime.strptime(
+            str(user_data["birthday"]), "%Y-%m-%d"
+        ).date()
+    except ValueError as ex:
+        raise InvalidException("birthday") from ex
+
+    try:
+        user_data["team_id"] = int(user_data["team_id"])
+    except (TypeError, ValueError) as ex:
+        raise InvalidException("team_id") from ex
+
+    if user_data["role"] == "admin" and not allow_admin:
+        raise InvalidRoleException
+    return user_data
+
+
 @router.get("/{user_id}")
 def get_user_id(
     user_id: int,
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Session = Depends(get_session),
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
 ) -> dict:
     """
     Searches for a user with id.
     :param user_id: ID of a user to search for.
     :param token: Authentication token.
     :param session: DB session.
+    :param fields: Comma separated columns to return.
+    :param include: Comma separated relationships to expand.
     :return: Dictionary with user and team.
     """
-    user = session.get(User, user_id)
+    columns = get_columns(User, fields)
+    relations = get_relations(User, include, ["team", "bring_beer", "user_beer"])
+    user = session.get(
+        User, user_id, options=get_load_options(User, columns, relations)
+    )
 
     if not user:
         raise NotFoundException(TYPE, data_id=user_id)
 
     is_user_or_admin(user_id, token)
 
-    user_json = user.model_dump()
-    if user.team:
-        user_json.update({"team": user.team.model_dump()})
-    if user.bring_beer:
-        user_json.update({"bring_beer": user.bring_beer})
-    if user.user_beer:
-        user_json.update({"user_beer": user.user_beer})
+    user_json = get_fields_json(user, columns)
+    user_json.update(get_relations_json(user, relations))
     return user_json
 
 
@@ -161,11 +355,60 @@ def delete_user(
     if not user:
         raise NotFoundException(TYPE, data_id=user_id)
 
+    # The database deletes the user beer, statistics and refresh tokens. The
+    # bring beer of the user leave the team, so they are deleted for its sync.
+    add_tombstones(session, UserBeer, user.team_id, UserBeer.user_id == user_id)
+    add_tombstones(session, BringBeer, user.team_id, BringBeer.user_id == user_id)
+    clear_references(
+        session, BringBeer, {"user_id": None}, BringBeer.user_id == user_id
+    )
+    clear_references(
+        session,
+        BringBeer,
+        {"user_beer_id": None},
+        BringBeer.user_beer_id.in_(
+            select(UserBeer.id).where(UserBeer.user_id == user_id)
+        ),
+    )
+    add_tombstone(session, User, user_id, user.team_id)
     session.delete(user)
     session.commit()
+    NEXT_EVENT_CACHE.clear()
     return {"ok": True}
 
 
+@router.patch("/bulk")
+def update_users(
+    patches: list[BulkPatch],
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Session = Depends(get_session),
+) -> dict:
+    """
+    Updates many users with one UPDATE per group of equal changes in one
+    transaction. Changed passwords are hashed.
+    :param patches: ID and changes of every user.
+    :param token: User jwt-token.
+    :param session: DB session.
+    :return: IDs of the updated users.
+    """
+    is_admin(token)
+
+    groups = group_changes(User, UserUpdate, patches, TYPE)
+    ids = [patch.id for patch in patches]
+    check_ids(session, User, ids, TYPE)
+
+    hashed_groups = {}
+    for changes, user_ids in groups.items():
+        changes = dict(changes)
+        if "password" in changes:
+            changes["password"] = pwd_context.hash(changes["password"])
+        hashed_groups[tuple(sorted(changes.items()))] = user_ids
+
+    apply_changes(session, User, hashed_groups, TYPE)
+    session.commit()
+    return {"updated": ids}
+
+
 @router.patch("/{user_id}")
 def update_user(
     user_id: int,
@@ -174,9 +417,10 @@ def update_user(
     session: Session = Depends(get_session),
 ) -> User:
     """
-    Updates the data of a user.
+    Updates the data of a user. A changed password is hashed.
     :param user_id: ID of a user to be edited.
     :param user: Edited user data.
+    :param token: User jwt-token.
     :param session: DB session.
     :return: Edited user instance.
     """
@@ -187,6 +431,8 @@ def update_user(
         raise NotFoundException(TYPE, data_id=user_id)
 
     user_data = user.model_dump(exclude_unset=True)
+    if "password" in user_data:
+        user_data["password"] = pwd_context.hash(user_data["password"])
     user_db.sqlmodel_update(user_data)
     session.add(user_db)
     session.commit()
@@ -7,27 +7,92 @@ from datetime import datetime, timedelta, timezone
 
 import jwt
 import pytest
+from sqlalchemy import event
 from sqlmodel import SQLModel, Session, create_engine
 from fastapi.testclient import TestClient
 
 from auth.login_routes import create_access_token
-from dependencies import get_session, ALGORITHM, SECRET_KEY
+from auth.rate_limit import THROTTLED, LocalRateLimitBackend, set_rate_limit_backend
+from dependencies import (
+    get_primary_session,
+    get_session,
+    set_sqlite_performance,
+    ALGORITHM,
+    SECRET_KEY,
+)
 from main import app
+from routes.cache import NEXT_EVENT_CACHE
 
-DATABASE = "sqlite:///test.db"
 
+def pytest_configure(config):
+    """
+    Registers the markers of the tests.
+    :param config: Pytest config.
+    :return: None
+    """
+    config.addinivalue_line(
+        "markers",
+        "no_foreign_keys: turns off the foreign keys, which the test db enforces "
+        "like the app db, for the data of legacy databases",
+    )
 
-@pytest.fixture(name="session")
-def session_fixture():
+
+def set_manual_transactions(dbapi_connection, _connection_record):
+    """
+    Stops pysqlite from beginning and committing transactions on its own, so
+    the savepoints of the test sessions work.
+    :param dbapi_connection: New DBAPI connection.
+    :param _connection_record: Pool record of the connection.
+    :return: None
+    """
+    dbapi_connection.isolation_level = None
+
+
+def begin_transaction(connection):
     """
-    Fixture for creating a test db session.
+    Begins the transactions instead of pysqlite.
+    :param connection: Connection of the transaction.
+    :return: None
     """
-    test_engine = create_engine(DATABASE)
+    connection.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(name="db_engine", scope="session")
+def db_engine_fixture(tmp_path_factory):
+    """
+    Fixture for the test db of a worker. The schema is created once per worker
+    and every parallel worker has its own db file.
+    """
+    database = tmp_path_factory.mktemp("db") / "test.db"
+    test_engine = create_engine(f"sqlite:///{database}")
+    event.listen(test_engine, "connect", set_sqlite_performance)
+    event.listen(test_engine, "connect", set_manual_transactions)
+    event.listen(test_engine, "begin", begin_transaction)
 
     SQLModel.metadata.create_all(test_engine)
-    with Session(test_engine) as session:
-        yield session
-    SQLModel.metadata.drop_all(test_engine)
+    yield test_engine
+    test_engine.dispose()
+
+
+@pytest.fixture(name="session")
+def session_fixture(request, db_engine):
+    """
+    Fixture for creating a test db session. The test runs in a transaction,
+    which is rolled back at the end. Every commit of the session only releases
+    a savepoint of the transaction.
+    :param request: Request of the test.
+    :param db_engine: Engine of the test db.
+    """
+    foreign_keys = request.node.get_closest_marker("no_foreign_keys") is None
+    with db_engine.connect() as connection:
+        # The foreign keys can only be switched outside a transaction.
+        dbapi_connection = connection.connection.driver_connection
+        dbapi_connection.execute(f"PRAGMA foreign_keys={int(foreign_keys)}")
+
+        transaction = connection.begin()
+        with Session(connection, join_transaction_mode="create_savepoint") as session:
+            yield session
+        transaction.rollback()
 
 
 @pytest.fixture
@@ -45,9 +110,13 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_primary_session] = get_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+    NEXT_EVENT_CACHE.clear()
+    set_rate_limit_backend(LocalRateLimitBackend())
+    THROTTLED.clear()
 
 
 @pytest.fixture
@@ -72,6 +141,18 @@ def get_user_token():
     return token
 
 
+@pytest.fixture
+def get_team_user_token():
+    """
+    Create an JWT-Token of a user of team 1.
+    :return: Team user JWT-Token.
+    """
+    token = create_access_token(
+        {"sub": "alice", "user_id": 1, "role": "user", "team_ids": 1}
+    )
+    return token
+
+
 @pytest.fixture
 def get_manager_token():
     """
@@ -3,7 +3,32 @@ Created by Fabian Gnatzig
 Description: Helper methods for unittests
 """
 
+from datetime import date
+
 from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from models.beer_models import UserBeer
+from models.event_models import Event
+from models.season_models import Season
+from models.team_models import Team
+from models.user_models import User
+from routes.live import Broker
+
+
+class RecordingBroker(Broker):
+    """
+    Broker that records the published messages.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, channel: str, message: dict):
+        self.messages.append((channel, message))
+
+    def subscribe(self, channel: str):
+        pass  # pragma: no cover
 
 
 def create_beer(client: TestClient):
@@ -136,3 +161,56 @@ def create_team(client: TestClient):
 
     response = client.post("/team/add", json=test_payload)
     return response
+
+
+def add_user(
+    session: Session, username: str, team_id: int = 1, last_name: str = "last"
+):
+    """
+    Adds a user with the role user to the session without committing.
+    :param session: Test session.
+    :param username: Username of the user.
+    :param team_id: Team of the user.
+    :param last_name: Last name of the user.
+    :return: None
+    """
+    session.add(
+        User(
+            username=username,
+            first_name="first",
+            last_name=last_name,
+            birthday=date(2000, 1, 1),
+            team_id=team_id,
+            password="pswd",
+            role="user",
+        )
+    )
+
+
+def create_team_users(session: Session):
+    """
+    Creates a user in team 1 and a user in team 2 and the missing teams.
+    :param session: Test session.
+    :return: None
+    """
+    for team_id in [1, 2]:
+        if not session.get(Team, team_id):
+            session.add(Team(id=team_id, name=f"team_{team_id}"))
+        add_user(session, f"user_{team_id}", team_id)
+    session.commit()
+
+
+def create_bring_beer_references(session: Session):
+    """
+    Creates the team, season, event, user and user beer with ID 1, which a bring
+    beer of create_bring_beer references.
+    :param session: Test session.
+    :return: None
+    """
+    session.add(Team(name="test_team"))
+    session.add(Season(name="test_season", team_id=1))
+    session.add(Event(name="test_event", season_id=1, event_date=date(2025, 8, 21)))
+    add_user(session, "test_user")
+    session.commit()
+    session.add(UserBeer(user_id=1, kind="test_kind"))
+    session.commit()
@@ -5,7 +5,19 @@ Description: Unittests of beer-routes.
 
 from unittest.mock import patch
 
-from tests.helper_methods import create_brewery, create_bring_beer, create_beer
+import pytest
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from models.beer_models import Beer
+from models.brewery_models import Brewery
+from tests.helper_methods import (
+    create_brewery,
+    create_bring_beer,
+    create_bring_beer_references,
+    create_beer,
+)
 
 
 def test_read_empty_beers(client_fixture):
@@ -40,19 +52,23 @@ def test_read_beers(client_fixture):
     assert len(response.json()) == 2
 
 
-def test_read_beer_without_brewery(client_fixture):
+@pytest.mark.no_foreign_keys
+def test_read_beer_without_brewery(client_fixture, session):
     """
-    Test read beer without connected brewery.
+    Test read beer of a legacy db without connected brewery.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
-    create_beer(client_fixture)
+    session.add(Beer(name="test_beer", beer_code="1234", brewery_id=1, volume=0.2))
+    session.commit()
 
     response = client_fixture.get("/beer/all")
     assert response.status_code == 200
     assert len(response.json()) == 1
 
-    create_beer(client_fixture)
+    session.add(Beer(name="test_beer", beer_code="1234", brewery_id=1, volume=0.2))
+    session.commit()
 
     response = client_fixture.get("/beer/all")
     assert response.status_code == 200
@@ -65,6 +81,7 @@ def test_create_beer(client_fixture):
     :param client_fixture: Test client.
     :return: None
     """
+    create_brewery(client_fixture)
     response = create_beer(client_fixture)
     assert response.status_code == 200
     assert response.json()["beer_code"] == "1234"
@@ -83,15 +100,28 @@ def test_create_wrong_beer(client_fixture):
     assert response.json()["detail"] == "Incomplete BEER"
 
 
-def test_read_beer_id(client_fixture):
+def test_create_beer_without_brewery(client_fixture):
+    """
+    Tests the creation of a beer of a missing brewery.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = create_beer(client_fixture)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "BREWERY with id '1' not found!"
+
+
+def test_read_beer_id(client_fixture, session):
     """
     Test read a beer with id.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
+    create_bring_beer_references(session)
     create_brewery(client_fixture)
-    create_bring_beer(client_fixture)
     create_beer(client_fixture)
+    create_bring_beer(client_fixture)
 
     response = client_fixture.get("/beer/1")
     assert response.status_code == 200
@@ -114,15 +144,18 @@ def test_read_wrong_beer_id(client_fixture):
     assert response.json()["detail"] == f"BEER with id '{no_beer_id}' not found!"
 
 
-def test_read_beer_by_code(client_fixture):
+def test_read_beer_by_code(client_fixture, session):
     """
     Test the read beer by code.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
+    create_bring_beer_references(session)
     create_brewery(client_fixture)
     create_beer(client_fixture)
     create_bring_beer(client_fixture)
+
     response = client_fixture.get("/beer/code/1234")
     assert response.status_code == 200
     assert response.json()["beer_code"] == "1234"
@@ -142,15 +175,17 @@ def test_fail_read_beer_by_code(client_fixture):
     assert response.json()["detail"] == "BEER with code 'nope' not found!"
 
 
-def test_read_beer_name(client_fixture):
+def test_read_beer_name(client_fixture, session):
     """
     Tests read a beer by name.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
+    create_bring_beer_references(session)
     create_brewery(client_fixture)
-    create_bring_beer(client_fixture)
     create_beer(client_fixture)
+    create_bring_beer(client_fixture)
 
     response = client_fixture.get("/beer/name/test_beer")
     assert response.json()["beer_code"] == "1234"
@@ -179,6 +214,7 @@ def test_delete_beer(client_fixture, get_admin_token):
     :param get_admin_token: Test admin token.
     :return: None
     """
+    create_brewery(client_fixture)
     create_beer(client_fixture)
 
     response = client_fixture.delete(
@@ -226,6 +262,7 @@ def test_update_beer_name(client_fixture):
     :param client_fixture: Test client.
     :return: None
     """
+    create_brewery(client_fixture)
     create_beer(client_fixture)
     new_name = "new_test_beer"
     test_payload = {"name": f"{new_name}"}
@@ -394,3 +431,120 @@ def test_get_no_data_from_ai(tmp_path, client_fixture, get_admin_token):
 
     assert response.status_code == 400
     assert response.json()["detail"] == "some details"
+
+
+def test_read_beers_with_fieldset(client_fixture):
+    """
+    Test read all beers with sparse fields and without relationships.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
+    create_bring_beer(client_fixture)
+
+    response = client_fixture.get("/beer/all?fields=name,beer_code&include=")
+    assert response.status_code == 200
+    assert response.json() == [{"name": "test_beer", "beer_code": "1234"}]
+
+
+def test_read_beer_id_with_include(client_fixture):
+    """
+    Test read beer by id with only the brewery expanded.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
+    create_bring_beer(client_fixture)
+
+    response = client_fixture.get("/beer/1?fields=id&include=brewery")
+    assert response.status_code == 200
+    assert response.json()["brewery"]["name"] == "test_brewery"
+    assert "bring_beer" not in response.json()
+    assert "name" not in response.json()
+
+
+def create_beers(session: Session):
+    """
+    Creates two breweries and three beers.
+    :param session: Test session.
+    :return: None
+    """
+    session.add(Brewery(name="first", city="city", country="country"))
+    session.add(Brewery(name="second", city="city", country="country"))
+    for code in ["1", "2", "3"]:
+        session.add(Beer(name=f"beer_{code}", beer_code=code, brewery_id=1, volume=0.5))
+    session.commit()
+
+
+def test_update_beers(client_fixture, session):
+    """
+    Test the update of many beers with one UPDATE per group of equal changes.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_beers(session)
+    payload = [
+        {"id": 1, "changes": {"brewery_id": 2}},
+        {"id": 2, "changes": {"brewery_id": 2}},
+        {"id": 3, "changes": {"name": "renamed", "volume": 0.33}},
+    ]
+    statements = []
+
+    def count_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(session.get_bind(), "before_cursor_execute", count_statement)
+    response = client_fixture.patch("/beer/bulk", json=payload)
+    event.remove(session.get_bind(), "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": [1, 2, 3]}
+    assert len([sql for sql in statements if sql.startswith("UPDATE beer")]) == 2
+    session.expire_all()
+    assert [session.get(Beer, i).brewery_id for i in [1, 2, 3]] == [2, 2, 1]
+    assert (session.get(Beer, 3).name, session.get(Beer, 3).volume) == ("renamed", 0.33)
+
+
+def test_update_beers_invalid(client_fixture, session):
+    """
+    Test the update of many beers with invalid changes.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_beers(session)
+
+    for payload in [
+        [],
+        [{"id": 1, "changes": {}}],
+        [{"id": 1, "changes": {"color": "red"}}],
+        [{"id": 1, "changes": {"name": None}}],
+        [{"id": 1, "changes": {"volume": "big"}}],
+        [{"id": 1, "changes": {"name": "a"}}, {"id": 1, "changes": {"name": "b"}}],
+    ]:
+        response = client_fixture.patch("/beer/bulk", json=payload)
+        assert response.status_code == 400
+
+
+def test_update_wrong_beers(client_fixture, session):
+    """
+    Test that no beer is updated if a beer does not exist.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_beers(session)
+    payload = [
+        {"id": 1, "changes": {"name": "renamed"}},
+        {"id": 9, "changes": {"name": "renamed"}},
+    ]
+
+    response = client_fixture.patch("/beer/bulk", json=payload)
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "BEER with id '9' not found!"
+    session.expire_all()
+    assert session.get(Beer, 1).name == "beer_1"
@@ -209,3 +209,23 @@ def test_update_wrong_brewery(client_fixture):
     response = client_fixture.patch(f"/brewery/{wrong_id}", json={})
     assert response.status_code == 404
     assert response.json()["detail"] == f"BREWERY with id '{wrong_id}' not found!"
+
+
+def test_update_breweries(client_fixture):
+    """
+    Test the update of many breweries.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_brewery(client_fixture)
+    create_brewery(client_fixture)
+    payload = [
+        {"id": 1, "changes": {"city": "new_city"}},
+        {"id": 2, "changes": {"city": "new_city"}},
+    ]
+
+    response = client_fixture.patch("/brewery/bulk", json=payload)
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": [1, 2]}
+    assert client_fixture.get("/brewery/2").json()["city"] == "new_city"
@@ -3,9 +3,26 @@ Created by Fabian Gnatzig
 Description: Unittests of bring beer routes.
 """
 
+import json
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import event
+from sqlmodel import Session, func, select, update
+
+from models.beer_models import Beer, BringBeer, UserBeer
+from models.brewery_models import Brewery
+from models.event_models import Event
+from models.season_models import Season
+from models.stats_models import UserSeasonStats
+from models.sync_models import utcnow
+from models.team_models import Team
+from routes.sync import SYNC_MARGIN
 from tests.helper_methods import (
+    create_team_users,
     create_bring_beer,
+    create_bring_beer_references,
     create_beer,
+    create_brewery,
     create_event,
     create_user,
 )
@@ -41,6 +58,20 @@ def test_read_bring_beer_id(client_fixture, get_admin_token):
     assert response.json()["beer"]
 
 
+def test_create_bring_beer_missing_reference(client_fixture, session):
+    """
+    Test the creation of a bring beer of a missing event.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_bring_beer_references(session)
+
+    response = client_fixture.post("/bringbeer/add", json={"event_id": 2})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "EVENT with id '2' not found!"
+
+
 def test_read_wrong_bring_beer_id(client_fixture):
     """
     Test read bring_beer by id exception.
@@ -54,13 +85,17 @@ def test_read_wrong_bring_beer_id(client_fixture):
     assert response.json()["detail"] == f"BRING_BEER with id '{wrong_id}' not found!"
 
 
-def test_delete_bring_beer(client_fixture, get_admin_token):
+def test_delete_bring_beer(client_fixture, session, get_admin_token):
     """
     Test the deleting of a bring_beer.
     :param client_fixture: Test client.
+    :param session: Test session.
     :param get_admin_token: Test admin token.
     :return: None
     """
+    create_bring_beer_references(session)
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
     create_bring_beer(client_fixture)
 
     response = client_fixture.delete(
@@ -103,12 +138,17 @@ def test_delete_bring_beer_invalid_token(client_fixture, get_invalid_token):
     assert response.json()["detail"] == "Invalid token"
 
 
-def test_update_bring_beer_name(client_fixture):
+def test_update_bring_beer_name(client_fixture, session):
     """
     Test the update of a bring_beer.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
+    create_bring_beer_references(session)
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
+    create_beer(client_fixture)
     create_bring_beer(client_fixture)
     new_id = 2
     test_payload = {"beer_id": f"{new_id}"}
@@ -118,12 +158,16 @@ def test_update_bring_beer_name(client_fixture):
     assert response.json()["beer_id"] == new_id
 
 
-def test_update_wrong_bring_beer(client_fixture):
+def test_update_wrong_bring_beer(client_fixture, session):
     """
     Test the update of a bring_beer exception.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
+    create_bring_beer_references(session)
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
     create_bring_beer(client_fixture)
     wrong_id = 321321
 
@@ -132,15 +176,371 @@ def test_update_wrong_bring_beer(client_fixture):
     assert response.json()["detail"] == f"BRING_BEER with id '{wrong_id}' not found!"
 
 
-def test_read_done_bring_beer(client_fixture):
+def test_read_done_bring_beer(client_fixture, session):
     """
     Test do and read a bring_beer.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
+    create_bring_beer_references(session)
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
     create_bring_beer(client_fixture)
-    client_fixture.get("/bringbeer/done/1")
+    assert client_fixture.get("/bringbeer/done/1").status_code == 200
+    assert client_fixture.get("/bringbeer/done/1").status_code == 200
 
     response = client_fixture.get("/bringbeer/1")
     assert response.status_code == 200
     assert response.json()["done"]
+
+
+def test_done_wrong_bring_beer(client_fixture):
+    """
+    Test do a bring_beer, which does not exist.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    wrong_id = 321321
+
+    response = client_fixture.get(f"/bringbeer/done/{wrong_id}")
+    assert response.status_code == 404
+    assert response.json()["detail"] == f"BRING_BEER with id '{wrong_id}' not found!"
+
+
+def test_export_bring_beers(client_fixture, session, get_admin_token, monkeypatch):
+    """
+    Test the NDJSON export of all bring beers.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    monkeypatch.setattr("routes.export.EXPORT_BATCH_SIZE", 2)
+    create_bulk_data(session)
+    for user_id in [1, 2, 2]:
+        session.add(BringBeer(event_id=1, user_id=user_id, beer_id=1))
+    session.commit()
+
+    response = client_fixture.get(
+        "/bringbeer/export", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert rows[0].pop("updated_at")
+    assert rows[0] == {
+        "id": 1,
+        "event_id": 1,
+        "user_id": 1,
+        "user_beer_id": None,
+        "beer_id": 1,
+        "done": False,
+    }
+
+
+def test_export_team_bring_beers(client_fixture, session, get_team_user_token):
+    """
+    Test the NDJSON export of the bring beers of the own team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    create_bulk_data(session)
+    for user_id in [1, 2, 1]:
+        session.add(BringBeer(event_id=1, user_id=user_id, beer_id=1))
+    session.commit()
+
+    response = client_fixture.get(
+        "/bringbeer/export", headers={"Authorization": f"Bearer {get_team_user_token}"}
+    )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [1, 3]
+
+
+def create_bulk_data(session: Session):
+    """
+    Creates an event, two users, a user beer and a beer.
+    :param session: Test session.
+    :return: None
+    """
+    session.add(Team(name="test_team"))
+    session.add(Season(name="test_season", team_id=1))
+    session.add(Event(name="test_event", season_id=1, event_date=date(2025, 1, 1)))
+    session.add(Brewery(name="test_brewery", city="city", country="country"))
+    session.add(Beer(name="test_beer", beer_code="1", brewery_id=1, volume=0.5))
+    session.commit()
+    create_team_users(session)
+    session.add(UserBeer(user_id=1, kind="birthday"))
+    session.commit()
+
+
+def test_create_bring_beers(client_fixture, session):
+    """
+    Test the creation of many bring beer with one INSERT.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_bulk_data(session)
+    payload = [
+        {"event_id": 1, "user_id": 2, "beer_id": 1},
+        {"event_id": 1, "user_id": 1, "user_beer_id": 1, "done": True},
+        {"event_id": 1, "user_id": 1},
+        {"beer_id": 1},
+    ]
+    statements = []
+
+    def count_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(session.get_bind(), "before_cursor_execute", count_statement)
+    response = client_fixture.post("/bringbeer/bulk", json=payload)
+    event.remove(session.get_bind(), "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200
+    assert response.json() == {"ids": [1, 2, 3, 4]}
+    inserts = [sql for sql in statements if sql.startswith("INSERT INTO bringbeer")]
+    assert len(inserts) == 1
+    assert session.get(BringBeer, 1).user_id == 2
+    assert session.get(BringBeer, 2).user_beer_id == 1
+
+    stats = session.get(UserSeasonStats, (1, 1))
+    assert (stats.brought, stats.done, stats.fines) == (2, 1, 1)
+    assert session.get(UserSeasonStats, (1, 2)).brought == 1
+
+
+def test_create_bring_beers_missing_reference(client_fixture, session):
+    """
+    Test that no bring beer is created if a referenced instance is missing.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_bulk_data(session)
+
+    response = client_fixture.post(
+        "/bringbeer/bulk",
+        json=[{"event_id": 1, "user_id": 1}, {"event_id": 1, "user_id": 9}],
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "USER with id '9' not found!"
+
+    response = client_fixture.post("/bringbeer/bulk", json=[{"event_id": 5}])
+    assert response.status_code == 404
+    assert response.json()["detail"] == "EVENT with id '5' not found!"
+
+    assert session.exec(select(func.count(BringBeer.id))).one() == 0
+
+
+def test_create_empty_bring_beers(client_fixture):
+    """
+    Test the creation of an empty list of bring beer.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = client_fixture.post("/bringbeer/bulk", json=[])
+
+    assert response.status_code == 400
+
+
+def test_update_bring_beers(client_fixture, session):
+    """
+    Test the update of many bring beer with the update of the statistics.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_bulk_data(session)
+    client_fixture.post(
+        "/bringbeer/bulk",
+        json=[{"event_id": 1, "user_id": 1}, {"event_id": 1, "user_id": 1}],
+    )
+    payload = [
+        {"id": 1, "changes": {"done": True}},
+        {"id": 2, "changes": {"done": True, "user_beer_id": 1}},
+    ]
+
+    response = client_fixture.patch("/bringbeer/bulk", json=payload)
+
+    assert response.status_code == 200
+    session.expire_all()
+    assert session.get(BringBeer, 2).user_beer_id == 1
+    stats = session.get(UserSeasonStats, (1, 1))
+    assert (stats.brought, stats.done, stats.fines) == (2, 2, 1)
+
+
+def test_update_wrong_bring_beers(client_fixture):
+    """
+    Test the update of a not existing bring beer.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = client_fixture.patch(
+        "/bringbeer/bulk", json=[{"id": 1, "changes": {"done": True}}]
+    )
+
+    assert response.status_code == 404
+
+
+def test_complete_bring_beers(client_fixture, session):
+    """
+    Test setting many bring beer to done with one UPDATE.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_bulk_data(session)
+    client_fixture.post(
+        "/bringbeer/bulk",
+        json=[
+            {"event_id": 1, "user_id": 1},
+            {"event_id": 1, "user_id": 1, "done": True},
+            {"event_id": 1, "user_id": 1},
+        ],
+    )
+    statements = []
+    event.listen(
+        session.get_bind(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+
+    response = client_fixture.post("/bringbeer/done", json=[1, 2, 3, 99])
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": [1, 3]}
+    assert len([sql for sql in statements if sql.startswith("UPDATE bringbeer")]) == 1
+    session.expire_all()
+    assert session.get(UserSeasonStats, (1, 1)).done == 3
+
+    response = client_fixture.post("/bringbeer/done", json=[1, 3])
+
+    assert response.json() == {"updated": []}
+    session.expire_all()
+    assert session.get(UserSeasonStats, (1, 1)).done == 3
+
+
+def test_complete_no_bring_beers(client_fixture):
+    """
+    Test setting no bring beer to done.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = client_fixture.post("/bringbeer/done", json=[])
+
+    assert response.status_code == 400
+
+
+def test_read_bring_beers_since(
+    client_fixture, session, get_team_user_token, get_admin_token, monkeypatch
+):
+    """
+    Test the delta sync of the bring beers with changed and deleted rows.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :param get_admin_token: Test admin token.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    create_bulk_data(session)
+    for user_id in [1, 1, 1, 2]:
+        session.add(BringBeer(event_id=1, user_id=user_id))
+    session.commit()
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    session.exec(update(BringBeer).values(updated_at=old))
+    session.commit()
+    admin_headers = {"Authorization": f"Bearer {get_admin_token}"}
+    client_fixture.patch("/bringbeer/1", json={"done": True})
+    client_fixture.post("/bringbeer/done", json=[2])
+    client_fixture.delete("/bringbeer/3", headers=admin_headers)
+    client_fixture.delete("/bringbeer/4", headers=admin_headers)
+
+    response = client_fixture.get(
+        "/bringbeer/all",
+        params={"since": "2025-01-01T00:00:00", "fields": "id,done"},
+        headers={"Authorization": f"Bearer {get_team_user_token}"},
+    )
+
+    assert response.status_code == 200
+    sync = response.json()
+    assert sync["changed"] == [{"id": 1, "done": True}, {"id": 2, "done": True}]
+    assert sync["deleted"] == [3]
+    synced_at = datetime.fromisoformat(sync["synced_at"])
+    assert old < synced_at <= utcnow() - SYNC_MARGIN
+
+    response = client_fixture.get(
+        "/bringbeer/all",
+        params={"since": sync["synced_at"], "fields": "id"},
+        headers=admin_headers,
+    )
+
+    # The margin repeats the changes of the last seconds.
+    assert response.json()["changed"] == [{"id": 1}, {"id": 2}]
+    assert response.json()["deleted"] == [3, 4]
+
+    monkeypatch.setattr("routes.sync.SYNC_MARGIN", timedelta(0))
+    sync = client_fixture.get(
+        "/bringbeer/all", params={"since": old.isoformat()}, headers=admin_headers
+    ).json()
+    response = client_fixture.get(
+        "/bringbeer/all",
+        params={"since": sync["synced_at"]},
+        headers=admin_headers,
+    )
+
+    assert response.json()["changed"] == []
+    assert response.json()["deleted"] == []
+
+
+def test_read_bring_beers_since_deleted_parents(
+    client_fixture, session, get_team_user_token, get_admin_token
+):
+    """
+    Test that the delta sync reports the bring beer cleared by a deleted user,
+    beer and brewery.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_bulk_data(session)
+    session.add(Beer(name="other_beer", beer_code="2", brewery_id=1))
+    session.add(BringBeer(event_id=1, user_id=1, user_beer_id=1))
+    session.add(BringBeer(event_id=1, user_id=2, beer_id=1))
+    session.add(BringBeer(event_id=1, user_id=2, beer_id=2))
+    session.commit()
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    session.exec(update(BringBeer).values(updated_at=old))
+    session.commit()
+    admin_headers = {"Authorization": f"Bearer {get_admin_token}"}
+    client_fixture.delete("/user/1", headers=admin_headers)
+    client_fixture.delete("/beer/1", headers=admin_headers)
+    client_fixture.delete("/brewery/1", headers=admin_headers)
+    params = {"since": "2025-01-01T00:00:00", "fields": "id,user_id,beer_id"}
+
+    response = client_fixture.get(
+        "/bringbeer/all",
+        params=params,
+        headers={"Authorization": f"Bearer {get_team_user_token}"},
+    )
+
+    assert response.json()["changed"] == []
+    assert response.json()["deleted"] == [1]
+
+    response = client_fixture.get(
+        "/bringbeer/all", params=params, headers=admin_headers
+    )
+
+    assert response.json()["changed"] == [
+        {"id": 1, "user_id": None, "beer_id": None},
+        {"id": 2, "user_id": 2, "beer_id": None},
+        {"id": 3, "user_id": 2, "beer_id": None},
+    ]
+    assert response.json()["deleted"] == []
@@ -3,11 +3,31 @@ Created by Fabian Gnatzig
 Description: Unittests of event routes.
 """
 
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+
+import pytest
+from fastapi import WebSocketDisconnect
+from sqlmodel import Session, select, update
+
+from auth.login_routes import create_access_token
+from models.beer_models import BringBeer
+from models.event_models import Event
+from models.season_models import Season
+from models.stats_models import UserSeasonStats
+from models.sync_models import Tombstone
+from routes.live import LIVE_BROKER, RESYNC, Broker, LocalBroker, set_broker
+from routes.stats.stats_routes import rebuild_stats
 from tests.helper_methods import (
+    create_beer,
+    create_brewery,
+    create_bring_beer_references,
     create_event,
     create_season,
     create_team,
     create_bring_beer,
+    create_team_users,
 )
 
 
@@ -26,16 +46,17 @@ def test_read_events(client_fixture):
     assert len(response.json()) == 1
 
 
-def test_read_event_id(client_fixture):
+def test_read_event_id(client_fixture, session):
     """
     Test read event by id.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
+    create_bring_beer_references(session)
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
     create_bring_beer(client_fixture)
-    create_team(client_fixture)
-    create_season(client_fixture)
-    create_event(client_fixture)
 
     response = client_fixture.get("/event/1")
     assert response.status_code == 200
@@ -61,18 +82,19 @@ def test_read_wrong_event_id(client_fixture):
     assert response.json()["detail"] == f"EVENT with id '{wrong_id}' not found!"
 
 
-def test_read_event_name(client_fixture):
+def test_read_event_name(client_fixture, session):
     """
     Tests read an event by name.
     :param client_fixture: Test client.
+    :param session: Test session.
     :return: None
     """
     event_name = "test_event"
 
+    create_bring_beer_references(session)
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
     create_bring_beer(client_fixture)
-    create_team(client_fixture)
-    create_season(client_fixture)
-    create_event(client_fixture)
 
     response = client_fixture.get(f"/event/name/{event_name}")
     assert response.status_code == 200
@@ -132,6 +154,17 @@ def test_add_event_date_exception(client_fixture):
     assert response.json()["detail"] == "Invalid event_date"
 
 
+def test_add_event_of_missing_season(client_fixture):
+    """
+    Test add an event of a season, which does not exist.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = create_event(client_fixture)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "SEASON with id '1' not found!"
+
+
 def test_delete_event(client_fixture, get_admin_token):
     """
     Test the deleting of an event.
@@ -150,6 +183,26 @@ def test_delete_event(client_fixture, get_admin_token):
     assert response.json()["ok"] is True
 
 
+@pytest.mark.no_foreign_keys
+def test_delete_event_without_season(client_fixture, session, get_admin_token):
+    """
+    Test the deleting of an event of a legacy db, whose season does not exist.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    session.add(Event(name="event", season_id=99, event_date=date(2025, 1, 1)))
+    session.commit()
+
+    response = client_fixture.delete(
+        "/event/1", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+    assert response.status_code == 200
+    tombstone = session.exec(select(Tombstone)).one()
+    assert (tombstone.row_id, tombstone.team_id) == (1, None)
+
+
 def test_delete_wrong_event(client_fixture, get_admin_token):  #
     """
     Test the deletion of an event exception.
@@ -211,3 +264,341 @@ def test_update_wrong_event(client_fixture):
     response = client_fixture.patch(f"/event/{wrong_id}", json={})
     assert response.status_code == 404
     assert response.json()["detail"] == f"EVENT with id '{wrong_id}' not found!"
+
+
+def create_team_events(client_fixture):
+    """
+    Creates five weekly events in a season of team 1 and one event in a
+    season of team 2.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_team(client_fixture)
+    create_season(client_fixture)
+    client_fixture.post("/season/add", json={"name": "other", "team_id": 2})
+    client_fixture.post(
+        "/event/add-recursive?amount=5",
+        json={"name": "weekly", "season_id": 1, "event_date": "2025-08-21"},
+    )
+    client_fixture.post(
+        "/event/add",
+        json={"name": "other", "season_id": 2, "event_date": "2025-08-28"},
+    )
+
+
+def test_read_event_range(client_fixture, get_admin_token):
+    """
+    Test read events in a date range ordered by date.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_events(client_fixture)
+
+    response = client_fixture.get(
+        "/event/range?from=2025-08-28&to=2025-09-11",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [event["id"] for event in body["events"]] == [2, 6, 3, 4]
+    assert body["next_cursor"] is None
+
+
+def test_read_event_range_pages(client_fixture, get_team_user_token):
+    """
+    Test read the events of a team in a date range page by page.
+    :param client_fixture: Test client.
+    :param get_team_user_token: Test token of a user in team 1.
+    :return: None
+    """
+    create_team_events(client_fixture)
+
+    event_ids = []
+    url = "/event/range?from=2025-01-01&to=2025-12-31&limit=2"
+    cursor = ""
+    for _ in range(3):
+        response = client_fixture.get(
+            f"{url}{cursor}",
+            headers={"Authorization": f"Bearer {get_team_user_token}"},
+        )
+        assert response.status_code == 200
+        body = response.json()
+        event_ids += [event["id"] for event in body["events"]]
+        cursor = f"&cursor={body['next_cursor']}"
+
+    assert event_ids == [1, 2, 3, 4, 5]
+    assert body["next_cursor"] is None
+
+
+def test_read_event_range_invalid(client_fixture, get_admin_token):
+    """
+    Test read events with an invalid date range or cursor.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+
+    response = client_fixture.get(
+        "/event/range?from=2025-12-31&to=2025-01-01", headers=headers
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid date range"
+
+    response = client_fixture.get(
+        "/event/range?from=2025-01-01&to=2025-12-31&cursor=wrong", headers=headers
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_update_events(client_fixture, session: Session):
+    """
+    Test the update of many events with the move of the statistics.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_team_users(session)
+    session.add(Season(name="first", team_id=1))
+    session.add(Season(name="second", team_id=1))
+    session.add(Event(name="a", season_id=1, event_date=date(2025, 1, 1)))
+    session.add(Event(name="b", season_id=1, event_date=date(2025, 1, 8)))
+    session.add(BringBeer(event_id=1, user_id=1))
+    session.add(BringBeer(event_id=2, user_id=1))
+    session.commit()
+    rebuild_stats(session)
+    payload = [
+        {"id": 1, "changes": {"season_id": 2, "event_date": "2025-02-01"}},
+        {"id": 2, "changes": {"name": "renamed", "season_id": 1}},
+    ]
+
+    response = client_fixture.patch("/event/bulk", json=payload)
+
+    assert response.status_code == 200
+    session.expire_all()
+    assert session.get(Event, 1).event_date == date(2025, 2, 1)
+    assert session.get(Event, 2).name == "renamed"
+    assert session.get(UserSeasonStats, (1, 1)).brought == 1
+    assert session.get(UserSeasonStats, (2, 1)).brought == 1
+
+
+def create_live_data(session: Session):
+    """
+    Creates the team users and an event of team 1 with one bring beer.
+    :param session: Test session.
+    :return: None
+    """
+    create_team_users(session)
+    session.add(Season(name="season", team_id=1))
+    session.add(Event(name="event", season_id=1, event_date=date(2025, 1, 1)))
+    session.add(BringBeer(event_id=1, user_id=1))
+    session.commit()
+
+
+def test_live_event(
+    client_fixture, session: Session, get_team_user_token, get_admin_token
+):
+    """
+    Test the live changes of the bring beer of an event.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test team user token.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_live_data(session)
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+    url = f"/event/1/live?token={get_team_user_token}"
+
+    with client_fixture.websocket_connect(url) as websocket:
+        snapshot = websocket.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert [bring_beer["id"] for bring_beer in snapshot["bring_beers"]] == [1]
+
+        client_fixture.post("/bringbeer/add", json={"event_id": 1, "user_id": 1})
+        message = websocket.receive_json()
+        assert message["type"] == "create"
+        assert message["bring_beer"]["id"] == 2
+
+        client_fixture.post("/bringbeer/done", json=[1, 2])
+        assert websocket.receive_json() == {"type": "done", "id": 1}
+        assert websocket.receive_json() == {"type": "done", "id": 2}
+
+        client_fixture.patch("/bringbeer/1", json={"beer_id": None})
+        assert websocket.receive_json()["type"] == "update"
+
+        client_fixture.delete("/bringbeer/2", headers=headers)
+        assert websocket.receive_json() == {"type": "delete", "id": 2}
+
+
+def test_live_event_moved_bring_beer(client_fixture, session: Session, get_admin_token):
+    """
+    Test that a bring beer moved to another event is deleted from the old event.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_live_data(session)
+    session.add(Event(name="other", season_id=1, event_date=date(2025, 1, 8)))
+    session.commit()
+
+    with client_fixture.websocket_connect(
+        f"/event/1/live?token={get_admin_token}"
+    ) as websocket:
+        websocket.receive_json()
+        client_fixture.patch(
+            "/bringbeer/bulk", json=[{"id": 1, "changes": {"event_id": 2}}]
+        )
+
+        assert websocket.receive_json() == {"type": "delete", "id": 1}
+
+
+@pytest.mark.parametrize(
+    "event_id, claims",
+    [(1, {"role": "user", "team_ids": 2}), (99, {"role": "admin"}), (1, None)],
+)
+def test_live_event_denied(client_fixture, session: Session, event_id, claims):
+    """
+    Test that the live changes are denied without access to the event.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param event_id: ID of the event.
+    :param claims: Claims of the token or None for an invalid token.
+    :return: None
+    """
+    create_live_data(session)
+    token = (
+        create_access_token({"sub": "bob", "user_id": 1} | claims) if claims else "x"
+    )
+
+    url = f"/event/{event_id}/live?token={token}"
+    with (
+        pytest.raises(WebSocketDisconnect) as ex,
+        client_fixture.websocket_connect(url),
+    ):
+        pass  # pragma: no cover
+
+    assert ex.value.code == 1008
+
+
+def test_live_event_deleted(client_fixture, session: Session, get_admin_token):
+    """
+    Test that the live changes are closed, when the event is deleted.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_live_data(session)
+
+    with client_fixture.websocket_connect(
+        f"/event/1/live?token={get_admin_token}"
+    ) as websocket:
+        websocket.receive_json()
+        client_fixture.delete(
+            "/event/1", headers={"Authorization": f"Bearer {get_admin_token}"}
+        )
+
+        assert websocket.receive_json() == {"type": "event_delete", "id": 1}
+        with pytest.raises(WebSocketDisconnect) as ex:
+            websocket.receive_json()
+        assert ex.value.code == 1000
+
+
+def test_live_event_resync(
+    client_fixture, session: Session, get_admin_token, monkeypatch
+):
+    """
+    Test that a resync of the broker sends a new snapshot.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+
+    class ResyncBroker(Broker):
+        """
+        Broker that asks every subscriber to resync.
+        """
+
+        def publish(self, channel: str, message: dict):
+            pass  # pragma: no cover
+
+        @asynccontextmanager
+        async def subscribe(self, channel: str):
+            async def messages():
+                yield RESYNC
+                await asyncio.Event().wait()
+
+            yield messages()
+
+    create_live_data(session)
+    monkeypatch.setattr("routes.live.LIVE_BROKER", LIVE_BROKER)
+    set_broker(ResyncBroker())
+
+    with client_fixture.websocket_connect(
+        f"/event/1/live?token={get_admin_token}"
+    ) as websocket:
+        assert websocket.receive_json()["type"] == "snapshot"
+        assert websocket.receive_json()["type"] == "snapshot"
+
+
+def test_local_broker():
+    """
+    Test that a full queue of a subscriber is replaced by a resync.
+    :return: None
+    """
+
+    async def receive():
+        broker = LocalBroker(max_queue=2)
+        async with broker.subscribe("channel") as messages:
+            for number in range(3):
+                broker.publish("channel", {"number": number})
+            broker.publish("other", {"number": 0})
+            await asyncio.sleep(0)
+            message = await anext(messages)
+        return message, broker.subscribers
+
+    assert asyncio.run(receive()) == (RESYNC, {})
+
+
+def test_read_events_since(
+    client_fixture, session: Session, get_team_user_token, get_admin_token
+):
+    """
+    Test the delta sync of the events of the own team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_users(session)
+    session.add(Season(name="season", team_id=1))
+    for day in [1, 8, 15]:
+        session.add(Event(name="event", season_id=1, event_date=date(2025, 1, day)))
+    session.commit()
+    session.exec(
+        update(Event).values(updated_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    )
+    session.commit()
+    client_fixture.patch("/event/bulk", json=[{"id": 1, "changes": {"name": "new"}}])
+    client_fixture.delete(
+        "/event/2", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+
+    response = client_fixture.get(
+        "/event/all",
+        params={"since": "2025-01-01T00:00:00Z", "fields": "id,name"},
+        headers={"Authorization": f"Bearer {get_team_user_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["changed"] == [{"id": 1, "name": "new"}]
+    assert response.json()["deleted"] == [2]
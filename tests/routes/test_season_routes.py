@@ -3,7 +3,33 @@ Created by Fabian Gnatzig
 Description: Unittests of season routes.
 """
 
-from tests.helper_methods import create_season, create_team, create_event
+import io
+from datetime import date, timedelta
+
+from pyarrow import parquet
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlmodel import Session, func, select
+
+from auth.login_routes import create_access_token
+
+from models.beer_models import Beer, BringBeer, UserBeer
+from models.brewery_models import Brewery
+from models.event_models import Event
+from models.stats_models import UserSeasonStats
+from models.season_models import Season
+from models.sync_models import Tombstone
+from models.team_models import Team
+from routes.live import get_broker
+from routes.stats.stats_routes import rebuild_stats
+from routes.team.team_routes import get_open_fines
+from tests.helper_methods import (
+    RecordingBroker,
+    add_user,
+    create_season,
+    create_team,
+    create_event,
+)
 
 
 def test_read_season(client_fixture):
@@ -120,6 +146,17 @@ def test_add_season_without_team(client_fixture):
     assert response.json()["detail"] == "Incomplete SEASON"
 
 
+def test_add_season_of_missing_team(client_fixture):
+    """
+    Test add a season of a team, which does not exist.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = create_season(client_fixture)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "TEAM with id '1' not found!"
+
+
 def test_delete_season(client_fixture, get_admin_token):
     """
     Test the deleting of a season.
@@ -197,3 +234,409 @@ def test_update_wrong_season(client_fixture):
     response = client_fixture.patch(f"/season/{wrong_id}", json={})
     assert response.status_code == 404
     assert response.json()["detail"] == f"SEASON with id '{wrong_id}' not found!"
+
+
+def create_report_data(session: Session):
+    """
+    Creates a season with two events and three bring beers.
+    :param session: Test session.
+    :return: None
+    """
+    session.add(Team(name="test_team"))
+    session.add(Season(name="test_season", team_id=1))
+    session.add(Event(name="second", season_id=1, event_date=date(2025, 2, 1)))
+    session.add(Event(name="first", season_id=1, event_date=date(2025, 1, 1)))
+    session.add(Brewery(name="test_brewery", city="city", country="country"))
+    session.add(Beer(name="test_beer", beer_code="1", brewery_id=1, volume=0.5))
+    add_user(session, "name")
+    session.add(BringBeer(event_id=1, user_id=1, beer_id=1))
+    session.add(BringBeer(event_id=2, user_id=1, beer_id=1, done=True))
+    session.add(BringBeer(event_id=2, user_id=1))
+    session.commit()
+
+
+def test_read_season_report_csv(client_fixture, session, get_team_user_token):
+    """
+    Test the season report as CSV.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    create_report_data(session)
+
+    response = client_fixture.get(
+        "/season/1/report.csv",
+        headers={"Authorization": f"Bearer {get_team_user_token}"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines() == [
+        "event_date,event,user,beer,brewery,volume,alcohol,done",
+        "2025-01-01,first,first last,test_beer,test_brewery,0.5,0.0,True",
+        "2025-01-01,first,first last,,,,,False",
+        "2025-02-01,second,first last,test_beer,test_brewery,0.5,0.0,False",
+    ]
+
+
+def test_read_season_report_parquet(client_fixture, session, get_admin_token):
+    """
+    Test the season report as parquet.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_report_data(session)
+
+    response = client_fixture.get(
+        "/season/1/report.parquet",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+    assert response.status_code == 200
+    table = parquet.read_table(io.BytesIO(response.content))
+    assert table.column_names == [
+        "event_date",
+        "event",
+        "user",
+        "beer",
+        "brewery",
+        "volume",
+        "alcohol",
+        "done",
+    ]
+    assert table.column("event").to_pylist() == ["first", "first", "second"]
+    assert table.column("beer").to_pylist() == ["test_beer", None, "test_beer"]
+    assert table.column("done").to_pylist() == [True, False, False]
+
+
+def test_read_report_of_wrong_season(client_fixture, get_admin_token):
+    """
+    Test the season report of a not existing season.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    wrong_id = 324234
+
+    response = client_fixture.get(
+        f"/season/{wrong_id}/report.csv",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == f"SEASON with id '{wrong_id}' not found!"
+
+
+def test_read_report_of_other_team(client_fixture, session, get_team_user_token):
+    """
+    Test the season report of a season of another team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    session.add(Team(name="test_team"))
+    session.add(Team(name="other_team"))
+    session.add(Season(name="other_season", team_id=2))
+    session.commit()
+
+    response = client_fixture.get(
+        "/season/1/report.parquet",
+        headers={"Authorization": f"Bearer {get_team_user_token}"},
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid user"
+
+
+def create_fine_data(session: Session):
+    """
+    Creates three users with open fines, a past and three upcoming events in
+    team 1 and a user with an open fine in team 2.
+    :param session: Test session.
+    :return: None
+    """
+    today = date.today()
+    session.add(Team(name="test_team"))
+    session.add(Team(name="other_team"))
+    session.add(Season(name="test_season", team_id=1))
+    session.add(Event(name="past", season_id=1, event_date=today - timedelta(days=6)))
+    for days in [1, 8, 15]:
+        session.add(
+            Event(name=f"in {days}", season_id=1, event_date=today + timedelta(days))
+        )
+    for username, team_id in [("a", 1), ("b", 1), ("c", 1), ("d", 2)]:
+        add_user(session, username, team_id, last_name=username)
+    for user_id in [1, 1, 1, 2, 3, 3, 4]:
+        session.add(UserBeer(user_id=user_id, kind="fine"))
+    session.add(BringBeer(event_id=2, user_id=2))
+    session.commit()
+
+
+def test_schedule_fines_dry_run(client_fixture, session, get_admin_token):
+    """
+    Test the preview of the distribution of open fines over the upcoming events.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_fine_data(session)
+
+    response = client_fixture.post(
+        "/season/1/schedule_fines?dry_run=true",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["dry_run"] is True
+    assert body["unassigned"] == 0
+    assert [
+        (assignment["user_beer_id"], assignment["event_id"])
+        for assignment in body["assignments"]
+    ] == [(1, 3), (5, 4), (4, 2), (2, 4), (6, 3), (3, 2)]
+    assert session.exec(select(func.count(BringBeer.id))).one() == 1
+
+
+def test_schedule_fines(client_fixture, session, get_admin_token):
+    """
+    Test the creation of the bring beer for all open fines.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_fine_data(session)
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+
+    response = client_fixture.post("/season/1/schedule_fines", headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.json()["assignments"]) == 6
+    statement = select(BringBeer.user_beer_id, BringBeer.event_id).where(
+        BringBeer.user_beer_id != None  # noqa: E711
+    )
+    assert sorted(session.exec(statement).all()) == [
+        (1, 3),
+        (2, 4),
+        (3, 2),
+        (4, 2),
+        (5, 4),
+        (6, 3),
+    ]
+    stats = session.get(UserSeasonStats, (1, 1))
+    assert (stats.brought, stats.fines) == (3, 3)
+
+    response = client_fixture.post("/season/1/schedule_fines", headers=headers)
+    assert response.json()["assignments"] == []
+
+
+def test_schedule_fines_locks(client_fixture, session, get_admin_token):
+    """
+    Test that the schedule locks the team and the open fines on a database with
+    row locks.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_fine_data(session)
+    statements = []
+
+    @event.listens_for(session, "do_orm_execute")
+    def compile_select(state):
+        if state.is_select:
+            statements.append(
+                str(state.statement.compile(dialect=postgresql.dialect()))
+            )
+
+    client_fixture.post(
+        "/season/1/schedule_fines",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    locks = [statement for statement in statements if "FOR UPDATE" in statement]
+    assert len(locks) == 2
+    assert "FROM team" in locks[0]
+    assert locks[1].endswith("FOR UPDATE OF userbeer")
+
+
+def test_schedule_fines_concurrent(
+    client_fixture, session, get_admin_token, monkeypatch
+):
+    """
+    Test that a fine linked by a concurrent schedule after the read is not
+    scheduled twice.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    create_fine_data(session)
+
+    def get_open_fines_raced(team_id, fine_session, for_update):
+        fines = get_open_fines(team_id, fine_session, for_update)
+        fine_session.add(BringBeer(event_id=2, user_id=1, user_beer_id=1))
+        return fines
+
+    monkeypatch.setattr(
+        "routes.season.season_routes.get_open_fines", get_open_fines_raced
+    )
+
+    response = client_fixture.post(
+        "/season/1/schedule_fines",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Conflicting fines"
+    assert session.exec(select(func.count(BringBeer.id))).one() == 1
+
+
+def test_schedule_fines_live(client_fixture, session, get_admin_token, monkeypatch):
+    """
+    Test that the scheduled bring beer and the deleted events are published.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    create_fine_data(session)
+    monkeypatch.setattr("routes.live.LIVE_BROKER", RecordingBroker())
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+
+    client_fixture.post("/season/1/schedule_fines", headers=headers)
+
+    messages = get_broker().messages
+    assert [
+        (channel, message["type"], message["bring_beer"]["user_beer_id"])
+        for channel, message in messages
+    ] == [
+        ("event:3", "create", 1),
+        ("event:4", "create", 5),
+        ("event:2", "create", 4),
+        ("event:4", "create", 2),
+        ("event:3", "create", 6),
+        ("event:2", "create", 3),
+    ]
+    assert all(message["bring_beer"]["id"] for _, message in messages)
+
+    messages.clear()
+    client_fixture.delete("/season/1", headers=headers)
+    assert messages == [
+        (f"event:{event_id}", {"type": "event_delete", "id": event_id})
+        for event_id in range(1, 5)
+    ]
+
+
+def test_schedule_fines_without_events(client_fixture, session, get_admin_token):
+    """
+    Test the distribution of open fines without upcoming events.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_fine_data(session)
+    client_fixture.post("/season/add", json={"name": "empty", "team_id": 1})
+
+    response = client_fixture.post(
+        "/season/2/schedule_fines",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["assignments"] == []
+    assert response.json()["unassigned"] == 6
+
+
+def test_schedule_fines_of_other_team(client_fixture, session):
+    """
+    Test the distribution of open fines by a manager of another team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_fine_data(session)
+    token = create_access_token({"user_id": 4, "role": "manager", "team_ids": 2})
+
+    response = client_fixture.post(
+        "/season/1/schedule_fines", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 401
+
+
+def test_schedule_fines_wrong_season(client_fixture, get_admin_token):
+    """
+    Test the distribution of open fines of a not existing season.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    response = client_fixture.post(
+        "/season/1/schedule_fines",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 404
+
+
+def test_update_seasons(client_fixture, session):
+    """
+    Test the update of many seasons.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :return: None
+    """
+    create_fine_data(session)
+    client_fixture.post("/season/add", json={"name": "second", "team_id": 1})
+
+    response = client_fixture.patch(
+        "/season/bulk", json=[{"id": 1, "changes": {"team_id": 2}}]
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": [1]}
+    session.expire_all()
+    assert session.get(Season, 1).team_id == 2
+
+
+def test_delete_season_cascade(client_fixture, session: Session, get_admin_token):
+    """
+    Test that the database deletes the events and bring beer of a deleted season.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_fine_data(session)
+    for event_id in [1, 2, 3, 4]:
+        for user_id in [1, 2, 3]:
+            session.add(BringBeer(event_id=event_id, user_id=user_id))
+    session.commit()
+    rebuild_stats(session)
+    statements = []
+    event.listen(
+        session.get_bind(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+
+    response = client_fixture.delete(
+        "/season/1", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+
+    assert response.status_code == 200
+    assert [sql for sql in statements if sql.startswith("DELETE")] == [
+        "DELETE FROM season WHERE season.id = ?"
+    ]
+    assert session.exec(select(func.count(Event.id))).one() == 0
+    assert session.exec(select(func.count(BringBeer.id))).one() == 0
+    assert session.exec(select(func.count()).select_from(UserSeasonStats)).one() == 0
+    tombstones = session.exec(
+        select(Tombstone.table_name, func.count()).group_by(Tombstone.table_name)
+    ).all()
+    assert sorted(tombstones) == [("bringbeer", 13), ("event", 4)]
@@ -0,0 +1,228 @@
+"""
+Created by Fabian Gnatzig
+Description: Unittests of statistic routes.
+"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, postgresql
+from sqlmodel import Session, select
+
+from models.beer_models import UserBeer
+from models.event_models import Event
+from models.season_models import Season
+from models.stats_models import UserSeasonStats
+from models.team_models import Team
+from routes.stats.stats_routes import add_stats, upsert_stats
+from tests.helper_methods import add_user
+
+
+def create_stats_data(session: Session):
+    """
+    Creates a team with two seasons, an event per season, two users and a user beer.
+    :param session: Test session.
+    :return: None
+    """
+    session.add(Team(name="test_team"))
+    session.add(Season(name="first_season", team_id=1))
+    session.add(Season(name="second_season", team_id=1))
+    session.add(Event(name="first_event", season_id=1, event_date=date(2025, 1, 1)))
+    session.add(Event(name="second_event", season_id=2, event_date=date(2025, 2, 1)))
+    for username in ["a", "b"]:
+        add_user(session, username, last_name=username)
+    session.add(UserBeer(user_id=1, kind="birthday"))
+    session.commit()
+
+
+def read_stats(client, season_id: int, user_id: int) -> tuple:
+    """
+    Reads the statistics of a user in a season.
+    :param client: Test client.
+    :param season_id: ID of the season.
+    :param user_id: ID of the user.
+    :return: Tuple of brought, done and fines.
+    """
+    response = client.get(f"/stats/{season_id}/user/{user_id}")
+    assert response.status_code == 200
+    stats = response.json()
+    return stats["brought"], stats["done"], stats["fines"]
+
+
+def assert_rebuild_matches(client, token: str):
+    """
+    Asserts that a rebuild results in the same statistics as the incremental updates.
+    :param client: Test client.
+    :param token: Admin token.
+    :return: None
+    """
+    before = [client.get(f"/stats/{season_id}").json() for season_id in [1, 2]]
+    response = client.post(
+        "/stats/rebuild", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    after = [client.get(f"/stats/{season_id}").json() for season_id in [1, 2]]
+    assert before == after
+
+
+def test_stats_of_bring_beer(client_fixture, session, get_admin_token):
+    """
+    Test the statistics after creating, completing, moving and deleting bring beer.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_stats_data(session)
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+
+    client_fixture.post("/bringbeer/add", json={"event_id": 1, "user_id": 1})
+    client_fixture.post(
+        "/bringbeer/add", json={"event_id": 1, "user_id": 1, "user_beer_id": 1}
+    )
+    client_fixture.post("/bringbeer/add", json={"event_id": 1})
+    client_fixture.get("/bringbeer/done/1")
+    assert read_stats(client_fixture, 1, 1) == (2, 1, 1)
+
+    client_fixture.patch("/bringbeer/2", json={"event_id": 2})
+    assert read_stats(client_fixture, 1, 1) == (1, 1, 0)
+    assert read_stats(client_fixture, 2, 1) == (1, 0, 1)
+    assert_rebuild_matches(client_fixture, get_admin_token)
+
+    client_fixture.delete("/userbeer/1", headers=headers)
+    assert read_stats(client_fixture, 2, 1) == (1, 0, 0)
+
+    client_fixture.delete("/bringbeer/1", headers=headers)
+    assert read_stats(client_fixture, 1, 1) == (0, 0, 0)
+    assert_rebuild_matches(client_fixture, get_admin_token)
+
+
+def test_stats_of_event(client_fixture, session, get_admin_token):
+    """
+    Test the statistics after moving and deleting an event.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_stats_data(session)
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+
+    client_fixture.post("/bringbeer/add", json={"event_id": 1, "user_id": 1})
+    client_fixture.post("/bringbeer/add", json={"event_id": 1, "user_id": 2})
+    client_fixture.post("/bringbeer/add", json={"event_id": 3, "user_id": 2})
+
+    client_fixture.patch("/event/1", json={"season_id": 2})
+    assert read_stats(client_fixture, 1, 1) == (0, 0, 0)
+    assert read_stats(client_fixture, 2, 2) == (1, 0, 0)
+    assert_rebuild_matches(client_fixture, get_admin_token)
+
+    client_fixture.delete("/event/1", headers=headers)
+    assert client_fixture.get("/stats/2").json() == []
+    assert_rebuild_matches(client_fixture, get_admin_token)
+
+
+def test_stats_of_deleted_season_and_user(client_fixture, session, get_admin_token):
+    """
+    Test that the statistics of deleted seasons and users are removed.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_stats_data(session)
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+
+    client_fixture.post("/bringbeer/add", json={"event_id": 1, "user_id": 1})
+    client_fixture.post("/bringbeer/add", json={"event_id": 2, "user_id": 1})
+    client_fixture.post("/bringbeer/add", json={"event_id": 2, "user_id": 2})
+    client_fixture.get("/bringbeer/done/3")
+
+    assert client_fixture.get("/stats/2/user/2").json()["completion_rate"] == 1.0
+
+    client_fixture.delete("/event/1", headers=headers)
+    client_fixture.delete("/season/1", headers=headers)
+    statement = select(UserSeasonStats).where(UserSeasonStats.season_id == 1)
+    assert not session.exec(statement).all()
+
+    client_fixture.delete("/user/2", headers=headers)
+    assert [stats["user_id"] for stats in client_fixture.get("/stats/2").json()] == [1]
+    assert_rebuild_matches(client_fixture, get_admin_token)
+
+
+def test_rebuild_stats_as_user(client_fixture, get_user_token):
+    """
+    Test that only admins can rebuild the statistics.
+    :param client_fixture: Test client.
+    :param get_user_token: Test user token.
+    :return: None
+    """
+    response = client_fixture.post(
+        "/stats/rebuild", headers={"Authorization": f"Bearer {get_user_token}"}
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid role"
+
+
+def test_read_empty_user_stats(client_fixture):
+    """
+    Test read the statistics of a user without brought beer.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = client_fixture.get("/stats/1/user/1")
+    assert response.status_code == 200
+    assert response.json() == {
+        "season_id": 1,
+        "user_id": 1,
+        "brought": 0,
+        "done": 0,
+        "fines": 0,
+        "completion_rate": 0.0,
+    }
+
+
+def test_add_stats_upsert(session: Session):
+    """
+    Tests that the first and the following deltas of a user are one statement each.
+    :param session: Test session.
+    :return: None
+    """
+    create_stats_data(session)
+    statements = []
+    event.listen(
+        session.get_bind(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+
+    add_stats(session, 1, 1, brought=1, done=0, fines=1)
+    add_stats(session, 1, 1, brought=2, done=1, fines=0)
+
+    writes = [sql for sql in statements if "userseasonstats" in sql]
+    assert len(writes) == 2
+    assert all("ON CONFLICT" in sql for sql in writes)
+    stats = session.get(UserSeasonStats, (1, 1))
+    assert (stats.brought, stats.done, stats.fines) == (3, 1, 1)
+
+
+@pytest.mark.parametrize(
+    "dialect, clause",
+    [
+        (mysql.dialect(), "ON DUPLICATE KEY UPDATE brought = (userseasonstats.brought"),
+        (postgresql.dialect(), "ON CONFLICT (season_id, user_id) DO UPDATE"),
+    ],
+)
+def test_upsert_stats_dialects(dialect, clause):
+    """
+    Tests the upsert of the statistics on MySQL and PostgreSQL.
+    :param dialect: SQL dialect.
+    :param clause: Expected upsert clause.
+    :return: None
+    """
+    values = {"season_id": 1, "user_id": 1, "brought": 1, "done": 0, "fines": 0}
+
+    statement = upsert_stats(dialect.name, values).compile(dialect=dialect)
+
+    assert clause in str(statement)
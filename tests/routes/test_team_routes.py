@@ -3,7 +3,25 @@ Created by Fabian Gnatzig
 Description: Unittests for team routes.
 """
 
-from tests.helper_methods import create_team, create_season, create_user
+from datetime import date, timedelta
+
+from sqlalchemy import event
+from sqlmodel import Session, func, select
+
+from models.beer_models import BringBeer, UserBeer
+from models.event_models import Event
+from models.season_models import Season
+from models.team_models import Team
+from models.sync_models import Tombstone
+from models.user_models import User
+from routes.cache import TeamCache
+from tests.helper_methods import (
+    RecordingBroker,
+    add_user,
+    create_team,
+    create_season,
+    create_user,
+)
 
 
 def test_read_team(client_fixture):
@@ -175,3 +193,361 @@ def test_update_wrong_team(client_fixture):
     response = client_fixture.patch(f"/team/{wrong_id}", json={})
     assert response.status_code == 404
     assert response.json()["detail"] == f"TEAM with id '{wrong_id}' not found!"
+
+
+def create_dashboard_data(session: Session):
+    """
+    Creates two users with events, fines and brought beer in team 1.
+    :param session: Test session.
+    :return: None
+    """
+    today = date.today()
+    session.add(Team(name="test_team"))
+    session.add(Team(name="other_team"))
+    session.add(Season(name="old_season", team_id=1))
+    session.add(Season(name="new_season", team_id=1))
+    session.add(Season(name="other_season", team_id=2))
+    session.add(Event(name="past", season_id=2, event_date=today - timedelta(days=7)))
+    session.add(Event(name="later", season_id=2, event_date=today + timedelta(days=7)))
+    session.add(Event(name="today", season_id=2, event_date=today))
+    session.add(Event(name="other", season_id=3, event_date=today))
+    for username in ["a", "b"]:
+        add_user(session, username, last_name=username)
+    session.add(UserBeer(user_id=1, kind="birthday"))
+    session.add(UserBeer(user_id=2, kind="newspaper"))
+    session.add(BringBeer(event_id=1, user_id=1, user_beer_id=1))
+    session.add(BringBeer(event_id=1, user_id=1))
+    session.commit()
+
+
+def test_read_team_dashboard(client_fixture, session, get_team_user_token):
+    """
+    Test read the dashboard of a team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    create_dashboard_data(session)
+
+    response = client_fixture.get(
+        "/team/1/dashboard", headers={"Authorization": f"Bearer {get_team_user_token}"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["team"]["name"] == "test_team"
+    assert body["current_season"]["name"] == "new_season"
+    assert [event["name"] for event in body["upcoming_events"]] == ["today", "later"]
+    assert body["open_fines"] == [
+        {"user": "first b", "user_id": 2, "user_beer_id": 2, "kind": "newspaper"}
+    ]
+    assert body["leaderboard"] == [
+        {"user": "first b", "user_id": 2, "amount": 0, "included_fine": 1},
+        {"user": "first a", "user_id": 1, "amount": 2, "included_fine": 1},
+    ]
+
+
+def test_read_empty_team_dashboard(client_fixture, get_admin_token):
+    """
+    Test read the dashboard of a team without data.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+
+    response = client_fixture.get(
+        "/team/1/dashboard", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+    assert response.status_code == 200
+    assert response.json()["current_season"] is None
+    assert response.json()["upcoming_events"] == []
+    assert response.json()["leaderboard"] == []
+
+
+def test_read_dashboard_of_other_team(client_fixture, session, get_team_user_token):
+    """
+    Test read the dashboard of another team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    create_dashboard_data(session)
+
+    response = client_fixture.get(
+        "/team/2/dashboard", headers={"Authorization": f"Bearer {get_team_user_token}"}
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid user"
+
+
+def test_read_dashboard_invalid_token(client_fixture, get_invalid_token):
+    """
+    Test read the dashboard with an invalid token.
+    :param client_fixture: Test client.
+    :param get_invalid_token: Test invalid token.
+    :return: None
+    """
+    response = client_fixture.get(
+        "/team/1/dashboard", headers={"Authorization": f"Bearer {get_invalid_token}"}
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid token"
+
+
+def test_read_dashboard_of_wrong_team(client_fixture, get_admin_token):
+    """
+    Test read the dashboard of a not existing team.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    wrong_id = 324234
+
+    response = client_fixture.get(
+        f"/team/{wrong_id}/dashboard",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == f"TEAM with id '{wrong_id}' not found!"
+
+
+def test_read_team_id_with_fieldset(client_fixture, session, get_admin_token):
+    """
+    Test read team by id with sparse fields and without relationships.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_season(client_fixture)
+    create_user(client_fixture, get_admin_token)
+    session.expunge_all()
+
+    statements = []
+
+    def count_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(session.get_bind(), "before_cursor_execute", count_statement)
+    response = client_fixture.get("/team/1?fields=name&include=")
+    event.remove(session.get_bind(), "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200
+    assert response.json() == {"name": "test_team"}
+    assert len(statements) == 1
+    assert "season" not in statements[0]
+
+
+def test_read_team_id_with_include(client_fixture, get_admin_token):
+    """
+    Test read team by id with only the users expanded.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_season(client_fixture)
+    create_user(client_fixture, get_admin_token)
+
+    response = client_fixture.get("/team/1?include=users")
+    assert response.status_code == 200
+    assert "seasons" not in response.json()
+    assert "password" not in response.json()["users"][0]
+
+
+def test_read_teams_with_fieldset(client_fixture):
+    """
+    Test read all teams with sparse fields and expanded seasons.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_season(client_fixture)
+
+    response = client_fixture.get("/team/all?fields=id&include=seasons")
+    assert response.status_code == 200
+    teams = response.json()
+    assert teams[0]["seasons"][0].pop("updated_at")
+    assert teams == [
+        {"id": 1, "seasons": [{"id": 1, "name": "test_season", "team_id": 1}]}
+    ]
+
+
+def test_read_team_with_invalid_fieldset(client_fixture):
+    """
+    Test read team with unknown fields and relationships.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_team(client_fixture)
+
+    response = client_fixture.get("/team/1?fields=unknown")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid fields"
+
+    response = client_fixture.get("/team/1?include=name")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid include"
+
+
+def test_read_next_event(client_fixture, session, get_team_user_token):
+    """
+    Test read the next event of a team with its bring beer.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    create_dashboard_data(session)
+    session.add(BringBeer(event_id=3, user_id=2))
+    session.commit()
+
+    response = client_fixture.get(
+        "/team/1/next_event", headers={"Authorization": f"Bearer {get_team_user_token}"}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["event"]["name"] == "today"
+    assert [bring_beer["user_id"] for bring_beer in body["bring_beer"]] == [2]
+
+
+def test_next_event_cache(client_fixture, session, get_team_user_token):
+    """
+    Test that the next event is cached until an event changes.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    create_dashboard_data(session)
+    headers = {"Authorization": f"Bearer {get_team_user_token}"}
+    client_fixture.get("/team/1/next_event", headers=headers)
+
+    session.add(BringBeer(event_id=3, user_id=2))
+    session.commit()
+    response = client_fixture.get("/team/1/next_event", headers=headers)
+    assert response.json()["bring_beer"] == []
+
+    client_fixture.patch("/event/3", json={"name": "renamed"})
+    response = client_fixture.get("/team/1/next_event", headers=headers)
+    assert response.json()["event"]["name"] == "renamed"
+    assert len(response.json()["bring_beer"]) == 1
+
+
+def test_read_next_event_empty(client_fixture, get_admin_token):
+    """
+    Test read the next event of a team without events.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+
+    response = client_fixture.get(
+        "/team/1/next_event", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"event": None, "bring_beer": []}
+
+
+def test_read_next_event_wrong_team(client_fixture, get_admin_token):
+    """
+    Test read the next event of a not existing team.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    response = client_fixture.get(
+        "/team/1/next_event", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_team_cache_expires():
+    """
+    Test the expiry of the team cache after the time to live and at midnight.
+    :return: None
+    """
+    cache = TeamCache(ttl=30)
+    cache.set(1, {"event": None})
+    assert cache.get(1) == {"event": None}
+
+    cache.entries[1] = (date.today(), cache.entries[1][1] - 31, {"event": None})
+    assert cache.get(1) is None
+
+    cache.set(1, {"event": None})
+    cache.entries[1] = (date.today() - timedelta(days=1), *cache.entries[1][1:])
+    assert cache.get(1) is None
+    assert cache.get(2) is None
+
+
+def test_update_teams(client_fixture):
+    """
+    Test the update of many teams.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_team(client_fixture)
+    payload = [
+        {"id": 1, "changes": {"name": "first"}},
+        {"id": 2, "changes": {"name": "second"}},
+    ]
+
+    response = client_fixture.patch("/team/bulk", json=payload)
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": [1, 2]}
+    assert client_fixture.get("/team/2").json()["name"] == "second"
+
+
+def test_delete_team_cascade(
+    client_fixture, session: Session, get_admin_token, monkeypatch
+):
+    """
+    Test that the database deletes the users and seasons of a deleted team and
+    that the deleted events are published.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    broker = RecordingBroker()
+    monkeypatch.setattr("routes.live.LIVE_BROKER", broker)
+    session.add(Team(name="team"))
+    session.add(Team(name="other"))
+    session.add(Season(name="season", team_id=1))
+    session.add(Event(name="event", season_id=1, event_date=date(2025, 1, 1)))
+    for team_id in [1, 2]:
+        add_user(session, f"user_{team_id}", team_id)
+    session.add(UserBeer(user_id=1, kind="fine"))
+    session.add(UserBeer(user_id=2, kind="fine"))
+    session.add(BringBeer(event_id=1, user_id=2, user_beer_id=2))
+    session.commit()
+
+    response = client_fixture.delete(
+        "/team/1", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+
+    assert response.status_code == 200
+    assert session.exec(select(User.id)).all() == [2]
+    assert session.exec(select(UserBeer.id)).all() == [2]
+    assert session.exec(select(func.count(Season.id))).one() == 0
+    assert session.exec(select(func.count(BringBeer.id))).one() == 0
+    tombstones = session.exec(
+        select(Tombstone.table_name, Tombstone.row_id, Tombstone.team_id)
+    ).all()
+    assert sorted(tombstones) == [
+        ("bringbeer", 1, 1),
+        ("event", 1, 1),
+        ("user", 1, 1),
+        ("userbeer", 1, 1),
+    ]
+    assert broker.messages == [("event:1", {"type": "event_delete", "id": 1})]
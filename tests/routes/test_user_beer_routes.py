@@ -3,7 +3,20 @@ Created by Fabian Gnatzig
 Description: Unittests of user beer routes.
 """
 
-from tests.helper_methods import create_user_beer, create_user, create_bring_beer
+import json
+from datetime import datetime, timezone
+
+import pytest
+from sqlmodel import select, update
+
+from models.beer_models import UserBeer
+from models.sync_models import Tombstone
+from tests.helper_methods import (
+    create_user_beer,
+    create_user,
+    create_bring_beer,
+    create_team_users,
+)
 
 
 def test_read_empty_user_beers(client_fixture):
@@ -17,6 +30,17 @@ def test_read_empty_user_beers(client_fixture):
     assert response.json() == []
 
 
+def test_add_user_beer_of_missing_user(client_fixture):
+    """
+    Test add a user beer of a user, which does not exist.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = create_user_beer(client_fixture)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "USER with id '1' not found!"
+
+
 def test_read_user_beer_id(client_fixture, get_admin_token):
     """
     Test read user_beer by id.
@@ -65,6 +89,26 @@ def test_delete_user_beer(client_fixture, get_admin_token):
     assert response.json()["ok"] is True
 
 
+@pytest.mark.no_foreign_keys
+def test_delete_user_beer_without_user(client_fixture, session, get_admin_token):
+    """
+    Test the deleting of a user beer of a legacy db, whose user does not exist.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    session.add(UserBeer(user_id=99, kind="birthday"))
+    session.commit()
+
+    response = client_fixture.delete(
+        "/userbeer/1", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+    assert response.status_code == 200
+    tombstone = session.exec(select(Tombstone)).one()
+    assert (tombstone.row_id, tombstone.team_id) == (1, None)
+
+
 def test_delete_wrong_user_beer(client_fixture, get_admin_token):  #
     """
     Test the deletion of a user_beer exception.
@@ -131,3 +175,83 @@ def test_update_wrong_user_beer(client_fixture, get_admin_token):
     response = client_fixture.patch(f"/userbeer/{wrong_id}", json={})
     assert response.status_code == 404
     assert response.json()["detail"] == f"USER_BEER with id '{wrong_id}' not found!"
+
+
+def test_export_user_beers(client_fixture, session, get_admin_token):
+    """
+    Test the NDJSON export of all user beers.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_users(session)
+    session.add(UserBeer(user_id=1, kind="birthday"))
+    session.add(UserBeer(user_id=2, kind="newspaper"))
+    session.commit()
+
+    response = client_fixture.get(
+        "/userbeer/export", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert all(row.pop("updated_at") for row in rows)
+    assert rows == [
+        {"id": 1, "user_id": 1, "kind": "birthday"},
+        {"id": 2, "user_id": 2, "kind": "newspaper"},
+    ]
+
+
+def test_export_team_user_beers(client_fixture, session, get_team_user_token):
+    """
+    Test the NDJSON export of the user beers of the own team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :return: None
+    """
+    create_team_users(session)
+    session.add(UserBeer(user_id=2, kind="birthday"))
+    session.add(UserBeer(user_id=1, kind="newspaper"))
+    session.commit()
+
+    response = client_fixture.get(
+        "/userbeer/export", headers={"Authorization": f"Bearer {get_team_user_token}"}
+    )
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [2]
+
+
+def test_read_user_beers_since(
+    client_fixture, session, get_team_user_token, get_admin_token
+):
+    """
+    Test the delta sync of the user beers of the own team.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_team_user_token: Test token of a team user.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_users(session)
+    for user_id in [1, 1, 2]:
+        session.add(UserBeer(user_id=user_id, kind="birthday"))
+    session.commit()
+    session.exec(
+        update(UserBeer).values(updated_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    )
+    session.commit()
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+    client_fixture.patch("/userbeer/1", json={"kind": "newspaper"})
+    client_fixture.delete("/userbeer/2", headers=headers)
+    client_fixture.delete("/userbeer/3", headers=headers)
+
+    response = client_fixture.get(
+        "/userbeer/all",
+        params={"since": "2025-01-01T00:00:00+00:00", "fields": "id,kind"},
+        headers={"Authorization": f"Bearer {get_team_user_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["changed"] == [{"id": 1, "kind": "newspaper"}]
+    assert response.json()["deleted"] == [2]
@@ -3,12 +3,29 @@ Created by Fabian Gnatzig
 Description: Unittests for user routes.
 """
 
+import csv
+import io
+import json
+from datetime import date, datetime, timezone
+
+from sqlmodel import Session, update
+
+from dependencies import pwd_context
+from models.beer_models import BringBeer, UserBeer
+from models.event_models import Event
+from models.season_models import Season
+from models.team_models import Team
+from models.user_models import User
 from tests.helper_methods import (
     create_user,
     create_bring_beer,
     create_beer,
+    create_brewery,
+    create_event,
+    create_season,
     create_team,
     create_user_beer,
+    create_team_users,
 )
 
 
@@ -120,9 +137,12 @@ def test_read_user_name(client_fixture, get_admin_token):
     user_name = "name"
     create_team(client_fixture)
     create_user(client_fixture, get_admin_token)
-    create_bring_beer(client_fixture)
-    create_beer(client_fixture)
     create_user_beer(client_fixture)
+    create_season(client_fixture)
+    create_event(client_fixture)
+    create_brewery(client_fixture)
+    create_beer(client_fixture)
+    create_bring_beer(client_fixture)
 
     response = client_fixture.get(f"/user/name/{user_name}")
     assert response.status_code == 200
@@ -250,3 +270,361 @@ def test_update_wrong_user(client_fixture):
     response = client_fixture.patch(f"/user/{wrong_id}", json={})
     assert response.status_code == 404
     assert response.json()["detail"] == f"USER with id '{wrong_id}' not found!"
+
+
+def test_add_user_with_duplicate_username(client_fixture, get_admin_token):
+    """
+    Test add a user with an already existing username.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_user(client_fixture, get_admin_token)
+
+    response = create_user(client_fixture, get_admin_token)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid username"
+
+
+def test_add_user_without_first_name(client_fixture, get_admin_token):
+    """
+    Test add a user with a missing column, which is not reported as username.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+
+    response = client_fixture.post(
+        "/user/add",
+        json={
+            "username": "name",
+            "last_name": "last",
+            "birthday": "2025-08-21",
+            "team_id": 1,
+            "password": "pswd",
+            "role": "user",
+        },
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Incomplete USER"
+
+
+def test_read_user_id_with_fieldset(client_fixture, get_admin_token):
+    """
+    Test read user by id with sparse fields and only the team expanded.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_user(client_fixture, get_admin_token)
+    create_user_beer(client_fixture)
+
+    response = client_fixture.get(
+        "/user/1?fields=username&include=team",
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+    assert response.status_code == 200
+    user = response.json()
+    assert user["team"].pop("updated_at")
+    assert user == {
+        "username": "name",
+        "team": {"id": 1, "name": "test_team"},
+    }
+
+
+def get_import_row(username: str, **changes) -> dict:
+    """
+    Creates a valid row of a user import.
+    :param username: Username of the row.
+    :param changes: Changed fields of the row.
+    :return: Row of the import.
+    """
+    row = {
+        "username": username,
+        "first_name": "first",
+        "last_name": "last",
+        "birthday": "2000-01-01",
+        "team_id": 1,
+        "password": "pswd",
+        "role": "user",
+    }
+    row.update(changes)
+    return row
+
+
+def test_import_users_from_json(client_fixture, get_admin_token):
+    """
+    Test the import of users from JSON with a per-row error report.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_user(client_fixture, get_admin_token)
+    rows = [
+        get_import_row("a"),
+        get_import_row("b", birthday="01.01.2000"),
+        get_import_row("name"),
+        get_import_row("a"),
+        get_import_row("c", team_id=5),
+        get_import_row("d", team_id="x"),
+        get_import_row("e", password=""),
+        "no user",
+        get_import_row("f", role="admin"),
+    ]
+
+    response = client_fixture.post(
+        "/user/import",
+        files={"file": ("users.json", json.dumps(rows), "application/json")},
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "created": [2, 3],
+        "errors": [
+            {"row": 2, "detail": "Invalid birthday"},
+            {"row": 3, "detail": "Invalid username"},
+            {"row": 4, "detail": "Invalid username"},
+            {"row": 5, "detail": "TEAM with id '5' not found!"},
+            {"row": 6, "detail": "Invalid team_id"},
+            {"row": 7, "detail": "Incomplete USER"},
+            {"row": 8, "detail": "Incomplete USER"},
+        ],
+    }
+
+    response = client_fixture.get(
+        "/user/2", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+    assert response.json()["username"] == "a"
+    assert response.json()["password"] != "pswd"
+
+
+def test_import_users_from_csv(
+    client_fixture, get_admin_token, get_manager_token, monkeypatch
+):
+    """
+    Test the import of users from CSV as manager with parallel password hashing.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :param get_manager_token: Test manager token.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    monkeypatch.setattr("os.cpu_count", lambda: 2)
+    create_team(client_fixture)
+    rows = [
+        get_import_row("a"),
+        get_import_row("b", role="manager"),
+        get_import_row("c", role="admin"),
+    ]
+    file = io.StringIO()
+    writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+    response = client_fixture.post(
+        "/user/import",
+        files={"file": ("users.csv", file.getvalue(), "text/csv")},
+        headers={"Authorization": f"Bearer {get_manager_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "created": [1, 2],
+        "errors": [{"row": 3, "detail": "Invalid role"}],
+    }
+
+    response = client_fixture.post(
+        "/auth/token",
+        data={"username": "b", "password": "pswd"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert response.status_code == 200
+
+
+def test_import_users_invalid_file(client_fixture, get_admin_token):
+    """
+    Test the import of users from an invalid file.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    for content in ["no json", json.dumps({"username": "a"})]:
+        response = client_fixture.post(
+            "/user/import",
+            files={"file": ("users.json", content, "application/json")},
+            headers={"Authorization": f"Bearer {get_admin_token}"},
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid file"
+
+
+def test_import_users_as_user(client_fixture, get_user_token):
+    """
+    Test that users without admin or manager role cannot import users.
+    :param client_fixture: Test client.
+    :param get_user_token: Test user token.
+    :return: None
+    """
+    response = client_fixture.post(
+        "/user/import",
+        files={"file": ("users.json", "[]", "application/json")},
+        headers={"Authorization": f"Bearer {get_user_token}"},
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid role"
+
+
+def test_update_user_password(client_fixture, session: Session, get_admin_token):
+    """
+    Test that the update of a user hashes the password.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_users(session)
+
+    response = client_fixture.patch(
+        "/user/1",
+        json={"password": "new"},
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 200
+    session.expire_all()
+    password = session.get(User, 1).password
+    assert password != "new"
+    assert pwd_context.verify("new", password)
+
+
+def test_update_users(client_fixture, session: Session, get_admin_token):
+    """
+    Test the update of many users with hashed passwords.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_users(session)
+    payload = [
+        {"id": 1, "changes": {"team_id": 2, "password": "new"}},
+        {"id": 2, "changes": {"team_id": 1}},
+    ]
+
+    response = client_fixture.patch(
+        "/user/bulk",
+        json=payload,
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 200
+    session.expire_all()
+    user = session.get(User, 1)
+    assert user.team_id == 2
+    assert pwd_context.verify("new", user.password)
+    assert session.get(User, 2).team_id == 1
+
+
+def test_update_users_duplicate_username(
+    client_fixture, session: Session, get_admin_token
+):
+    """
+    Test that no user is updated if a username is taken.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_users(session)
+    payload = [
+        {"id": 1, "changes": {"first_name": "changed"}},
+        {"id": 2, "changes": {"username": "user_1"}},
+    ]
+
+    response = client_fixture.patch(
+        "/user/bulk",
+        json=payload,
+        headers={"Authorization": f"Bearer {get_admin_token}"},
+    )
+
+    assert response.status_code == 400
+    session.expire_all()
+    assert session.get(User, 1).first_name == "first"
+
+
+def test_update_users_invalid_token(client_fixture, get_user_token):
+    """
+    Test the update of many users without admin role.
+    :param client_fixture: Test client.
+    :param get_user_token: Test user token.
+    :return: None
+    """
+    response = client_fixture.patch(
+        "/user/bulk",
+        json=[{"id": 1, "changes": {"role": "admin"}}],
+        headers={"Authorization": f"Bearer {get_user_token}"},
+    )
+
+    assert response.status_code == 401
+
+
+def test_read_users_since(client_fixture, session: Session, get_admin_token):
+    """
+    Test the delta sync of the users.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team_users(session)
+    session.exec(
+        update(User).values(updated_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    )
+    session.commit()
+    headers = {"Authorization": f"Bearer {get_admin_token}"}
+    client_fixture.patch("/user/1", json={"first_name": "new"}, headers=headers)
+    client_fixture.delete("/user/2", headers=headers)
+
+    response = client_fixture.get(
+        "/user/all",
+        params={"since": "2025-01-01T00:00:00Z", "fields": "id,first_name"},
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    assert response.json()["changed"] == [{"id": 1, "first_name": "new"}]
+    assert response.json()["deleted"] == [2]
+
+
+def test_delete_user_cascade(client_fixture, session: Session, get_admin_token):
+    """
+    Test that the database deletes the user beer and clears the bring beer of a
+    deleted user.
+    :param client_fixture: Test client.
+    :param session: Test session.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    session.add(Team(name="team"))
+    session.add(Team(name="other"))
+    session.add(Season(name="season", team_id=1))
+    session.add(Event(name="event", season_id=1, event_date=date(2025, 1, 1)))
+    session.commit()
+    create_team_users(session)
+    session.add(UserBeer(user_id=1, kind="fine"))
+    session.add(BringBeer(event_id=1, user_id=1, user_beer_id=1))
+    session.commit()
+
+    response = client_fixture.delete(
+        "/user/1", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+
+    assert response.status_code == 200
+    session.expire_all()
+    assert session.get(UserBeer, 1) is None
+    bring_beer = session.get(BringBeer, 1)
+    assert (bring_beer.user_id, bring_beer.user_beer_id) == (None, None)
@@ -3,10 +3,12 @@ Created by Fabian Gnatzig
 Description: Unittest for authentication.
 """
 
+from datetime import datetime, timezone
+
 from fastapi import HTTPException
 
 import pytest
-from sqlmodel import Session
+from sqlmodel import Session, select
 
 from auth.auth_methods import (
     is_user,
@@ -15,8 +17,13 @@ from auth.auth_methods import (
     is_manager,
     is_admin_or_manager,
 )
-from auth.login_routes import authenticate_user
+from auth.login_routes import (
+    authenticate_user,
+    get_credentials,
+    hash_refresh_token,
+)
 from exceptions import InvalidUserException, InvalidTokenException, InvalidRoleException
+from models.token_models import RefreshToken
 from tests.helper_methods import create_user, create_team
 
 
@@ -29,10 +36,26 @@ def test_authenticate_user(session: Session, client_fixture, get_admin_token):
     :return: None
     """
 
+    create_team(client_fixture)
     create_user(client_fixture, get_admin_token)
     user = authenticate_user(session, "name", "pswd")
-    assert user["first_name"] == "first"
-    assert user["role"] == "admin"
+    assert user == {"id": 1, "username": "name", "role": "admin", "team_id": 1}
+
+
+def test_get_credentials(session: Session, client_fixture, get_admin_token):
+    """
+    Test that the credential lookup only reads the login columns.
+    :param session: Test session.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    create_team(client_fixture)
+    create_user(client_fixture, get_admin_token)
+
+    credentials = get_credentials(session, "name")
+    assert credentials._fields == ("id", "password", "role", "team_id")
+    assert get_credentials(session, "ghost") is None
 
 
 def test_authenticate_wrong_password(session: Session, client_fixture, get_admin_token):
@@ -86,6 +109,8 @@ def test_login_success(client_fixture, get_admin_token):
     body = response.json()
     assert "access_token" in body
     assert body["token_type"] == "bearer"
+    assert body["refresh_token"]
+    assert body["expires_in"] == 15 * 60
 
 
 def test_login_invalid_password(client_fixture, get_admin_token):
@@ -123,6 +148,150 @@ def test_login_nonexistent_user(client_fixture):
     assert response.status_code == 404
 
 
+def login(client_fixture, get_admin_token) -> dict:
+    """
+    Creates a user and logs in.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: Token response.
+    """
+    create_team(client_fixture)
+    create_user(client_fixture, get_admin_token)
+
+    response = client_fixture.post(
+        "/auth/token",
+        data={"username": "name", "password": "pswd"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    return response.json()
+
+
+def test_refresh_token(session: Session, client_fixture, get_admin_token):
+    """
+    Tests the renewal of the access token with a refresh token.
+    :param session: Test session.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    tokens = login(client_fixture, get_admin_token)
+
+    response = client_fixture.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["access_token"]
+    assert body["refresh_token"] != tokens["refresh_token"]
+
+    user_response = client_fixture.get(
+        "/user/1", headers={"Authorization": f"Bearer {body['access_token']}"}
+    )
+    assert user_response.status_code == 200
+
+    stored = session.exec(select(RefreshToken.token_hash)).all()
+    assert tokens["refresh_token"] not in stored
+    assert hash_refresh_token(tokens["refresh_token"]) in stored
+
+
+def test_refresh_token_reuse(session: Session, client_fixture, get_admin_token):
+    """
+    Tests that a reused refresh token revokes all refresh tokens of the user.
+    :param session: Test session.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    tokens = login(client_fixture, get_admin_token)
+    renewed = client_fixture.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    ).json()
+
+    response = client_fixture.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 401
+
+    response = client_fixture.post(
+        "/auth/refresh", json={"refresh_token": renewed["refresh_token"]}
+    )
+    assert response.status_code == 401
+    assert all(session.exec(select(RefreshToken.revoked)).all())
+
+
+def test_refresh_token_expired(session: Session, client_fixture, get_admin_token):
+    """
+    Tests the refresh with an expired refresh token.
+    :param session: Test session.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    tokens = login(client_fixture, get_admin_token)
+    refresh_token = session.exec(select(RefreshToken)).one()
+    refresh_token.expires_at = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    session.add(refresh_token)
+    session.commit()
+
+    response = client_fixture.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+
+    assert response.status_code == 401
+
+
+def test_refresh_token_invalid(client_fixture):
+    """
+    Tests the refresh with an unknown refresh token.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = client_fixture.post("/auth/refresh", json={"refresh_token": "wrong"})
+
+    assert response.status_code == 401
+
+
+def test_refresh_token_deleted_user(client_fixture, get_admin_token):
+    """
+    Tests the refresh of a refresh token of a deleted user.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    tokens = login(client_fixture, get_admin_token)
+    client_fixture.delete(
+        "/user/1", headers={"Authorization": f"Bearer {get_admin_token}"}
+    )
+
+    response = client_fixture.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+
+    assert response.status_code == 401
+
+
+def test_revoke_refresh_token(client_fixture, get_admin_token):
+    """
+    Tests the revocation of a refresh token.
+    :param client_fixture: Test client.
+    :param get_admin_token: Test admin token.
+    :return: None
+    """
+    tokens = login(client_fixture, get_admin_token)
+
+    response = client_fixture.post(
+        "/auth/revoke", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+
+    response = client_fixture.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 401
+
+
 def test_auth_is_user(get_user_token):
     """
     Test if the token has user id.
@@ -0,0 +1,57 @@
+"""
+Created by Fabian Gnatzig
+Description: Unittests of the streaming exports.
+"""
+
+import pyarrow
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from models.team_models import Team
+from routes.export import iter_csv, iter_ndjson, iter_parquet
+
+
+@pytest.fixture(name="export_engine")
+def export_engine_fixture(tmp_path):
+    """
+    Fixture for a db with teams, which is not bound to a test session.
+    """
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'export.db'}")
+    SQLModel.metadata.create_all(test_engine)
+    with Session(test_engine) as session:
+        session.add_all([Team(name=f"team_{i}") for i in range(3)])
+        session.commit()
+    yield test_engine
+    test_engine.dispose()
+
+
+SCHEMA = pyarrow.schema([("id", pyarrow.int64()), ("name", pyarrow.string())])
+
+
+@pytest.mark.parametrize(
+    "iter_export",
+    [
+        iter_ndjson,
+        iter_csv,
+        lambda bind, statement: iter_parquet(bind, statement, SCHEMA),
+    ],
+)
+def test_export_releases_connection(export_engine, monkeypatch, iter_export):
+    """
+    Tests that the stream releases its connection at the end and on a disconnect.
+    :param export_engine: Engine of the test db.
+    :param monkeypatch: Monkeypatch fixture.
+    :param iter_export: Stream of an export format.
+    :return: None
+    """
+    monkeypatch.setattr("routes.export.EXPORT_BATCH_SIZE", 1)
+    statement = select(Team.id, Team.name).order_by(Team.id)
+
+    assert len(list(iter_export(export_engine, statement))) >= 3
+    assert export_engine.pool.checkedout() == 0
+
+    stream = iter_export(export_engine, statement)
+    next(stream)
+    assert export_engine.pool.checkedout() == 1
+    stream.close()
+    assert export_engine.pool.checkedout() == 0
@@ -0,0 +1,108 @@
+"""
+Created by Fabian Gnatzig
+Description: Unittests of the query plans of often used statements.
+"""
+
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlmodel import Session, func, select
+
+from models.beer_models import BringBeer, UserBeer
+from models.event_models import Event
+from models.season_models import Season
+from models.sync_models import Tombstone
+from models.user_models import User
+
+STATEMENTS = {
+    "login": (
+        select(User.id, User.password).where(User.username == "name"),
+        "ix_user_username",
+    ),
+    "team users": (select(User).where(User.team_id == 1), "ix_user_team_id"),
+    "team seasons": (select(Season).where(Season.team_id == 1), "ix_season_team_id"),
+    "season events": (
+        select(Event).where(Event.season_id == 1).order_by(Event.event_date),
+        "ix_event_season_id_event_date",
+    ),
+    "team event range": (
+        select(Event)
+        .where(
+            Event.season_id.in_(select(Season.id).where(Season.team_id == 1)),
+            Event.event_date >= date(2025, 1, 1),
+            Event.event_date <= date(2025, 12, 31),
+        )
+        .order_by(Event.event_date, Event.id),
+        "ix_event_season_id_event_date",
+    ),
+    "upcoming events": (
+        select(Event).where(Event.event_date >= date(2025, 1, 1)),
+        "ix_event_event_date",
+    ),
+    "user beer of user": (
+        select(UserBeer).where(UserBeer.user_id == 1),
+        "ix_userbeer_user_id",
+    ),
+    "bring beer of user": (
+        select(BringBeer).where(BringBeer.user_id == 1),
+        "ix_bringbeer_user_id",
+    ),
+    "bring beer of user beer": (
+        select(BringBeer).where(BringBeer.user_beer_id == 1),
+        "ix_bringbeer_user_beer_id",
+    ),
+    "bring beer of beer": (
+        select(BringBeer).where(BringBeer.beer_id == 1),
+        "ix_bringbeer_beer_id",
+    ),
+    "event statistics": (
+        select(BringBeer.user_id, func.count(BringBeer.id))
+        .where(BringBeer.event_id == 1)
+        .group_by(BringBeer.user_id),
+        "ix_bringbeer_event_id_user_id",
+    ),
+    "changed bring beer": (
+        select(BringBeer).where(
+            BringBeer.updated_at >= datetime(2025, 1, 1, tzinfo=timezone.utc)
+        ),
+        "ix_bringbeer_updated_at",
+    ),
+    "deleted bring beer": (
+        select(Tombstone.row_id).where(
+            Tombstone.table_name == "bringbeer",
+            Tombstone.deleted_at >= datetime(2025, 1, 1, tzinfo=timezone.utc),
+        ),
+        "ix_tombstone_table_name_deleted_at",
+    ),
+    "team bring beer": (
+        select(BringBeer).join(User).where(User.team_id == 1),
+        "ix_bringbeer_user_id",
+    ),
+}
+
+
+def get_query_plan(session: Session, statement) -> str:
+    """
+    Reads the SQLite query plan of a statement.
+    :param session: Test session.
+    :param statement: Statement to explain.
+    :return: Details of the query plan.
+    """
+    sql = statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True})
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    return "\n".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize("name", STATEMENTS)
+def test_statement_uses_index(session: Session, name: str):
+    """
+    Tests that an often used statement is using its index.
+    :param session: Test session.
+    :param name: Name of the statement.
+    :return: None
+    """
+    statement, index = STATEMENTS[name]
+
+    plan = get_query_plan(session, statement)
+
+    assert f"INDEX {index}" in plan
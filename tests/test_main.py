@@ -3,37 +3,99 @@ Created by Fabian Gnatzig
 Description: Test main functions.
 """
 
-from sqlmodel import create_engine, inspect, Session
-from dependencies import create_db, get_session, get_json_from_open_ai_response
+import subprocess
+import sys
+import threading
+import time
 
-TABLES = ["beer", "brewery", "bringbeer", "event", "season", "team", "user", "userbeer"]
+import pytest
+from fastapi import Request
+from sqlalchemy import event
+from sqlmodel import SQLModel, create_engine, inspect, select, Session
+from dependencies import (
+    SQLITE_PRAGMAS,
+    create_db,
+    get_session,
+    set_sqlite_pragmas,
+    startup_lock,
+)
+from label_recognition import get_json_from_open_ai_response, get_open_ai_client
+from main import seed_team_and_admin
+from models.team_models import Team
+from models.user_models import User
+from tests.helper_methods import add_user
 
+TABLES = [
+    "beer",
+    "brewery",
+    "bringbeer",
+    "event",
+    "refreshtoken",
+    "season",
+    "team",
+    "user",
+    "userbeer",
+    "userseasonstats",
+]
 
-def test_create_db(monkeypatch):
+
+def test_create_db(monkeypatch, tmp_path):
     """
     Test the creation of a DB.
     :param monkeypatch: Monkeypatch fixture.
+    :param tmp_path: Directory of the test db.
     :return: None
     """
-    test_engine = create_engine("sqlite:///test.db")
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
     monkeypatch.setattr("dependencies.engine", test_engine)
     create_db()
     inspector = inspect(test_engine)
     test_tables = inspector.get_table_names()
 
-    for table in TABLES:
+    for table in TABLES + ["alembic_version"]:
         assert table in test_tables
 
+    SQLModel.metadata.drop_all(test_engine)
+    with test_engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE alembic_version")
+
+
+def test_sqlite_pragmas(tmp_path):
+    """
+    Test the foreign keys and the performance profile of a SQLite connection.
+    :param tmp_path: Directory of the test db.
+    :return: None
+    """
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    event.listen(test_engine, "connect", set_sqlite_pragmas)
+
+    with test_engine.connect() as connection:
+        pragmas = {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ["foreign_keys", *SQLITE_PRAGMAS]
+        }
+    test_engine.dispose()
+
+    assert pragmas == {
+        "foreign_keys": 1,
+        "journal_mode": "wal",
+        "synchronous": 1,
+        "mmap_size": SQLITE_PRAGMAS["mmap_size"],
+        "cache_size": SQLITE_PRAGMAS["cache_size"],
+        "busy_timeout": SQLITE_PRAGMAS["busy_timeout"],
+    }
 
-def test_get_session(monkeypatch):
+
+def test_get_session(monkeypatch, tmp_path):
     """
     Test the creation of a session.
     :param monkeypatch: Monkeypatch fixture.
+    :param tmp_path: Directory of the test db.
     :return: None
     """
-    test_engine = create_engine("sqlite:///test.db")
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
     monkeypatch.setattr("dependencies.engine", test_engine)
-    session_gen = get_session()
+    session_gen = get_session(Request({"type": "http", "method": "GET", "headers": []}))
     test_session = next(session_gen)
 
     assert isinstance(test_session, Session)
@@ -60,3 +122,131 @@ def test_json_from_response():
     response = get_json_from_open_ai_response(data)
     print(response)
     assert response["key"] == "data"
+
+
+def test_open_ai_client_is_lazy():
+    """
+    Test that importing the app does not import the openai package.
+    :return: None
+    """
+    script = "import sys, main; print('openai' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_startup_lock_sqlite(monkeypatch, tmp_path):
+    """
+    Test that the startup lock of a SQLite file is exclusive.
+    :param monkeypatch: Monkeypatch fixture.
+    :param tmp_path: Directory of the test db.
+    :return: None
+    """
+    monkeypatch.setattr(
+        "dependencies.engine", create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    )
+
+    with startup_lock(), pytest.raises(TimeoutError), startup_lock(timeout=0):
+        pass  # pragma: no cover
+
+    with startup_lock(timeout=0):
+        assert (tmp_path / "test.db.lock").exists()
+
+
+def test_startup_lock_sqlite_wait(monkeypatch, tmp_path):
+    """
+    Test that the startup lock of a SQLite file waits for another worker.
+    :param monkeypatch: Monkeypatch fixture.
+    :param tmp_path: Directory of the test db.
+    :return: None
+    """
+    monkeypatch.setattr(
+        "dependencies.engine", create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    )
+    locked = threading.Event()
+    released = []
+
+    def hold_lock():
+        with startup_lock():
+            locked.set()
+            time.sleep(0.2)
+            released.append(time.monotonic())
+
+    worker = threading.Thread(target=hold_lock)
+    worker.start()
+    locked.wait()
+
+    with startup_lock(timeout=5):
+        assert released
+    worker.join()
+
+
+def test_startup_lock_memory(monkeypatch):
+    """
+    Test that an in-memory db is not locked.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    monkeypatch.setattr("dependencies.engine", create_engine("sqlite://"))
+
+    with startup_lock(timeout=0), startup_lock(timeout=0):
+        pass
+
+
+def test_open_ai_client_is_cached():
+    """
+    Test that the OpenAI client is only created once.
+    :return: None
+    """
+    assert get_open_ai_client() is get_open_ai_client()
+
+
+def test_seed_team_and_admin(session: Session):
+    """
+    Test that repeated seeding creates exactly one team and one admin.
+    :param session: Test session.
+    :return: None
+    """
+    with startup_lock():
+        seed_team_and_admin(session.connection())
+        seed_team_and_admin(session.connection())
+
+    assert len(session.exec(select(Team)).all()) == 1
+    admins = session.exec(select(User).where(User.role == "admin")).all()
+    assert [admin.username for admin in admins] == ["admin"]
+
+
+def test_seed_team_lost_race(session: Session, monkeypatch):
+    """
+    Test that seeding rolls back when another worker inserted the team between
+    the check and the commit.
+    :param session: Test session.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    session.add(Team(id=1, name="other"))
+    session.commit()
+    monkeypatch.setattr("main.Session.get", lambda *args, **kwargs: None)
+
+    seed_team_and_admin(session.connection())
+
+    monkeypatch.undo()
+    assert session.exec(select(User)).all() == []
+    assert [team.name for team in session.exec(select(Team))] == ["other"]
+
+
+def test_seed_admin_lost_race(session: Session):
+    """
+    Test that seeding rolls back when another worker inserted the admin first.
+    :param session: Test session.
+    :return: None
+    """
+    session.add(Team(id=1, name="team"))
+    add_user(session, "admin")
+    session.commit()
+
+    seed_team_and_admin(session.connection())
+
+    users = session.exec(select(User)).all()
+    assert [user.role for user in users] == ["user"]
@@ -0,0 +1,196 @@
+"""
+Created by Fabian Gnatzig
+Description: Unittests of the schema migrations.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import sqlalchemy as sa
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlmodel import SQLModel, create_engine, inspect
+
+from dependencies import create_db, file_lock, get_alembic_config
+from migrations.helpers import backfill_in_batches
+
+
+@pytest.fixture(name="migration_engine")
+def migration_engine_fixture(monkeypatch, tmp_path):
+    """
+    Fixture for an empty db used by the migrations.
+    """
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    monkeypatch.setattr("dependencies.engine", test_engine)
+    yield test_engine
+    test_engine.dispose()
+
+
+def get_revision(test_engine) -> str:
+    """
+    Reads the current revision of a db.
+    :param test_engine: Engine of the db.
+    :return: Current revision.
+    """
+    with test_engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def test_migrations_match_models(migration_engine):
+    """
+    Tests that the migrated schema is the schema of the models.
+    :param migration_engine: Engine of the test db.
+    :return: None
+    """
+    create_db()
+
+    with migration_engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        assert compare_metadata(context, SQLModel.metadata) == []
+    assert get_revision(migration_engine) == "0005"
+
+
+def test_downgrade_migrations(migration_engine):
+    """
+    Tests that the migrations can be reverted.
+    :param migration_engine: Engine of the test db.
+    :return: None
+    """
+    create_db()
+
+    with migration_engine.begin() as connection:
+        command.downgrade(get_alembic_config(connection), "base")
+
+    assert inspect(migration_engine).get_table_names() == ["alembic_version"]
+
+
+def test_create_db_up_to_date(migration_engine, monkeypatch):
+    """
+    Tests that an up to date db is not migrated again.
+    :param migration_engine: Engine of the test db.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    create_db()
+
+    upgrades = []
+    monkeypatch.setattr("alembic.command.upgrade", lambda *args: upgrades.append(args))
+    create_db()
+
+    assert not upgrades
+
+    assert get_revision(migration_engine) == "0005"
+
+
+def test_create_db_before_migrations(migration_engine):
+    """
+    Tests the migration of a db created before the migrations.
+    :param migration_engine: Engine of the test db.
+    :return: None
+    """
+    with migration_engine.begin() as connection:
+        command.upgrade(get_alembic_config(connection), "0001")
+        connection.exec_driver_sql("DROP TABLE alembic_version")
+        connection.exec_driver_sql("INSERT INTO team (id, name) VALUES (1, 'team')")
+        connection.exec_driver_sql(
+            "INSERT INTO user (id, username, first_name, last_name, birthday, "
+            "team_id, password, role) VALUES "
+            "(1, 'name', 'first', 'last', '2000-01-01', 1, 'pswd', 'user')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO season (id, name, team_id) VALUES (1, 's', 1)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO event (id, name, season_id, event_date) VALUES (1, 'e', 1, '2025-01-01')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO bringbeer (event_id, user_id, done) VALUES (1, 1, 1), (1, 1, 0)"
+        )
+
+    create_db()
+
+    assert get_revision(migration_engine) == "0005"
+    with migration_engine.connect() as connection:
+        stats = connection.exec_driver_sql("SELECT * FROM userseasonstats").all()
+        unchanged = connection.exec_driver_sql(
+            "SELECT id FROM bringbeer WHERE updated_at IS NULL"
+        ).all()
+    assert stats == [(1, 1, 2, 1, 0)]
+    assert unchanged == []
+
+
+def test_create_db_created_by_models(migration_engine):
+    """
+    Tests the migration of a db, which tables were created from the models.
+    :param migration_engine: Engine of the test db.
+    :return: None
+    """
+    SQLModel.metadata.create_all(migration_engine)
+
+    create_db()
+
+    assert get_revision(migration_engine) == "0005"
+    indexes = inspect(migration_engine).get_indexes("event")
+    assert "ix_event_season_id_event_date" in [index["name"] for index in indexes]
+
+
+def test_backfill_in_batches(migration_engine):
+    """
+    Tests the filling of a column in batches.
+    :param migration_engine: Engine of the test db.
+    :return: None
+    """
+    with migration_engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE filled (id INTEGER PRIMARY KEY, value INTEGER)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO filled (id, value) VALUES (1, NULL), (2, 5), (3, NULL), (7, NULL)"
+        )
+        with Operations.context(MigrationContext.configure(connection)):
+            updated = backfill_in_batches(
+                "filled", "value", sa.literal(1), batch_size=2
+            )
+        rows = connection.exec_driver_sql("SELECT id, value FROM filled").all()
+
+    assert updated == 3
+    assert rows == [(1, 1), (2, 5), (3, 1), (7, 1)]
+
+
+def test_create_db_concurrent_workers(tmp_path):
+    """
+    Tests that two workers, which start at once, migrate a new db only once.
+    :param tmp_path: Directory of the test db.
+    :return: None
+    """
+    database = f"sqlite:///{tmp_path / 'workers.db'}"
+    env = {**os.environ, "DATABASE": database}
+    # Both workers start while the lock is held, so they always wait for it.
+    with file_lock(f"{tmp_path / 'workers.db'}.lock", timeout=0):
+        workers = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-c",
+                    "from dependencies import create_db; create_db()",
+                ],
+                env=env,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            for _ in range(2)
+        ]
+        time.sleep(1)
+        assert [worker.poll() for worker in workers] == [None, None]
+
+    for worker in workers:
+        _, stderr = worker.communicate(timeout=120)
+        assert worker.returncode == 0, stderr
+    test_engine = create_engine(database)
+    assert get_revision(test_engine) == "0005"
+    test_engine.dispose()
@@ -0,0 +1,167 @@
+"""
+Created by Fabian Gnatzig
+Description: Unittests of the rate limits.
+"""
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from auth.login_routes import LOGIN_LIMIT
+from auth.rate_limit import (
+    LocalRateLimitBackend,
+    get_rate_limit_backend,
+    parse_rate,
+)
+from main import app
+from routes.beer.beer_routes import UPLOAD_LIMIT
+
+
+def login(client: TestClient, username: str):
+    """
+    Sends a login with a wrong password.
+    :param client: Test client.
+    :param username: Username of the login.
+    :return: Response of the login.
+    """
+    return client.post(
+        "/auth/token",
+        data={"username": username, "password": "wrong"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+
+
+def test_login_rate_limit_client(client_fixture, monkeypatch):
+    """
+    Tests that the logins of a client are throttled.
+    :param client_fixture: Test client.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    monkeypatch.setattr(LOGIN_LIMIT, "capacity", 2)
+
+    assert [login(client_fixture, name).status_code for name in "abc"] == [
+        401,
+        401,
+        429,
+    ]
+    response = login(client_fixture, "d")
+    assert response.json()["detail"] == "Too many requests"
+    assert int(response.headers["Retry-After"]) >= 1
+
+    response = client_fixture.get("/service/metrics")
+    assert response.status_code == 200
+    assert 'rate_limit_throttled_total{route="login",key="client"} 2' in response.text
+
+
+def test_login_rate_limit_user(client_fixture, monkeypatch):
+    """
+    Tests that the logins of a user are throttled for all clients.
+    :param client_fixture: Test client.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    monkeypatch.setattr(LOGIN_LIMIT, "capacity", 2)
+    clients = [TestClient(app, client=(f"10.0.0.{i}", 5000)) for i in range(3)]
+
+    assert [login(client, "name").status_code for client in clients] == [
+        401,
+        401,
+        429,
+    ]
+    assert login(clients[2], "other").status_code == 401
+    metrics = client_fixture.get("/service/metrics").text
+    assert 'rate_limit_throttled_total{route="login",key="user"} 1' in metrics
+
+
+def test_upload_rate_limit(client_fixture, monkeypatch, get_user_token):
+    """
+    Tests that the uploads are throttled before the OpenAI request.
+    :param client_fixture: Test client.
+    :param monkeypatch: Monkeypatch fixture.
+    :param get_user_token: Test user token.
+    :return: None
+    """
+    monkeypatch.setattr(UPLOAD_LIMIT, "capacity", 1)
+    files = {"image": ("test.png", b"image", "image/png")}
+
+    response = client_fixture.post(
+        "/beer/upload",
+        headers={"Authorization": f"Bearer {get_user_token}"},
+        files=files,
+    )
+    assert response.status_code == 401
+    response = client_fixture.post("/beer/upload", files=files)
+    assert response.status_code == 429
+
+    buckets = get_rate_limit_backend().buckets
+    assert set(buckets) == {"upload:client:testclient", "upload:user:1"}
+
+
+def test_rate_limit_invalid_token(client_fixture):
+    """
+    Tests that an invalid token only limits the client.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    response = client_fixture.post(
+        "/beer/upload",
+        headers={"Authorization": "Bearer invalid"},
+        files={"image": ("test.png", b"image", "image/png")},
+    )
+
+    assert response.status_code == 401
+    assert set(get_rate_limit_backend().buckets) == {"upload:client:testclient"}
+
+
+def test_local_backend_refill(monkeypatch):
+    """
+    Tests the refill of a token bucket and the removal of the full buckets.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    now = [100.0]
+    monkeypatch.setattr("auth.rate_limit.time.monotonic", lambda: now[0])
+    backend = LocalRateLimitBackend(max_buckets=2)
+
+    assert backend.take("a", 0.5, 2) == 0
+    assert backend.take("a", 0.5, 2) == 0
+    assert backend.take("a", 0.5, 2) == 2
+    now[0] += 1
+    assert backend.take("a", 0.5, 2) == 1
+    assert backend.take("b", 0.5, 2) == 0
+
+    now[0] += 4
+    assert backend.take("c", 0.5, 2) == 0
+    assert set(backend.buckets) == {"c"}
+
+
+def test_local_backend_remove_full_own_limits(monkeypatch):
+    """
+    Tests that every bucket is judged with its own rate and capacity.
+    :param monkeypatch: Monkeypatch fixture.
+    :return: None
+    """
+    now = [100.0]
+    monkeypatch.setattr("auth.rate_limit.time.monotonic", lambda: now[0])
+    backend = LocalRateLimitBackend(max_buckets=2)
+
+    backend.take("slow", 1 / 60, 5)
+    backend.take("fast", 10, 100)
+    now[0] += 10
+    backend.take("new", 10, 100)
+
+    assert set(backend.buckets) == {"slow", "new"}
+
+
+def test_parse_rate():
+    """
+    Tests the parsing of the limits.
+    :return: None
+    """
+    assert parse_rate("5/minute") == (5, 60)
+    assert parse_rate("100/ hour") == (100, 3600)
+    for limit in ["5", "five/second", "5/day"]:
+        with pytest.raises(HTTPException) as ex:
+            parse_rate(limit)
+        assert ex.value.detail == "Invalid rate limit"
@@ -0,0 +1,190 @@
+"""
+Created by Fabian Gnatzig
+Description: Unittests of the routing of the sessions to the read replica.
+"""
+
+import shutil
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel, Session, create_engine
+
+from dependencies import READ_PRIMARY, READ_PRIMARY_HEADER
+from main import app
+from models.beer_models import Beer, BringBeer, UserBeer
+from models.brewery_models import Brewery
+from models.user_models import User
+
+DATA = Path(__file__).resolve().parent.parent / "data"
+PRIMARY = "primary.db"
+REPLICA = "replica.db"
+
+
+@pytest.fixture(name="primary_engine")
+def primary_engine_fixture(monkeypatch, tmp_path):
+    """
+    Fixture for a primary and a replica db in two SQLite files.
+    """
+    monkeypatch.chdir(tmp_path)
+    primary_engine = create_engine(f"sqlite:///{PRIMARY}")
+    replica_engine = create_engine(f"sqlite:///{REPLICA}")
+    SQLModel.metadata.create_all(primary_engine)
+    SQLModel.metadata.create_all(replica_engine)
+    monkeypatch.setattr("dependencies.engine", primary_engine)
+    monkeypatch.setattr("dependencies.replica_engine", replica_engine)
+    yield primary_engine
+    primary_engine.dispose()
+    replica_engine.dispose()
+
+
+def sync():
+    """
+    Copies the primary into the replica like the replication of the database.
+    :return: None
+    """
+    source = sqlite3.connect(PRIMARY)
+    target = sqlite3.connect(REPLICA)
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+def get_names(client: TestClient, **kwargs) -> list[str]:
+    """
+    Reads the names of all breweries.
+    :param client: Test client.
+    :param kwargs: Arguments of the request.
+    :return: Names of the breweries.
+    """
+    response = client.get("/brewery/all", **kwargs)
+    assert response.status_code == 200
+    return [brewery["name"] for brewery in response.json()]
+
+
+def create_brewery(client: TestClient):
+    """
+    Creates a brewery on the primary.
+    :param client: Test client.
+    :return: None
+    """
+    response = client.post(
+        "/brewery/add", json={"name": "brewery", "city": "city", "country": "country"}
+    )
+    assert response.status_code == 200
+
+
+def test_read_from_replica(primary_engine):
+    """
+    Tests that the reads without override go to the replica.
+    :param primary_engine: Engine of the primary db.
+    :return: None
+    """
+    client = TestClient(app)
+    create_brewery(client)
+    client.cookies.clear()
+
+    assert get_names(client) == []
+
+    sync()
+    assert get_names(client) == ["brewery"]
+
+
+def test_read_your_writes_cookie(primary_engine):
+    """
+    Tests that a client reads its writes from the primary.
+    :param primary_engine: Engine of the primary db.
+    :return: None
+    """
+    client = TestClient(app)
+    create_brewery(client)
+
+    assert READ_PRIMARY in client.cookies
+    assert get_names(client) == ["brewery"]
+
+
+def test_read_primary_header(primary_engine):
+    """
+    Tests that the header sends a read to the primary.
+    :param primary_engine: Engine of the primary db.
+    :return: None
+    """
+    client = TestClient(app)
+    create_brewery(client)
+    client.cookies.clear()
+
+    assert get_names(client, headers={READ_PRIMARY_HEADER: "1"}) == ["brewery"]
+
+
+def test_read_without_replica(client_fixture):
+    """
+    Tests that no cookie is set without replica.
+    :param client_fixture: Test client.
+    :return: None
+    """
+    create_brewery(client_fixture)
+
+    assert READ_PRIMARY not in client_fixture.cookies
+
+
+def test_read_that_writes_on_primary(primary_engine):
+    """
+    Tests that the deprecated read, which sets a bring beer done, uses the primary.
+    :param primary_engine: Engine of the primary db.
+    :return: None
+    """
+    with Session(primary_engine) as session:
+        session.add(BringBeer(id=1, event_id=1, user_id=1, done=False))
+        session.commit()
+
+    response = TestClient(app).get("/bringbeer/done/1")
+    assert response.status_code == 200
+
+    with Session(primary_engine) as session:
+        assert session.get(BringBeer, 1).done
+
+
+def test_check_birthday_on_primary(primary_engine):
+    """
+    Tests that the birthday check, which creates user beer, uses the primary.
+    :param primary_engine: Engine of the primary db.
+    :return: None
+    """
+    with Session(primary_engine) as session:
+        session.add(
+            User(
+                username="name",
+                first_name="first",
+                last_name="last",
+                birthday=date.today().replace(year=2000),
+                team_id=1,
+                password="pswd",
+                role="user",
+            )
+        )
+        session.commit()
+
+    response = TestClient(app).get("/service/check_birthday")
+    assert response.status_code == 200
+
+    with Session(primary_engine) as session:
+        assert session.get(UserBeer, 1).kind == "birthday"
+
+
+def test_setup_on_primary(primary_engine, tmp_path):
+    """
+    Tests that the setup, which creates breweries and beer, uses the primary.
+    :param primary_engine: Engine of the primary db.
+    :param tmp_path: Directory of the dbs.
+    :return: None
+    """
+    shutil.copytree(DATA, tmp_path / "data")
+
+    response = TestClient(app).get("/service/setup")
+    assert response.status_code == 200
+
+    with Session(primary_engine) as session:
+        assert session.get(Brewery, 1) is not None
+        assert session.get(Beer, 1) is not None